@@ -1,2 +1,4 @@
 # -*- coding:utf-8 -*-
-from .redis import Redis, start_client
+from .redis import Redis, Pipeline, start_client
+from .connection import Connection, ConnectionPool
+from .async_redis import AsyncRedis, AsyncPipeline, AsyncConnectionPool
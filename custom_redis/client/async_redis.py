@@ -0,0 +1,259 @@
+# -*- coding:utf-8 -*-
+"""
+基于asyncio streams的异步客户端
+每个连接上的指令直接写入，不等待之前指令的响应，响应按顺序唤醒等待的future，
+所以一个连接可以同时有大量未完成的指令
+"""
+import asyncio
+
+from collections import deque
+
+from ..protocol import HELLO
+from .errors import RedisError
+from .connection import Connection, parse_response
+from .commands import CommandsMixin, handle_response
+
+
+class AsyncConnection(object):
+    chunk_size = 64 * 1024
+
+    def __init__(self, host="localhost", port=6379, timeout=30, binary=True):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.binary = binary
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+        # 等待响应的future，按指令发送的顺序排列
+        self.waiters = deque()
+        self.closed = True
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        if self.binary and not await self._negotiate():
+            self.writer.close()
+            self.binary = False
+            return await self.connect()
+        self.closed = False
+        self.read_task = asyncio.ensure_future(self._read_responses())
+
+    async def _negotiate(self):
+        """发送握手报文，服务端回复相同报文表示支持二进制协议"""
+        try:
+            self.writer.write(HELLO)
+            return await asyncio.wait_for(
+                self.reader.readexactly(len(HELLO)), self.timeout) == HELLO
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, OSError):
+            return False
+
+    @property
+    def pending(self):
+        return len(self.waiters)
+
+    # 与同步连接使用相同的报文格式
+    pack = Connection.pack
+
+    async def execute(self, *commands):
+        """
+        一次写入多个(cmd, key, val)，返回所有响应
+        """
+        if self.closed:
+            raise RedisError("connection closed")
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in commands]
+        self.waiters.extend(futures)
+        self.writer.write(b"".join(
+            self.pack(cmd, key, val) for cmd, key, val in commands))
+        await self.writer.drain()
+        return await asyncio.wait_for(asyncio.gather(*futures), self.timeout)
+
+    async def _read_responses(self):
+        buf = bytearray()
+        pos = 0
+        try:
+            while True:
+                chunk = await self.reader.read(self.chunk_size)
+                if not chunk:
+                    raise RedisError("connection closed by server")
+                buf += chunk
+                while self.waiters:
+                    response, size = parse_response(buf, self.binary, pos)
+                    if response is None:
+                        pos = size
+                        break
+                    del buf[:size]
+                    pos = 0
+                    future = self.waiters.popleft()
+                    # 超时被取消的future直接丢弃其响应
+                    if not future.done():
+                        future.set_result(response)
+        except asyncio.CancelledError:
+            self._fail(RedisError("connection closed"))
+        except Exception as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        self.closed = True
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_exception(error)
+        if self.writer:
+            self.writer.close()
+
+    async def close(self):
+        if self.read_task:
+            self.read_task.cancel()
+            try:
+                await self.read_task
+            except asyncio.CancelledError:
+                pass
+        self._fail(RedisError("connection closed"))
+
+
+class AsyncConnectionPool(object):
+    """
+    异步连接池，连接在协程之间共享，每次选择未完成指令最少的连接，
+    所有连接都有未完成的指令且数量未达到max_connections时新建连接
+    """
+    def __init__(self, host="localhost", port=6379, timeout=30, binary=True,
+                 max_connections=4):
+        self.connection_kwargs = {
+            "host": host, "port": port, "timeout": timeout, "binary": binary}
+        self.max_connections = max_connections
+        self.connections = []
+        self._lock = None
+
+    async def get_connection(self):
+        self.connections = [c for c in self.connections if not c.closed]
+        conn = min(self.connections, key=lambda c: c.pending, default=None)
+        if conn and (not conn.pending or
+                     len(self.connections) >= self.max_connections):
+            return conn
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if len(self.connections) >= self.max_connections:
+                return min(self.connections, key=lambda c: c.pending)
+            conn = AsyncConnection(**self.connection_kwargs)
+            await conn.connect()
+            # 服务端不支持二进制协议时，之后的连接直接使用旧协议
+            self.connection_kwargs["binary"] = conn.binary
+            self.connections.append(conn)
+            return conn
+
+    async def disconnect(self):
+        connections, self.connections = self.connections, []
+        for conn in connections:
+            await conn.close()
+
+
+class AsyncRedis(CommandsMixin):
+    """
+    异步客户端，指令配置与Redis相同，均来自CMD_DICT
+    r = AsyncRedis("127.0.0.1", 6379)
+    await r.rpush("a", 1)
+    """
+    def __init__(self, host="localhost", port=6379, timeout=30, binary=True,
+                 connection_pool=None, max_connections=4):
+        self.connection_pool = connection_pool or AsyncConnectionPool(
+            host, port, timeout, binary, max_connections)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def pipeline(self, raise_on_error=True):
+        return AsyncPipeline(self.connection_pool, raise_on_error)
+
+    async def _parse_result(self, cmd, key, val, properties={}):
+        # 所有指令方法都返回这里的协程，AsyncPipeline重写它改为缓存指令
+        conn = await self.connection_pool.get_connection()
+        response, = await conn.execute((cmd, key, val))
+        return handle_response(response, properties)
+
+    async def scan_iter(self, match=None, count=None, _type=None):
+        cursor = None
+        while cursor != 0:
+            cursor, keys = await self.scan(cursor or 0, match, count, _type)
+            for key in keys:
+                yield key
+
+    async def hscan_iter(self, name, match=None, count=None):
+        cursor = None
+        while cursor != 0:
+            cursor, data = await self.hscan(name, cursor or 0, match, count)
+            for item in data.items():
+                yield item
+
+    async def sscan_iter(self, name, match=None, count=None):
+        cursor = None
+        while cursor != 0:
+            cursor, members = await self.sscan(
+                name, cursor or 0, match, count)
+            for member in members:
+                yield member
+
+    async def zscan_iter(self, name, match=None, count=None):
+        cursor = None
+        while cursor != 0:
+            cursor, members = await self.zscan(
+                name, cursor or 0, match, count)
+            for member in members:
+                yield member
+
+    async def close(self):
+        await self.connection_pool.disconnect()
+
+
+class AsyncPipeline(AsyncRedis):
+    """
+    缓存多个指令，execute时一次写入
+    async with r.pipeline() as pipe:
+        pipe.rpush("a", 1)
+        pipe.llen("a")
+        results = await pipe.execute()
+    """
+    def __init__(self, connection_pool, raise_on_error=True):
+        self.connection_pool = connection_pool
+        self.raise_on_error = raise_on_error
+        self.command_stack = []
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.reset()
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def reset(self):
+        self.command_stack = []
+
+    def _parse_result(self, cmd, key, val, properties={}):
+        self.command_stack.append((cmd, key, val, properties))
+        return self
+
+    async def execute(self, raise_on_error=None):
+        stack, self.command_stack = self.command_stack, []
+        if not stack:
+            return []
+        if raise_on_error is None:
+            raise_on_error = self.raise_on_error
+        conn = await self.connection_pool.get_connection()
+        responses = await conn.execute(
+            *[(cmd, key, val) for cmd, key, val, _ in stack])
+        results = []
+        for response, (_, _, _, properties) in zip(responses, stack):
+            try:
+                results.append(handle_response(response, properties))
+            except RedisError as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        return results
+
+    async def close(self):
+        self.reset()
@@ -0,0 +1,160 @@
+# -*- coding:utf-8 -*-
+"""
+同步与异步客户端共用的指令：按CMD_DICT生成请求，及不能由CMD_DICT描述的特殊指令，
+所有指令最终都调用_parse_result(cmd, key, val, properties)，由客户端实现
+"""
+import pickle
+
+from functools import partial
+
+from .functions import CMD_DICT
+from .errors import RedisArgumentError, RedisError
+from .utils import SafeList, handle_safely, default_recv, default_send, \
+    cursor_recv, info_recv, slowlog_recv
+
+
+def build_request(func_name, args, kwargs):
+    """
+    根据CMD_DICT中的配置，将调用参数转换成(cmd, key, val, properties)，
+    cmd为发送的指令名，默认与方法名相同
+    """
+    properties = CMD_DICT[func_name]
+    defaults = properties.get("default", [])
+    position = 0
+    default_position = 0
+    arguments = []
+    for arg in properties["args"]:
+        kwarg = kwargs.pop(arg, None)
+        if kwarg is None:
+            if position < len(args):
+                kwarg = args[position]
+                position += 1
+            if kwarg is None:
+                if default_position >= len(defaults):
+                    raise argument_error(func_name, properties)
+                kwarg = defaults[default_position]
+                default_position += 1
+        arguments.append(kwarg)
+    arguments.extend(args[position:])
+    key, val = properties.get("send", default_send)(*arguments)
+    return properties.get("cmd", func_name), key, val, properties
+
+
+def argument_error(func_name, properties):
+    sub = ""
+    args = properties.get("args")
+    default_args = SafeList(properties.get("default", []))
+    error_msg = "%%s haven't got enough arguments, " \
+                "need %s argument%s named %%s. " % (
+        len(args), "" if len(args) == 1 else "s")
+    for arg in reversed(args):
+        sub = "%s%s" % (arg, (": default %s, " % default_args.pop(-1)
+                              if default_args else ", ")) + sub
+    return RedisArgumentError(error_msg%(func_name, sub[:-2]))
+
+
+def handle_response(response, properties):
+    code, info, data = response
+    if code == b"200":
+        return handle_safely(
+            properties.get("recv", default_recv))(data)
+    elif code == b"502":
+        return properties.get("result", data)
+    else:
+        raise RedisError(b"%s:%s, data: %s"%(code, info, data))
+
+
+class CommandsMixin(object):
+    """
+    Redis、AsyncRedis及其pipeline共用的指令方法，
+    AsyncRedis的_parse_result返回协程，pipeline的_parse_result缓存指令并返回自身
+    """
+    def __getattr__(self, name):
+        if name not in CMD_DICT:
+            raise AttributeError(name)
+        func = partial(self._execute_cmd, name)
+        # 缓存起来，之后不再经过__getattr__
+        self.__dict__[name] = func
+        return func
+
+    def _execute_cmd(self, func_name, *args, **kwargs):
+        return self._parse_result(*build_request(func_name, args, kwargs))
+
+    def keys(self, pattern="*", *args):
+        return self._parse_result(
+            "keys", pattern, b"", {"recv": pickle.loads})
+
+    def type(self, key, *args):
+        return self._parse_result("type", key, b"")
+
+    def scan(self, cursor=0, match=None, count=None, _type=None):
+        """:return: (下一个cursor, key列表)，cursor为0表示遍历结束"""
+        return self._parse_result(
+            "scan", b"%d" % cursor, pickle.dumps([match, count, _type]),
+            {"recv": cursor_recv()})
+
+    def hscan(self, name, cursor=0, match=None, count=None):
+        """:return: (下一个cursor, {field: value})"""
+        return self._parse_result(
+            "hscan", name, pickle.dumps([cursor, match, count]),
+            {"recv": cursor_recv(dict), "result": (0, {})})
+
+    def sscan(self, name, cursor=0, match=None, count=None):
+        return self._parse_result(
+            "sscan", name, pickle.dumps([cursor, match, count]),
+            {"recv": cursor_recv(), "result": (0, [])})
+
+    def zscan(self, name, cursor=0, match=None, count=None):
+        """:return: (下一个cursor, [(成员, 分数)])"""
+        return self._parse_result(
+            "zscan", name, pickle.dumps([cursor, match, count]),
+            {"recv": cursor_recv(), "result": (0, [])})
+
+    def delete(self, key, *keys):
+        """可以同时删除多个key，返回删除的key数"""
+        return self._parse_result(
+            "delete", key, pickle.dumps(keys) if keys else b"", {"recv": int})
+
+    def expire(self, key, seconds, *args):
+        return self._parse_result("expire", key, seconds)
+
+    def ttl(self, key, *args):
+        return self._parse_result("ttl", key, b"", {"recv": int})
+
+    def pexpire(self, key, milliseconds, *args):
+        return self._parse_result("pexpire", key, milliseconds)
+
+    def pttl(self, key, *args):
+        return self._parse_result("pttl", key, b"", {"recv": int})
+
+    def flushall(self, *args):
+        return self._parse_result("flushall", b"", b"")
+
+    def save(self, *args):
+        return self._parse_result("save", b"", b"")
+
+    def bgsave(self, *args):
+        return self._parse_result("bgsave", b"", b"")
+
+    def lastsave(self, *args):
+        return self._parse_result("lastsave", b"", b"", {"recv": int})
+
+    def info(self, *sections):
+        """:return: {字段: 值}，不指定section时返回默认的section"""
+        return self._parse_result(
+            "info", b"", pickle.dumps(sections), {"recv": info_recv})
+
+    def config_resetstat(self):
+        return self._parse_result("config", b"resetstat", b"")
+
+    def slowlog_get(self, num=None):
+        """:return: 最新的num条慢指令记录，默认10条，负数返回全部"""
+        return self._parse_result(
+            "slowlog", b"get", b"" if num is None else num,
+            {"recv": slowlog_recv})
+
+    def slowlog_len(self):
+        return self._parse_result("slowlog", b"len", b"", {"recv": int})
+
+    def slowlog_reset(self):
+        return self._parse_result("slowlog", b"reset", b"")
@@ -0,0 +1,171 @@
+# -*- coding:utf-8 -*-
+"""客户端连接及线程安全的连接池"""
+import os
+import threading
+
+from socket import socket
+
+from ..protocol import HELLO, RESPONSE_HEADER, pack_request, to_bytes
+from .errors import RedisError
+from .utils import escape, unescape
+
+FORMAT = b"%s#-*-#%s#-*-#1"
+
+
+def parse_response(buf, binary, start=0):
+    """
+    从buf的开头解析一个完整的响应
+    :return: ((code, info, data), 消耗的字节数)，
+    数据不完整时返回(None, 下次开始扫描的位置)
+    """
+    if binary:
+        if len(buf) < RESPONSE_HEADER.size:
+            return None, 0
+        code, info_len, data_len = RESPONSE_HEADER.unpack_from(buf)
+        end = RESPONSE_HEADER.size + info_len + data_len
+        if len(buf) < end:
+            return None, 0
+        info = bytes(buf[RESPONSE_HEADER.size: end - data_len])
+        return (b"%d" % code, info, bytes(buf[end - data_len: end])), end
+    # 数据中的\r\n\r\n已被服务端转义，第一个\r\n\r\n就是响应的结尾
+    end = buf.find(b"\r\n\r\n", start)
+    if end < 0:
+        return None, max(0, len(buf) - 3)
+    code, info, data = bytes(buf[:end]).split(b"#-*-#")
+    return (code, info, unescape(data)), end + 4
+
+
+class Connection(object):
+    """到服务端的一个连接，带有读缓冲区，可以连续读取多个响应"""
+    chunk_size = 64 * 1024
+
+    def __init__(self, host="localhost", port=6379, timeout=30, binary=True):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        # 是否尝试使用二进制协议，服务端不支持时自动回退到旧协议
+        self.binary = binary
+        self.pid = os.getpid()
+        self.sock = None
+        self.buffer = bytearray()
+        self.connect()
+
+    def connect(self):
+        self.disconnect()
+        self.sock = socket()
+        self.sock.connect((self.host, self.port))
+        self.sock.settimeout(self.timeout)
+        if self.binary and not self._negotiate():
+            self.binary = False
+            self.connect()
+
+    def _negotiate(self):
+        """发送握手报文，服务端回复相同报文表示支持二进制协议"""
+        try:
+            self.sock.sendall(HELLO)
+            return self.read_exactly(len(HELLO)) == HELLO
+        except (RedisError, OSError):
+            return False
+
+    def disconnect(self):
+        self.buffer = bytearray()
+        if self.sock:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+        self.sock = None
+
+    def pack(self, cmd, key, val):
+        if self.binary:
+            return pack_request(to_bytes(cmd), to_bytes(key), to_bytes(val))
+        return FORMAT % (to_bytes(cmd), b"%s<->%s" % escape((key, val)))
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def _fill(self):
+        chunk = self.sock.recv(self.chunk_size)
+        if not chunk:
+            raise RedisError("connection closed by server")
+        self.buffer += chunk
+
+    def read_exactly(self, size):
+        while len(self.buffer) < size:
+            self._fill()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_response(self):
+        """读取一个响应，返回(code, info, data)"""
+        pos = 0
+        while True:
+            response, size = parse_response(self.buffer, self.binary, pos)
+            if response is not None:
+                del self.buffer[:size]
+                return response
+            pos = size
+            self._fill()
+
+
+class ConnectionPool(object):
+    """
+    线程安全的连接池，空闲连接后进先出，
+    达到max_connections时等待其它线程释放连接，fork之后自动重置
+    """
+    def __init__(self, host="localhost", port=6379, timeout=30, binary=True,
+                 max_connections=None):
+        self.connection_kwargs = {
+            "host": host, "port": port, "timeout": timeout, "binary": binary}
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._condition = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self._idle = []
+        self._created = 0
+
+    def get_connection(self):
+        if self.pid != os.getpid():
+            with self._condition:
+                if self.pid != os.getpid():
+                    self.reset()
+        with self._condition:
+            while not self._idle and self.max_connections and \
+                    self._created >= self.max_connections:
+                if not self._condition.wait(self.timeout):
+                    raise RedisError("connection pool exhausted")
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            conn = Connection(**self.connection_kwargs)
+        except Exception:
+            with self._condition:
+                self._created -= 1
+                self._condition.notify()
+            raise
+        # 服务端不支持二进制协议时，之后的连接直接使用旧协议
+        self.connection_kwargs["binary"] = conn.binary
+        return conn
+
+    def release(self, conn):
+        if conn.pid != os.getpid():
+            return
+        with self._condition:
+            if conn.sock is None:
+                # 出错时已经断开的连接不再复用
+                self._created -= 1
+            else:
+                self._idle.append(conn)
+            self._condition.notify()
+
+    def disconnect(self):
+        with self._condition:
+            for conn in self._idle:
+                conn.disconnect()
+            self._created -= len(self._idle)
+            self._idle = []
@@ -10,6 +10,15 @@ CMD_DICT = {
     "get": {
         "args": ["name",],
     },
+    "mget": {
+        "args": ["keys"],
+        "send": lambda *args: (b"", safe_dumps(args)),
+        "recv": lambda data: safe_loads(data),
+    },
+    "mset": {
+        "args": ["mapping"],
+        "send": lambda *args: (b"", safe_dumps(args[0])),
+    },
     "hget": {
         "args": ["name", "key"],
         "send": lambda *args: (args[0], args[1]),
@@ -38,7 +47,10 @@ CMD_DICT = {
     },
     "zadd": {
         "args": ["name", "value", "score"],
-        "send": lambda *args: (args[0], safe_dumps(dict([reversed(args[1:])]))),
+        # zadd(name, value1, score1, value2, score2...)
+        "send": lambda *args: (args[0], safe_dumps(
+            [item for i in range(1, len(args), 2)
+             for item in (args[i + 1], args[i])])),
     },
     "zpop": {
         "args": ["name", "withscore"],
@@ -52,13 +64,112 @@ CMD_DICT = {
         "recv": lambda x:int(x),
         "result": 0
     },
+    "zpopmin": {
+        "args": ["name", "count"],
+        "send": lambda *args: (args[0], args[1]),
+        "recv": lambda data: safe_loads(data),
+        "default": [1]
+    },
+    "zpopmax": {
+        "args": ["name", "count"],
+        "send": lambda *args: (args[0], args[1]),
+        "recv": lambda data: safe_loads(data),
+        "default": [1]
+    },
+    "zrem": {
+        "args": ["name", "value"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+        "recv": lambda x: int(x),
+        "result": 0
+    },
+    "zscore": {
+        "args": ["name", "value"],
+        "send": lambda *args: (args[0], args[1]),
+        "recv": lambda x: float(x),
+        "result": None
+    },
+    "zrank": {
+        "args": ["name", "value"],
+        "send": lambda *args: (args[0], args[1]),
+        "recv": lambda x: int(x),
+        "result": None
+    },
+    "zrevrank": {
+        "args": ["name", "value"],
+        "send": lambda *args: (args[0], args[1]),
+        "recv": lambda x: int(x),
+        "result": None
+    },
+    "zcount": {
+        "args": ["name", "min", "max"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+        "recv": lambda x: int(x),
+        "result": 0
+    },
+    "zincrby": {
+        "args": ["name", "value", "amount"],
+        "send": lambda *args: (args[0], safe_dumps([args[2], args[1]])),
+        "recv": lambda x: float(x),
+        "default": [1]
+    },
+    # 之后的参数依次为withscores，zrangebyscore还可以再传入offset, count
+    "zrange": {
+        "args": ["name", "start", "end"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+        "recv": lambda data: safe_loads(data),
+    },
+    "zrevrange": {
+        "args": ["name", "start", "end"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+        "recv": lambda data: safe_loads(data),
+    },
+    "zrangebyscore": {
+        "args": ["name", "min", "max"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+        "recv": lambda data: safe_loads(data),
+    },
+    "zrevrangebyscore": {
+        "args": ["name", "max", "min"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+        "recv": lambda data: safe_loads(data),
+    },
     "lpop": {
         "args": ["name"],
     },
+    "rpop": {
+        "args": ["name"],
+    },
+    "lpush": {
+        # 多值的请求使用单独的指令
+        "cmd": "mlpush",
+        "args": ["name", "value"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+    },
     "rpush": {
+        # 多值的请求使用单独的指令
+        "cmd": "mrpush",
         "args": ["name", "value"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+    },
+    "lrange": {
+        "args": ["name", "start", "end"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+        "recv": lambda data: safe_loads(data),
+    },
+    "lindex": {
+        "args": ["name", "index"],
         "send": lambda *args: (args[0], args[1]),
     },
+    "ltrim": {
+        "args": ["name", "start", "end"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+    },
+    "lrem": {
+        "args": ["name", "count", "value"],
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
+        "recv": lambda x: int(x),
+        "result": 0
+    },
     "llen": {
         "args": ["name"],
         "recv": lambda x: int(x),
@@ -70,8 +181,10 @@ CMD_DICT = {
         "result": 0
     },
     "sadd": {
+        # 多值的请求使用单独的指令
+        "cmd": "msadd",
         "args": ["name", "value"],
-        "send": lambda *args: (args[0], args[1]),
+        "send": lambda *args: (args[0], safe_dumps(args[1:])),
     },
     "srem": {
         "args": ["name", "values"],
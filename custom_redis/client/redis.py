@@ -1,133 +1,147 @@
 # -*- coding:utf-8 -*-
 """redis_client"""
 import json
-import pickle
-import time
 import errno
 import argparse
 
-from copy import deepcopy
-from socket import socket
+from .connection import ConnectionPool, FORMAT
+from .errors import RedisError
+from .commands import CommandsMixin, handle_response
 
-from .functions import CMD_DICT
-from .errors import RedisArgumentError, RedisError
-from .utils import SafeList, func_name_wrapper, handle_safely,\
-    default_recv, default_send, escape, unescape
 
-FORMAT = b"%s#-*-#%s#-*-#1"
-
-
-class Redis(object):
-
-    def __init__(self, host="localhost", port=6379, timeout=30):
-        self.host = host
-        self.port = port
-        self.timeout = timeout
-        self.redis_conn = None
+class Redis(CommandsMixin):
+    """
+    客户端，所有指令通过线程安全的连接池执行，
+    pipeline()可以将多个指令合并成一次发送，并一次读回所有响应
+    """
+    def __init__(self, host="localhost", port=6379, timeout=30, binary=True,
+                 connection_pool=None, max_connections=None):
+        self.connection_pool = connection_pool or ConnectionPool(
+            host, port, timeout, binary, max_connections)
         self.setup()
 
+    @property
+    def binary(self):
+        return self.connection_pool.connection_kwargs["binary"]
+
     def setup(self):
+        """建立连接，并确定服务端是否支持二进制协议"""
         self.close()
-        self.redis_conn = socket()
-        self.redis_conn.connect((self.host, self.port))
-        self.redis_conn.settimeout(self.timeout)
-
-    def __getattr__(self, name):
-        return func_name_wrapper(name)(self._execute_cmd)
-
-    def _execute_cmd(self, *args, **kwargs):
-        args = SafeList(args)
-        func_name = kwargs["_name"]
-        properties = CMD_DICT[func_name]
-        default_value = deepcopy(properties.get("default", []))
-        try:
-            arguments = []
-            for arg in properties["args"]:
-                kwarg = kwargs.pop(arg, None)
-                if kwarg is None:
-                    kwarg = args.pop(0)
-                    if kwarg is None:
-                        kwarg = default_value.pop(0)
-                arguments.append(kwarg)
-        except IndexError:
-            sub = ""
-            args = properties.get("args")
-            default_args = SafeList(deepcopy(properties.get("default", [])))
-            error_msg = "%%s haven't got enough arguments, " \
-                        "need %s argument%s named %%s. " % (
-                len(args), "" if len(args) == 1 else "s")
-            for arg in reversed(args):
-                sub = "%s%s" % (arg, (": default %s, " % default_args.pop(-1)
-                                      if default_args else ", ")) + sub
-            raise RedisArgumentError(error_msg%(func_name, sub[:-2]))
-        if args:
-            arguments += args
-        return self._parse_result(FORMAT % (
-            func_name.encode("utf-8"),
-            b"%s<->%s" % escape(
-                properties.get("send", default_send)(*arguments))), properties)
-
-    def _parse_result(self, buf, properties={}):
-        count = 0
-        result = b""
+        self.connection_pool.release(self.connection_pool.get_connection())
+
+    def pipeline(self, raise_on_error=True):
+        return Pipeline(self.connection_pool, raise_on_error)
+
+    @staticmethod
+    def _send(conn, buf):
         try:
-            self.redis_conn.send(buf)
-        except Exception as e:
-            if e.args[0] == errno.EPIPE and count < 3:
-                self.setup()
-                count += 1
-                time.sleep(1)
-            else:
+            conn.send(buf)
+        except OSError as e:
+            if e.args[0] not in (errno.EPIPE, errno.ECONNRESET):
                 raise
-        while True:
-            recv = self.redis_conn.recv(1024000)
-            if recv:
-                result += recv
-            if not recv or recv.endswith(b"\r\n\r\n"):
-                break
-        result = result
-        a = result.split(b"#-*-#")
-        code, info, data = a
-        data = data[:-4]
-        if code == b"200":
-            return handle_safely(
-                properties.get("recv", default_recv))(unescape(data))
-        elif code == b"502":
-            return properties.get("result", data)
-        else:
-            raise RedisError(b"%s:%s, data: %s"%(code, info, data))
-
-    def keys(self, pattern="*", *args):
-        return self._parse_result(
-            FORMAT % (b"keys", b"%s<->%s"%escape((pattern, b""))),
-            {"recv":pickle.loads})
-
-    def type(self, key, *args):
-        return self._parse_result(
-            FORMAT % (b"type", b"%s<->%s" % escape((key, b""))))
-
-    def delete(self, key, *args):
-        return self._parse_result(
-            FORMAT % (b"delete", b"%s<->%s" % escape((key, b""))))
-
-    def expire(self, key, seconds, *args):
-        return self._parse_result(
-            FORMAT % (b"expire", b"%s<->%s" % escape((key, str(seconds)))))
-
-    def ttl(self, key, *args):
-        return self._parse_result(
-            FORMAT % (b"ttl", b"%s<->%s" % escape((key, ""))), {"recv": int})
-
-    def flushall(self, *args):
-        return self._parse_result(
-            FORMAT % (b"flushall", b"<->"))
+            # 服务端重启等原因导致连接失效，重连后再发送一次
+            conn.connect()
+            conn.send(buf)
+
+    def _parse_result(self, cmd, key, val, properties={}):
+        conn = self.connection_pool.get_connection()
+        try:
+            self._send(conn, conn.pack(cmd, key, val))
+            response = conn.read_response()
+        except Exception:
+            conn.disconnect()
+            raise
+        finally:
+            self.connection_pool.release(conn)
+        return handle_response(response, properties)
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        """分批遍历所有key，不会像keys一样长时间阻塞服务端"""
+        cursor = None
+        while cursor != 0:
+            cursor, keys = self.scan(cursor or 0, match, count, _type)
+            yield from keys
+
+    def hscan_iter(self, name, match=None, count=None):
+        """:return: (field, value)的生成器"""
+        cursor = None
+        while cursor != 0:
+            cursor, data = self.hscan(name, cursor or 0, match, count)
+            yield from data.items()
+
+    def sscan_iter(self, name, match=None, count=None):
+        cursor = None
+        while cursor != 0:
+            cursor, members = self.sscan(name, cursor or 0, match, count)
+            yield from members
+
+    def zscan_iter(self, name, match=None, count=None):
+        cursor = None
+        while cursor != 0:
+            cursor, members = self.zscan(name, cursor or 0, match, count)
+            yield from members
 
     def close(self):
-        if self.redis_conn:
+        self.connection_pool.disconnect()
+
+
+class Pipeline(Redis):
+    """
+    缓存多个指令，execute时一次写入，并按顺序读回所有响应
+    with r.pipeline() as pipe:
+        pipe.rpush("a", 1)
+        pipe.llen("a")
+        results = pipe.execute()
+    """
+    def __init__(self, connection_pool, raise_on_error=True):
+        self.connection_pool = connection_pool
+        self.raise_on_error = raise_on_error
+        self.command_stack = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.reset()
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def reset(self):
+        self.command_stack = []
+
+    def _parse_result(self, cmd, key, val, properties={}):
+        self.command_stack.append((cmd, key, val, properties))
+        return self
+
+    def execute(self, raise_on_error=None):
+        stack, self.command_stack = self.command_stack, []
+        if not stack:
+            return []
+        if raise_on_error is None:
+            raise_on_error = self.raise_on_error
+        conn = self.connection_pool.get_connection()
+        try:
+            self._send(conn, b"".join(
+                conn.pack(cmd, key, val) for cmd, key, val, _ in stack))
+            responses = [conn.read_response() for _ in stack]
+        except Exception:
+            conn.disconnect()
+            raise
+        finally:
+            self.connection_pool.release(conn)
+        results = []
+        for response, (_, _, _, properties) in zip(responses, stack):
             try:
-                self.redis_conn.close()
-            except Exception:
-                pass
+                results.append(handle_response(response, properties))
+            except RedisError as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        return results
+
+    def close(self):
+        self.reset()
 
 
 def parse_args():
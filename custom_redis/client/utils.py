@@ -34,13 +34,49 @@ def safe_dumps(data):
         return data
 
 
-def func_name_wrapper(name):
-    def wrapper(func):
-        def inner_wrapper(*args, **kwargs):
-            kwargs["_name"] = name
-            return func(*args, **kwargs)
-        return inner_wrapper
-    return wrapper
+def cursor_recv(convert=list):
+    """SCAN系列的响应：(下一个cursor, convert(元素列表))"""
+    def recv(data):
+        cursor, items = pickle.loads(data)
+        return cursor, convert(items)
+    return recv
+
+
+def info_value(value):
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def info_recv(data):
+    """
+    INFO的响应转换成{字段: 值}，
+    cmdstat_get:calls=1,usec=2这样的值转换成{"calls": 1, "usec": 2}
+    """
+    info = {}
+    for line in data.decode("utf-8").splitlines():
+        if not line or line.startswith("#"):
+            continue
+        key, value = line.split(":", 1)
+        if "=" in value:
+            value = dict((name, info_value(item)) for name, item in (
+                pair.split("=", 1) for pair in value.split(",")))
+        else:
+            value = info_value(value)
+        info[key] = value
+    return info
+
+
+SLOWLOG_FIELDS = ("id", "start_time", "duration", "command", "key",
+                  "arg_size", "client_address")
+
+
+def slowlog_recv(data):
+    """SLOWLOG GET的记录转换成dict，duration的单位是微秒"""
+    return [dict(zip(SLOWLOG_FIELDS, entry)) for entry in pickle.loads(data)]
 
 
 def handle_safely(func):
@@ -66,7 +102,9 @@ def escape(datas):
 
 
 def unescape(data):
+    """响应中的\r\n\r\n也被服务端转义"""
     return data.replace(
         b"1qaxsw234fds3gbhfvhtedfvfg", b"<->").replace(
-        b"jp0n988n80434nlj3pdf0909mn", b"#-*-#")
+        b"jp0n988n80434nlj3pdf0909mn", b"#-*-#").replace(
+        b"r4n7kd02vbx9q3mw8zt5ylc6hs", b"\r\n\r\n")
 
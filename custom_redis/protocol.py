@@ -0,0 +1,63 @@
+# -*- coding:utf-8 -*-
+"""
+客户端与服务端共用的二进制协议定义
+
+连接建立后客户端先发送HELLO(MAGIC + 版本号)，服务端回复其支持的版本，
+之后双方使用长度前缀的帧进行通信，不再对报文做任何转义和扫描。
+请求帧：!HII(指令长度, key长度, value长度) + 指令 + key + value
+响应帧：!HHI(响应码, 信息长度, 数据长度) + 信息 + 数据
+"""
+import struct
+
+# 以NUL开头，不可能是旧协议中的指令名
+MAGIC = b"\x00CRP"
+VERSION = 1
+HELLO = MAGIC + bytes([VERSION])
+
+REQUEST_HEADER = struct.Struct("!HII")
+RESPONSE_HEADER = struct.Struct("!HHI")
+
+
+def to_bytes(data):
+    if isinstance(data, bytes):
+        return data
+    if data is None:
+        return b""
+    return str(data).encode("utf-8")
+
+
+def hello(version=VERSION):
+    return MAGIC + bytes([version])
+
+
+def pack_request(cmd, key, val):
+    return b"".join((
+        REQUEST_HEADER.pack(len(cmd), len(key), len(val)), cmd, key, val))
+
+
+def pack_response(code, info, data):
+    return b"".join((
+        RESPONSE_HEADER.pack(code, len(info), len(data)), info, data))
+
+
+def unpack_request(buf, offset=0):
+    """
+    从buf的offset处解析出一个完整的请求帧
+    :return: ((cmd, key, val), 新的offset)，数据不完整时返回(None, offset)
+    """
+    end = offset + REQUEST_HEADER.size
+    if len(buf) < end:
+        return None, offset
+    cmd_len, key_len, val_len = REQUEST_HEADER.unpack_from(buf, offset)
+    if len(buf) < end + cmd_len + key_len + val_len:
+        return None, offset
+    cmd = bytes(buf[end: end + cmd_len])
+    end += cmd_len
+    key = bytes(buf[end: end + key_len])
+    end += key_len
+    val = bytes(buf[end: end + val_len])
+    return (cmd, key, val), end + val_len
+
+
+def unpack_response_header(header):
+    return RESPONSE_HEADER.unpack(header)
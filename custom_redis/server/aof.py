@@ -0,0 +1,189 @@
+# -*- coding:utf-8 -*-
+"""
+aof(append only file)，记录每个执行成功的写指令
+每条记录是一个标志字节加上二进制协议的请求帧，
+值不是bytes时(比如RESP解析出的dict)使用pickle序列化并设置标志位
+
+事件循环每次进入select前将本轮的写指令一次性写入文件(group commit)，
+然后才发送响应，根据appendfsync决定何时fsync：
+    always: 每次写入后fsync
+    everysec: 由后台线程每秒最多fsync一次
+    no: 由操作系统决定
+"""
+import os
+import time
+import pickle
+import threading
+
+from ..protocol import pack_request, unpack_request
+from .utils import to_bytes
+
+AOF_MAGIC = b"\x00CRAOF\x01"
+PICKLED = 1
+FSYNC_POLICIES = ("always", "everysec", "no")
+
+
+def pack_record(cmd, key, val):
+    flag = 0
+    if not isinstance(val, bytes):
+        val = pickle.dumps(val)
+        flag |= PICKLED
+    return bytes([flag]) + pack_request(
+        to_bytes(cmd), to_bytes(key), val)
+
+
+def rewrite(filename, datas, expire_keys, type_names):
+    """
+    根据当前数据生成最小的aof，每个key一条restore，有过期时间的再加一条pexpireat，
+    restore的值与快照中一样使用各数据类型的编码
+    :param type_names: {数据类型: 类型名}
+    """
+    with open(filename, "wb") as stream:
+        stream.write(AOF_MAGIC)
+        for key, store in datas.items():
+            stream.write(pack_record(
+                "restore", key, (type_names[store.__class__], store.dumps())))
+            when = expire_keys.get(key)
+            if when is not None:
+                stream.write(pack_record("pexpireat", key, b"%d" % when))
+        stream.flush()
+        os.fsync(stream.fileno())
+
+
+def replay(filename, dispatch, chunk_size=4 * 1024 * 1024):
+    """
+    依次执行aof中的指令，文件末尾不完整的记录(比如写入时宕机)会被截掉
+    :return: (执行的指令数, 截掉的字节数)
+    """
+    count = 0
+    # 已经完整解析的字节数
+    valid = len(AOF_MAGIC)
+    with open(filename, "rb") as stream:
+        if stream.read(len(AOF_MAGIC)) != AOF_MAGIC:
+            raise ValueError("%s is not an append only file" % filename)
+        buf = bytearray()
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            buf += chunk
+            offset = 0
+            while offset < len(buf):
+                request, end = unpack_request(buf, offset + 1)
+                if request is None:
+                    break
+                cmd, key, val = request
+                if buf[offset] & PICKLED:
+                    val = pickle.loads(val)
+                dispatch(cmd.decode("utf-8"), key, val)
+                count += 1
+                offset = end
+            valid += offset
+            del buf[:offset]
+    if buf:
+        os.truncate(filename, valid)
+    return count, len(buf)
+
+
+class AppendOnlyFile(object):
+
+    def __init__(self, filename, fsync="everysec"):
+        self.filename = filename
+        self.fsync = fsync
+        # 本轮事件循环中产生的记录
+        self.buffer = bytearray()
+        # 后台重写期间产生的记录，重写完成后追加到新文件末尾
+        self.rewrite_buffer = None
+        self.fd = None
+        self.open()
+        # 上次重写后的文件大小，用于判断是否需要自动重写
+        self.base_size = self.size
+        self.last_fsync = time.monotonic()
+        # 是否有写入但还没有fsync的数据
+        self.unsynced = False
+        self.lock = threading.Lock()
+        self.fsync_event = threading.Event()
+        self.closed = False
+        if fsync == "everysec":
+            thread = threading.Thread(target=self.fsync_forever, daemon=True)
+            thread.start()
+
+    def open(self):
+        self.fd = os.open(
+            self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.size = os.fstat(self.fd).st_size
+        if not self.size:
+            self.write(AOF_MAGIC)
+
+    def feed(self, cmd, key, val):
+        record = pack_record(cmd, key, val)
+        self.buffer += record
+        if self.rewrite_buffer is not None:
+            self.rewrite_buffer += record
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+        self.size += len(data)
+
+    def flush(self):
+        """写入本轮的所有记录，并按策略fsync"""
+        if self.buffer:
+            self.write(self.buffer)
+            self.buffer = bytearray()
+            self.unsynced = True
+        if not self.unsynced:
+            return
+        if self.fsync == "always":
+            os.fsync(self.fd)
+            self.unsynced = False
+        elif self.fsync == "everysec" and \
+                time.monotonic() - self.last_fsync >= 1:
+            self.last_fsync = time.monotonic()
+            self.unsynced = False
+            self.fsync_event.set()
+
+    def fsync_forever(self):
+        while True:
+            self.fsync_event.wait()
+            self.fsync_event.clear()
+            with self.lock:
+                if self.closed:
+                    break
+                try:
+                    os.fsync(self.fd)
+                except OSError:
+                    pass
+
+    def start_rewrite(self):
+        self.rewrite_buffer = bytearray()
+
+    def finish_rewrite(self, filename):
+        """
+        用重写后的文件替换当前文件，重写期间产生的记录追加到新文件末尾
+        """
+        self.flush()
+        with open(filename, "ab") as stream:
+            stream.write(self.rewrite_buffer)
+            stream.flush()
+            os.fsync(stream.fileno())
+        self.rewrite_buffer = None
+        with self.lock:
+            os.replace(filename, self.filename)
+            os.close(self.fd)
+            self.open()
+        self.base_size = self.size
+
+    def abort_rewrite(self):
+        self.rewrite_buffer = None
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.fsync != "no":
+                os.fsync(self.fd)
+            self.closed = True
+            os.close(self.fd)
+        self.fsync_event.set()
@@ -1,13 +1,48 @@
 # -*- coding:utf-8 -*-
 """这里定义一些框架基类和元类"""
+import sys
 import types
 import pickle
+import fnmatch
 import traceback
 
 from functools import wraps
 
 from .errors import Empty
-from .utils import format_response
+from .keyspace import ScanIndex
+from .eviction import LFU_INIT_VAL
+from .compact import Compact
+from .utils import format_response, loads, to_bytes, sampled_size
+
+# 成员数不超过这个值时HSCAN等一次返回所有成员，不建立索引
+SCAN_SMALL = 128
+
+
+def command(arity, write=False, key=True, name=None):
+    """
+    声明指令的元信息，用来生成指令表
+    :param arity: 参数个数(包含指令名)，负数代表最少参数个数，与redis的COMMAND一致
+    :param write: 是否会修改数据
+    :param key: 第一个参数是否是key
+    :param name: 指令名，默认为方法名，方法名会覆盖类中用到的名字时使用
+    """
+    def decorator(func):
+        func.arity = arity
+        func.write = write
+        func.key = key
+        func.command_name = name
+        return func
+    return decorator
+
+
+def mark_command(inner, func):
+    """被元类包装的方法都是指令，没有声明元信息的视为会修改数据"""
+    inner.command = True
+    inner.arity = getattr(func, "arity", -2)
+    inner.write = getattr(func, "write", True)
+    inner.key = getattr(func, "key", True)
+    inner.command_name = getattr(func, "command_name", None)
+    return inner
 
 
 class Meta(type):
@@ -27,25 +62,39 @@ class StoreMeta(Meta):
     """数据类专用元类"""
     @staticmethod
     def wrapper(func):
+        write = getattr(func, "write", True)
+
         @wraps(func)
         def inner(*args):
             self, k, v, instance = args
+            index = self.scan_index if write else None
             try:
                 self.key = k
-                instance.datas[k] = self
-                self.logger.info("process in method %s" % func.__name__)
-                return format_response(b"200", b"success", func(*args))
+                size = len(self.data) if index is not None else 0
+                data = func(*args)
+                # 写指令执行后才保存，集合被清空时直接删除，读指令不会新建key
+                if write:
+                    # 只有新增了成员时索引才需要同步，删除的成员由scan过滤
+                    if index is not None and len(self.data) > size:
+                        index.stale = True
+                    if self.data or self.keep_empty:
+                        instance.datas[k] = self
+                        instance.mark_dirty(k)
+                    else:
+                        self.remove(k, instance)
+                return format_response(b"200", b"success", data)
             except (Empty, KeyError):
-                if not self.data:
-                    del instance.datas[k]
-                self.logger.error(traceback.format_exc())
+                if not self.data and not self.keep_empty:
+                    self.remove(k, instance)
+                # key或成员不存在是正常的空响应，不记录异常栈
+                self.logger.debug("%s: %r not found", func.__name__, k)
                 return format_response(b"502", b"Empty", b"")
             except Exception as e:
                 self.logger.error(traceback.format_exc())
                 return format_response(
                     b"503", "{}:{}".format(
                         e.__class__.__name__.lower(), e).encode(), v)
-        return inner
+        return mark_command(inner, func)
 
 
 class RedisCommandMeta(Meta):
@@ -62,27 +111,109 @@ class RedisCommandMeta(Meta):
                 return format_response(
                     b"503", "{}:{}".format(
                         e.__class__.__name__.lower(), e).encode(), v)
-        return inner
+        return mark_command(inner, func)
 
 
 class DataCommonCommand(object):
     """数据公共方法"""
     data_type = None
+    # 小集合使用的紧凑编码，新建时使用，由数据类型在超过阈值时转换成data_type
+    compact_type = None
+    # 为空时是否保留，集合类型为空时删除，与redis一致
+    keep_empty = False
+    # HSCAN等使用的成员索引，第一次遍历大集合时建立
+    scan_index = None
+    # 保存在Keyspace中时统计的内存占用
+    memory = 0
+    # 淘汰策略使用的访问时间及访问频率
+    lru = 0
+    lfu = LFU_INIT_VAL
+    lfu_time = 0
+    # 数据的近似内存占用，各数据类型可以提供更准确的估计
+    sizeof = staticmethod(sampled_size)
+    # 抽样得到的每个元素的平均占用，及抽样时的元素数
+    item_size = 0
+    sampled_count = 0
 
     def __init__(self, logger, data=None):
         self.logger = logger
-        self.data = data or self.data_type()
+        if data is None:
+            data = (self.compact_type or self.data_type)()
+        elif not isinstance(data, (self.data_type, Compact)):
+            # 比如旧版本快照中的list转换成ListStore使用的deque
+            data = self.data_type(data)
+        self.data = data
 
     @classmethod
     def from_redis(cls, redis):
         return cls(redis.logger)
 
-    def persist(self, stream):
-        stream.write(pickle.dumps(self.data))
-        stream.write(b"fdfsafafdsfsfdsfafdff")
+    @staticmethod
+    def remove(key, redis):
+        if redis.datas.pop(key, None) is not None:
+            redis.expire_keys.pop(key, None)
+            redis.mark_dirty(key)
+
+    def scan_members(self, v, members):
+        """
+        HSCAN、SSCAN、ZSCAN的公共部分，v为(cursor, pattern, count)
+        :param members: 成员的集合，set或dict
+        :return: (下一个cursor, 成员列表)
+        """
+        cursor, pattern, count = (list(loads(v)) + [None, None])[:3]
+        cursor = int(cursor or 0)
+        if not cursor and len(members) <= SCAN_SMALL:
+            cursor, keys = 0, list(members)
+        else:
+            index = self.scan_index
+            if index is None:
+                index = self.scan_index = ScanIndex()
+                index.stale = True
+            # 只在从头遍历时同步，已有成员的位置不变，不影响其它正在进行的遍历
+            if not cursor and index.stale:
+                index.sync(members)
+            cursor, keys = index.scan(cursor, int(count or 10), members)
+        if pattern is not None:
+            pattern = to_bytes(pattern)
+            keys = [key for key in keys
+                    if fnmatch.fnmatchcase(to_bytes(key), pattern)]
+        return cursor, keys
+
+    def memory_usage(self):
+        """
+        近似的内存占用，每个元素的平均占用由sizeof抽样估计，
+        元素数变化一倍以上时才重新抽样，写指令的开销是O(1)
+        """
+        data = self.data
+        if isinstance(data, (bytes, Compact)):
+            return sys.getsizeof(data)
+        count = len(data)
+        if not self.sampled_count // 2 < count <= self.sampled_count * 2:
+            self.item_size = self.sizeof(data) // (count or 1)
+            self.sampled_count = count
+        return max(count, 1) * self.item_size
+
+    def dumps(self):
+        """保存到快照中的值"""
+        return self.encode(self.data)
+
+    @classmethod
+    def from_dump(cls, logger, value):
+        return cls(logger, cls.decode(value))
+
+    # 数据的序列化方法，各数据类型可以提供更紧凑的编码，
+    # 使用staticmethod，不会被元类当作指令包装
+    @staticmethod
+    def encode(data):
+        return pickle.dumps(data)
+
+    @staticmethod
+    def decode(value):
+        return pickle.loads(value)
 
     @classmethod
     def loads(cls, val):
+        """旧版本的快照中没有类型标记，根据数据判断所属类型"""
         if isinstance(val, cls.data_type):
             return cls
 
@@ -0,0 +1,61 @@
+# -*- coding:utf-8 -*-
+"""
+指令表，启动及install时根据通用函数类和所有数据类型生成一次，
+每个请求只需要一次字典查找即可找到处理方法、所属类型及参数个数等信息
+"""
+
+
+class Command(object):
+    """
+    一个指令的元信息
+    :param name: 指令名
+    :param owner: 所属数据类型，通用指令为None
+    :param handlers: {数据类型: 未绑定的方法}，同名方法可能存在于多个数据类型中
+    """
+    __slots__ = ("name", "owner", "handlers", "arity", "write", "key",
+                 "stats")
+
+    def __init__(self, name, owner, func):
+        self.name = name
+        self.owner = owner
+        self.handlers = {owner: func}
+        self.arity = func.arity
+        self.write = func.write
+        self.key = func.key
+        # 调用次数及耗时，由服务端的Stats绑定
+        self.stats = None
+
+    @property
+    def flags(self):
+        return ["write" if self.write else "readonly"]
+
+    def info(self):
+        """COMMAND INFO中的一项"""
+        first = 1 if self.key else 0
+        return [self.name, self.arity, self.flags, first, first, first]
+
+
+def commands_of(cls):
+    """类及其父类中所有被元类包装过的指令方法"""
+    for klass in reversed(cls.__mro__):
+        for name, func in vars(klass).items():
+            if getattr(func, "command", False):
+                yield func.command_name or name, func
+
+
+def build_command_table(redis_command, data_types):
+    """
+    :param redis_command: 通用函数类实例
+    :param data_types: {类型名: 数据类型}
+    :return: {指令名: Command}，通用指令与数据类型方法重名时通用指令优先
+    """
+    table = {}
+    for data_type in data_types.values():
+        for name, func in commands_of(data_type):
+            if name in table:
+                table[name].handlers[data_type] = func
+            else:
+                table[name] = Command(name, data_type, func)
+    for name, func in commands_of(redis_command.__class__):
+        table[name] = Command(name, None, func)
+    return table
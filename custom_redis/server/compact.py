@@ -0,0 +1,306 @@
+# -*- coding:utf-8 -*-
+"""
+小集合的紧凑编码，与redis的listpack及intset类似
+    PackedList/PackedSet: 所有元素用encoding.pack_values打包成一个bytes
+    PackedHash: 所有field及所有value分别打包后拼接在一起
+    IntSet: 全是整数的集合，使用有序的array('q')
+每个实例只有一个bytes(或array)，没有每个元素的对象开销，
+提供对应的deque/set/dict所需的接口，每次操作都解包整个数据，只适用于小集合，
+元素数或元素长度超过阈值时由数据类型转换成完整的数据结构(expand)
+打包后的数据与快照中的编码相同，保存时直接写入
+"""
+import sys
+
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+from .encoding import pack_values, unpack_values, unpack_varint, \
+    unpack_uints, unpack_value_at, BIG_ENDIAN
+
+EMPTY = pack_values([])
+EMPTY_HASH = EMPTY + EMPTY
+# 快照中IntSet的编码以0开头，pack_values的编码以元素数开头，空集合不会被保存
+INTSET_MARK = b"\x00"
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def as_int64(member):
+    """member是规范的十进制整数(没有前导0及+号)并且在int64范围内时返回整数"""
+    if not isinstance(member, bytes) or not 0 < len(member) <= 20:
+        return None
+    try:
+        number = int(member)
+    except ValueError:
+        return None
+    if b"%d" % number != member or not INT64_MIN <= number <= INT64_MAX:
+        return None
+    return number
+
+
+def is_small(value, limit):
+    if isinstance(value, (bytes, str)):
+        return len(value) <= limit
+    return isinstance(value, int)
+
+
+def fits(values, count, max_entries, max_value):
+    """count个元素，新增的values都不超过max_value时，是否可以使用紧凑编码"""
+    return count <= max_entries and \
+        all(is_small(value, max_value) for value in values)
+
+
+def fits_mapping(mapping, count, max_entries, max_value):
+    return count <= max_entries and all(
+        is_small(field, max_value) and is_small(value, max_value)
+        for field, value in mapping.items())
+
+
+def packed_info(blob, offset=0):
+    """:return: (元素数, 最长元素的长度, 结束位置)"""
+    count, offset = unpack_varint(blob, offset)
+    lengths, offset = unpack_uints(blob, offset + count)
+    return count, max(lengths) if lengths else 0, offset + sum(lengths)
+
+
+class Compact(object):
+    """紧凑编码的基类"""
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if isinstance(other, Compact):
+            other = other.expand()
+        return self.expand() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.expand())
+
+    def expand(self):
+        """转换成完整的数据结构"""
+        raise NotImplementedError
+
+    def dump(self):
+        """快照中的编码"""
+        raise NotImplementedError
+
+
+class Packed(Compact):
+    __slots__ = ("blob",)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self.blob)
+
+    def __len__(self):
+        return unpack_varint(self.blob, 0)[0]
+
+    def __iter__(self):
+        return iter(self.unpack())
+
+    def unpack(self):
+        return unpack_values(self.blob)[0]
+
+    def dump(self):
+        return self.blob
+
+
+class PackedList(Packed):
+    __slots__ = ()
+
+    def __init__(self, values=(), blob=None):
+        if blob is None:
+            blob = pack_values(list(values)) if values else EMPTY
+        self.blob = blob
+
+    def __reversed__(self):
+        return reversed(self.unpack())
+
+    def __getitem__(self, index):
+        return self.unpack()[index]
+
+    def expand(self):
+        return deque(self.unpack())
+
+    def extend(self, values):
+        items = self.unpack()
+        items.extend(values)
+        self.blob = pack_values(items)
+
+    def extendleft(self, values):
+        """与deque一致，依次插入到头部"""
+        items = list(values)
+        items.reverse()
+        self.blob = pack_values(items + self.unpack())
+
+    def pop(self):
+        items = self.unpack()
+        value = items.pop()
+        self.blob = pack_values(items)
+        return value
+
+    def popleft(self):
+        items = self.unpack()
+        value = items.pop(0)
+        self.blob = pack_values(items)
+        return value
+
+    def clear(self):
+        self.blob = EMPTY
+
+
+class PackedSet(Packed):
+    __slots__ = ()
+
+    def __init__(self, members=(), blob=None):
+        if blob is None:
+            blob = pack_values(list(dict.fromkeys(members))) \
+                if members else EMPTY
+        self.blob = blob
+
+    def __contains__(self, member):
+        return member in self.unpack()
+
+    def expand(self):
+        return set(self.unpack())
+
+    def update(self, members):
+        items = self.unpack()
+        exists = set(items)
+        for member in members:
+            if member not in exists:
+                exists.add(member)
+                items.append(member)
+        if len(items) != len(self):
+            self.blob = pack_values(items)
+
+    def add(self, member):
+        self.update((member,))
+
+    def discard(self, member):
+        items = self.unpack()
+        if member in items:
+            items.remove(member)
+            self.blob = pack_values(items)
+
+
+class PackedHash(Packed):
+    """所有field打包后再拼接所有value，与快照中hash的编码相同"""
+    __slots__ = ()
+
+    def __init__(self, mapping=(), blob=None):
+        if blob is None:
+            blob = self.pack(dict(mapping)) if mapping else EMPTY_HASH
+        self.blob = blob
+
+    def __contains__(self, field):
+        return field in self.keys()
+
+    def __getitem__(self, field):
+        fields, offset = unpack_values(self.blob)
+        try:
+            index = fields.index(field)
+        except ValueError:
+            raise KeyError(field)
+        return unpack_value_at(self.blob, index, offset)
+
+    def __setitem__(self, field, value):
+        self.update({field: value})
+
+    def unpack_all(self):
+        fields, offset = unpack_values(self.blob)
+        return fields, unpack_values(self.blob, offset)[0]
+
+    def keys(self):
+        return self.unpack()
+
+    def values(self):
+        return self.unpack_all()[1]
+
+    def items(self):
+        return list(zip(*self.unpack_all()))
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def expand(self):
+        return dict(zip(*self.unpack_all()))
+
+    def update(self, mapping):
+        if len(self):
+            data = self.expand()
+            data.update(mapping)
+        else:
+            data = dict(mapping)
+        self.blob = self.pack(data)
+
+    @staticmethod
+    def pack(data):
+        return pack_values(list(data)) + pack_values(list(data.values()))
+
+
+class IntSet(Compact):
+    """成员对外是整数的十进制bytes，与其它集合一致"""
+    __slots__ = ("items",)
+
+    def __init__(self, members=(), items=None):
+        if items is None:
+            items = array("q", sorted(set(int(member) for member in members)))
+        self.items = items
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return (b"%d" % number for number in self.items)
+
+    def __contains__(self, member):
+        return self.find(as_int64(member)) is not None
+
+    def find(self, number):
+        """:return: 下标，不存在时返回None"""
+        if number is None:
+            return None
+        index = bisect_left(self.items, number)
+        if index < len(self.items) and self.items[index] == number:
+            return index
+
+    def expand(self):
+        return set(self)
+
+    def update(self, members):
+        items = self.items
+        for member in members:
+            number = as_int64(member)
+            index = bisect_left(items, number)
+            if index == len(items) or items[index] != number:
+                items.insert(index, number)
+
+    def add(self, member):
+        self.update((member,))
+
+    def discard(self, member):
+        index = self.find(as_int64(member))
+        if index is not None:
+            del self.items[index]
+
+    def dump(self):
+        items = self.items
+        if BIG_ENDIAN:
+            items = array("q", items)
+            items.byteswap()
+        return INTSET_MARK + items.tobytes()
+
+    @classmethod
+    def load(cls, value):
+        items = array("q")
+        items.frombytes(value[len(INTSET_MARK):])
+        if BIG_ENDIAN:
+            items.byteswap()
+        return cls(items=items)
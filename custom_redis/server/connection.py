@@ -0,0 +1,103 @@
+# -*- coding:utf-8 -*-
+"""客户端连接"""
+import time
+
+from itertools import islice
+from collections import deque
+
+
+class Connection(object):
+    """
+    客户端连接，输入缓冲区由协议实例维护，协议每次解析出所有完整的请求，
+    响应按请求顺序保存在输出缓冲区replies中，通过sendmsg合并发送，
+    发送不完整时记录偏移量，等待可写时继续发送
+    """
+    # 每次读事件最多读取的字节数，避免单个连接长时间占用事件循环
+    max_read = 1024 * 1024
+    chunk_size = 64 * 1024
+    # 每次sendmsg最多合并的响应数
+    iov_max = 1024
+
+    def __init__(self, sock, addr, protocol):
+        self.sock = sock
+        self.addr = addr
+        self.protocol = protocol
+        self.replies = deque()
+        # 第一个响应已经发送的字节数
+        self.offset = 0
+        # 输出缓冲区中未发送的字节数
+        self.pending = 0
+        # 输出缓冲区开始超过软限制的时间
+        self.soft_since = None
+        # 对端是否已经关闭写端
+        self.eof = False
+        # 协商协议前收到的不完整的握手报文
+        self.greeting = b""
+
+    @property
+    def keep(self):
+        return self.protocol.keep
+
+    def read(self):
+        """读取当前所有可读数据，读到对端关闭时设置eof"""
+        chunks = []
+        size = 0
+        try:
+            while size < self.max_read:
+                chunk = self.sock.recv(self.chunk_size)
+                if not chunk:
+                    self.eof = True
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+        except (BlockingIOError, InterruptedError):
+            pass
+        return b"".join(chunks)
+
+    def queue(self, reply):
+        self.replies.append(reply)
+        self.pending += len(reply)
+
+    def write(self):
+        """
+        尽可能多的发送输出缓冲区中的数据
+        :return: 是否已经全部发送
+        """
+        while self.replies:
+            bufs = list(islice(self.replies, self.iov_max))
+            if self.offset:
+                bufs[0] = memoryview(bufs[0])[self.offset:]
+            try:
+                sent = self.sock.sendmsg(bufs)
+            except (BlockingIOError, InterruptedError):
+                return False
+            self.pending -= sent
+            # 内核发送缓冲区已满
+            full = sent < sum(len(buf) for buf in bufs)
+            sent += self.offset
+            self.offset = 0
+            while sent:
+                size = len(self.replies[0])
+                if sent < size:
+                    self.offset = sent
+                    break
+                sent -= size
+                self.replies.popleft()
+            if full:
+                return False
+        return True
+
+    def over_limit(self, hard, soft, soft_seconds):
+        """输出缓冲区超过硬限制，或持续超过软限制soft_seconds秒"""
+        if hard and self.pending > hard:
+            return True
+        if soft and self.pending > soft:
+            now = time.monotonic()
+            if self.soft_since is None:
+                self.soft_since = now
+            return now - self.soft_since > soft_seconds
+        self.soft_since = None
+        return False
+
+    def __str__(self):
+        return "%s:%s" % self.addr[:2]
@@ -2,94 +2,500 @@
 import pickle
 import random
 
+from itertools import islice
+from collections import deque
+
 from .errors import Empty
 from .zset import SortedSet
-from .bases import DataStore
+from .bases import DataStore, command
+from .expire import now_ms
+from .compact import PackedList, PackedSet, PackedHash, IntSet, \
+    INTSET_MARK, as_int64, fits, fits_mapping, packed_info
+from .encoding import pack_value, unpack_value, pack_values, \
+    unpack_values, pack_scores, unpack_scores
+from .utils import loads, as_values, to_bytes, normalize_range, to_score, \
+    parse_bound, format_score, sampled_size, sizeof_pair
 
 __all__ = ["ZsetStore", "ListStore", "StrStore", "SetStore", "HashStore"]
+# 跳表节点(包括forward及span两个列表)的近似大小
+ZSL_NODE_SIZE = 200
+
+
+def as_dict(data):
+    """PackedHash解包成dict，一次解包后多次查找"""
+    return data if isinstance(data, dict) else data.expand()
+
+
+def range_args(v):
+    """(start, stop[, withscores])"""
+    args = list(loads(v))
+    start, stop = int(args[0]), int(args[1])
+    return start, stop, bool(args[2]) if len(args) > 2 else False
+
+
+def score_range_args(v):
+    """(边界, 边界[, withscores[, offset, count]])，count为负数时不限制"""
+    args = list(loads(v))
+    args += [False, 0, -1][len(args) - 2:]
+    return parse_bound(args[0]), parse_bound(args[1]), bool(args[2]), \
+        int(args[3]), int(args[4])
 
 
 class ZsetStore(DataStore):
 
     data_type = SortedSet
 
+    @staticmethod
+    def encode(data):
+        items = data.items()
+        return pack_values([key for key, _ in items]) + \
+            pack_scores([score for _, score in items])
+
+    @staticmethod
+    def decode(value):
+        keys, offset = unpack_values(value)
+        scores, _ = unpack_scores(value, offset)
+        return SortedSet.from_items(zip(keys, scores))
+
+    @staticmethod
+    def sizeof(data):
+        # 每个成员还有一个跳表节点
+        return sampled_size(
+            data.dict, data.dict.items(), sizeof_pair, ZSL_NODE_SIZE)
+
+    @command(-4, write=True)
     def zadd(self, k, v, instance):
-        k, v = [i for i in pickle.loads(v).items()][0]
-        self.data.zadd(v, int(k))
-
+        """
+        v为{分数: 成员}或[分数, 成员, 分数, 成员...]，:return: 新增的成员数
+        """
+        v = loads(v)
+        if isinstance(v, dict):
+            pairs = v.items()
+        else:
+            if len(v) % 2:
+                raise ValueError("syntax error")
+            pairs = zip(v[::2], v[1::2])
+        # 分数相同时按成员排序，成员统一为bytes才能互相比较
+        return str(self.data.zadd_many(
+            [(to_bytes(member), to_score(score))
+             for score, member in pairs])).encode("utf-8")
+
+    @command(-2, write=True)
     def zpop(self, k, v, instance):
         return pickle.dumps(self.data.zpop(v))
 
+    @command(-2, write=True)
+    def zpopmin(self, k, v, instance):
+        """v为个数，:return: [(成员, 分数)]"""
+        return pickle.dumps(self.data.zpopmin(int(v or 1)))
+
+    @command(-2, write=True)
+    def zpopmax(self, k, v, instance):
+        return pickle.dumps(self.data.zpopmax(int(v or 1)))
+
+    @command(2)
     def zcard(self, k, v, instance):
         return str(self.data.zcard).encode("utf-8")
 
+    @command(-3, write=True)
+    def zrem(self, k, v, instance):
+        removed = 0
+        for member in loads(v):
+            removed += self.data.zrem(to_bytes(member))
+        return str(removed).encode("utf-8")
+
+    @command(3)
+    def zscore(self, k, v, instance):
+        score = self.data.zscore(to_bytes(v))
+        if score is None:
+            raise Empty
+        return format_score(score)
+
+    @command(3)
+    def zrank(self, k, v, instance):
+        rank = self.data.zrank(to_bytes(v))
+        if rank is None:
+            raise Empty
+        return str(rank).encode("utf-8")
+
+    @command(3)
+    def zrevrank(self, k, v, instance):
+        rank = self.data.zrevrank(to_bytes(v))
+        if rank is None:
+            raise Empty
+        return str(rank).encode("utf-8")
+
+    @command(4)
+    def zcount(self, k, v, instance):
+        """v为(min, max)，边界以"("开头表示不包含"""
+        (start, min_exclusive), (end, max_exclusive) = map(
+            parse_bound, loads(v))
+        return str(self.data.zcount(
+            start, end, min_exclusive, max_exclusive)).encode("utf-8")
+
+    @command(4, write=True)
+    def zincrby(self, k, v, instance):
+        """v为(增量, 成员)，:return: 新的分数"""
+        increment, member = loads(v)
+        return format_score(
+            self.data.zincrby(to_bytes(member), to_score(increment)))
+
+    @command(-4)
+    def zrange(self, k, v, instance):
+        """v为(start, stop[, withscores])"""
+        return pickle.dumps(self.data.zrange(*range_args(v)))
+
+    @command(-4)
+    def zrevrange(self, k, v, instance):
+        return pickle.dumps(self.data.zrevrange(*range_args(v)))
+
+    @command(-4)
+    def zrangebyscore(self, k, v, instance):
+        """v为(min, max[, withscores[, offset, count]])"""
+        (start, min_exclusive), (end, max_exclusive), withscores, offset, \
+            count = score_range_args(v)
+        return pickle.dumps(self.data.zrangebyscore(
+            start, end, withscores, offset, count,
+            min_exclusive, max_exclusive))
+
+    @command(-4)
+    def zrevrangebyscore(self, k, v, instance):
+        """v为(max, min[, withscores[, offset, count]])"""
+        (end, max_exclusive), (start, min_exclusive), withscores, offset, \
+            count = score_range_args(v)
+        return pickle.dumps(self.data.zrevrangebyscore(
+            end, start, withscores, offset, count,
+            min_exclusive, max_exclusive))
+
+    @command(-3)
+    def zscan(self, k, v, instance):
+        """v为(cursor, pattern, count)，:return: (下一个cursor, [(成员, 分数)])"""
+        scores = self.data.dict
+        cursor, members = self.scan_members(v, scores)
+        return pickle.dumps(
+            (cursor, [(member, scores[member]) for member in members]))
+
 
 class ListStore(DataStore):
+    """
+    小列表使用PackedList，超过阈值后转换成deque，两端的push及pop都是O(1)
+    """
+    data_type = deque
+    compact_type = PackedList
+    # 使用紧凑编码的最大元素数及元素长度，由服务端根据启动参数设置
+    max_listpack_entries = 128
+    max_listpack_value = 64
+
+    @staticmethod
+    def encode(data):
+        if isinstance(data, PackedList):
+            return data.dump()
+        return pack_values(data)
+
+    @classmethod
+    def decode(cls, value):
+        count, longest, _ = packed_info(value)
+        if count <= cls.max_listpack_entries and \
+                longest <= cls.max_listpack_value:
+            return PackedList(blob=value)
+        return deque(unpack_values(value)[0])
+
+    @classmethod
+    def fit(cls, data, values):
+        """插入values前检查是否需要转换成deque"""
+        if isinstance(data, PackedList) and not fits(
+                values, len(data) + len(values), cls.max_listpack_entries,
+                cls.max_listpack_value):
+            return data.expand()
+        return data
 
-    data_type = list
+    @classmethod
+    def loads(cls, val):
+        # 旧版本的快照中保存的是list
+        if isinstance(val, (list, deque)):
+            return cls
 
+    @command(2, write=True)
     def lpop(self, k, v, instance):
         if self.data:
-            return self.data.pop(0)
+            return self.data.popleft()
+        else:
+            raise Empty
+
+    @command(2, write=True)
+    def rpop(self, k, v, instance):
+        if self.data:
+            return self.data.pop()
         else:
             raise Empty
 
+    @staticmethod
+    def push_values(store, values, left=False):
+        values = [to_bytes(value) for value in values]
+        store.data = store.fit(store.data, values)
+        if left:
+            store.data.extendleft(values)
+        else:
+            store.data.extend(values)
+        return str(len(store.data)).encode("utf-8")
+
+    @command(-3, write=True)
+    def lpush(self, k, v, instance):
+        """依次插入到头部，与redis一致，LPUSH k a b的结果是[b, a]"""
+        return self.push_values(self, as_values(v), left=True)
+
+    @command(-3, write=True)
     def rpush(self, k, v, instance):
-        self.data.append(v)
+        return self.push_values(self, as_values(v))
+
+    @command(-3, write=True)
+    def mlpush(self, k, v, instance):
+        """v为pickle后的值列表"""
+        return self.push_values(self, loads(v), left=True)
 
+    @command(-3, write=True)
+    def mrpush(self, k, v, instance):
+        return self.push_values(self, loads(v))
+
+    @command(2)
     def llen(self, k, v, instance):
         return str(len(self.data)).encode("utf-8")
 
+    @command(4)
+    def lrange(self, k, v, instance):
+        """v为(start, stop)，闭区间，从离区间较近的一端开始遍历"""
+        start, stop = loads(v)
+        length = len(self.data)
+        start, stop = normalize_range(int(start), int(stop), length)
+        if start >= stop:
+            return pickle.dumps([])
+        if start < length - stop:
+            items = list(islice(self.data, start, stop))
+        else:
+            items = list(islice(reversed(self.data), length - stop,
+                                length - start))
+            items.reverse()
+        return pickle.dumps(items)
+
+    @command(3)
+    def lindex(self, k, v, instance):
+        index = int(v)
+        if -len(self.data) <= index < len(self.data):
+            return self.data[index]
+        raise Empty
+
+    @command(4, write=True)
+    def ltrim(self, k, v, instance):
+        """只保留[start, stop]之间的元素，从两端弹出，不复制保留的部分"""
+        start, stop = loads(v)
+        start, stop = normalize_range(int(start), int(stop), len(self.data))
+        if start >= stop:
+            self.data.clear()
+            return
+        for _ in range(len(self.data) - stop):
+            self.data.pop()
+        for _ in range(start):
+            self.data.popleft()
+
+    @command(4, write=True)
+    def lrem(self, k, v, instance):
+        """
+        v为(count, value)，count大于0时从头部开始删除count个，
+        小于0时从尾部开始删除，等于0时全部删除
+        """
+        count, value = loads(v)
+        count, value = int(count), to_bytes(value)
+        items = reversed(self.data) if count < 0 else self.data
+        limit = abs(count) or len(self.data)
+        kept = []
+        removed = 0
+        for item in items:
+            if removed < limit and item == value:
+                removed += 1
+            else:
+                kept.append(item)
+        if removed:
+            if count < 0:
+                kept.reverse()
+            self.data = self.data.__class__(kept)
+        return str(removed).encode("utf-8")
+
 
 class StrStore(DataStore):
 
     data_type = bytes
+    keep_empty = True
+
+    @staticmethod
+    def encode(data):
+        return pack_value(data)
+
+    @staticmethod
+    def decode(value):
+        return unpack_value(value)
 
+    @command(3, write=True)
     def add(self, k, v, instance):
         self.data += v
 
+    @command(3)
     def slice(self, k, v, instance):
         return eval(b"self.data[%s]" % v)
 
+    @command(-3, write=True)
     def set(self, k, v, instance):
+        if isinstance(v, tuple):
+            # SET ... EX/PX，v为(值, 过期毫秒数)
+            v, px = v
+            instance.expire_keys[k] = now_ms() + px
+        else:
+            instance.expire_keys.pop(k, None)
         self.data = v
 
+    @command(2)
     def get(self, k, v, instance):
         return self.data
 
 
 class SetStore(DataStore):
-
+    """
+    全是整数的小集合使用IntSet，其它小集合使用PackedSet，超过阈值后转换成set
+    """
     data_type = set
-
+    compact_type = IntSet
+    max_intset_entries = 512
+    max_listpack_entries = 128
+    max_listpack_value = 64
+
+    @staticmethod
+    def encode(data):
+        if isinstance(data, (IntSet, PackedSet)):
+            return data.dump()
+        return pack_values(list(data))
+
+    @classmethod
+    def decode(cls, value):
+        if value[:1] == INTSET_MARK:
+            data = IntSet.load(value)
+            if len(data) > cls.max_intset_entries:
+                return data.expand()
+            return data
+        count, longest, _ = packed_info(value)
+        if count <= cls.max_listpack_entries and \
+                longest <= cls.max_listpack_value:
+            return PackedSet(blob=value)
+        return set(unpack_values(value)[0])
+
+    @classmethod
+    def fit(cls, data, members):
+        """添加members前检查是否需要转换编码"""
+        if isinstance(data, set):
+            return data
+        count = len(data) + len(members)
+        if isinstance(data, IntSet):
+            if count <= cls.max_intset_entries and all(
+                    as_int64(member) is not None for member in members):
+                return data
+            if fits(members, count, cls.max_listpack_entries,
+                    cls.max_listpack_value):
+                return PackedSet(data)
+            return data.expand()
+        if fits(members, count, cls.max_listpack_entries,
+                cls.max_listpack_value):
+            return data
+        return data.expand()
+
+    @staticmethod
+    def add_members(store, members):
+        members = [to_bytes(value) for value in members]
+        store.data = store.fit(store.data, members)
+        card = len(store.data)
+        store.data.update(members)
+        return str(len(store.data) - card).encode("utf-8")
+
+    @command(-3, write=True)
     def sadd(self, k, v, instance):
-        self.data.add(v)
+        return self.add_members(self, as_values(v))
 
+    @command(-3, write=True)
+    def msadd(self, k, v, instance):
+        """v为pickle后的成员列表"""
+        return self.add_members(self, loads(v))
+
+    @command(2)
     def scard(self, k, v, instance):
         return str(len(self.data)).encode("utf-8")
 
+    @command(2)
     def smembers(self, k, v, instance):
         return pickle.dumps(list(self.data))
 
+    @command(-3, write=True)
     def srem(self, k, v, instance):
-        values = pickle.loads(v)
-        for value in values:
-            self.data.remove(bytes(str(value), encoding="utf-8"))
+        card = len(self.data)
+        for value in loads(v):
+            self.data.discard(to_bytes(value))
+        return str(card - len(self.data)).encode("utf-8")
 
+    @command(3)
     def sismember(self, k, v, instance):
         return str(v in self.data).encode("utf-8")
 
+    @command(2)
     def srchoice(self, k, v, instance):
         return random.choice(list(self.data))
 
+    @command(-3)
+    def sscan(self, k, v, instance):
+        """v为(cursor, pattern, count)，:return: (下一个cursor, 成员列表)"""
+        return pickle.dumps(self.scan_members(v, self.data))
 
-class HashStore(DataStore):
 
+class HashStore(DataStore):
+    """小hash使用PackedHash，超过阈值后转换成dict"""
     data_type = dict
+    compact_type = PackedHash
+    max_listpack_entries = 128
+    max_listpack_value = 64
+
+    @staticmethod
+    def encode(data):
+        if isinstance(data, PackedHash):
+            return data.dump()
+        return pack_values(list(data)) + pack_values(list(data.values()))
+
+    @classmethod
+    def decode(cls, value):
+        count, longest, offset = packed_info(value)
+        longest = max(longest, packed_info(value, offset)[1])
+        if count <= cls.max_listpack_entries and \
+                longest <= cls.max_listpack_value:
+            return PackedHash(blob=value)
+        fields, offset = unpack_values(value)
+        return dict(zip(fields, unpack_values(value, offset)[0]))
+
+    @staticmethod
+    def sizeof(data):
+        return sampled_size(data, data.items(), sizeof_pair)
+
+    @classmethod
+    def fit(cls, data, mapping):
+        """写入mapping前检查是否需要转换成dict"""
+        if isinstance(data, PackedHash) and not fits_mapping(
+                mapping, len(data) + len(mapping), cls.max_listpack_entries,
+                cls.max_listpack_value):
+            return data.expand()
+        return data
 
+    @command(-4, write=True)
     def hset(self, k, v, instance):
-        self.data.update(pickle.loads(v))
+        mapping = dict(loads(v))
+        self.data = self.fit(self.data, mapping)
+        card = len(self.data)
+        self.data.update(mapping)
+        return str(len(self.data) - card).encode("utf-8")
 
+    @command(3)
     def hget(self, k, v, instance):
         if isinstance(v, bytes):
             v = v.decode("utf-8")
@@ -98,23 +504,34 @@ class HashStore(DataStore):
             data = str(data).encode("utf-8")
         return data
 
+    @command(-4, write=True)
     def hmset(self, k, v, instance):
-        k_vs = pickle.loads(v)
-        self.data.update(dict(k_vs))
+        mapping = dict(loads(v))
+        self.data = self.fit(self.data, mapping)
+        self.data.update(mapping)
 
+    @command(-3)
     def hmget(self, k, v, instance):
-        ks = pickle.loads(v)
+        data = as_dict(self.data)
         return pickle.dumps(
-            dict(filter(lambda x: x[0] in ks, self.data.items())))
+            dict((field, data[field]) for field in loads(v) if field in data))
 
+    @command(2)
     def hgetall(self, k, v, instance):
-        return pickle.dumps(self.data)
+        return pickle.dumps(as_dict(self.data))
 
+    @command(4, write=True)
     def hincrby(self, k, v, instance):
-        k_vs = pickle.loads(v)
+        k_vs = loads(v)
         k = list(k_vs.keys())[0]
-        v = k_vs[k]
-        self.data[k] = int(self.data.get(k, 0)) + int(v)
-
-
-
+        value = int(self.data.get(k, 0)) + int(k_vs[k])
+        self.data = self.fit(self.data, {k: value})
+        self.data[k] = value
+        return str(value).encode("utf-8")
+
+    @command(-3)
+    def hscan(self, k, v, instance):
+        """v为(cursor, pattern, count)，:return: (下一个cursor, [(field, value)])"""
+        cursor, fields = self.scan_members(v, self.data)
+        data = as_dict(self.data)
+        return pickle.dumps((cursor, [(field, data[field]) for field in fields]))
@@ -0,0 +1,203 @@
+# -*- coding:utf-8 -*-
+"""
+快照中各数据类型使用的紧凑编码
+    varint: 7位一组的变长无符号整数
+    整数数组: 宽度(B/H/I/Q) + 个数 + 小端序的定长数组，按最大值选择最小的宽度
+    值: 类型标记 + 数据
+    值数组: 个数 + 每个值的类型标记 + 长度数组 + 所有值拼接在一起，
+            bytes原样保存，str保存utf-8，int保存十进制字符串，其它类型使用pickle
+    分数数组: 全部是整数时保存第一个分数及之后的差值(已按分数排序，差值非负)，
+              全部是浮点数时保存double数组，否则使用pickle
+"""
+import sys
+import pickle
+import struct
+
+from array import array
+from itertools import accumulate
+
+TAG_BYTES, TAG_STR, TAG_INT, TAG_PICKLE = range(4)
+SCORE_INT, SCORE_FLOAT, SCORE_PICKLE = range(3)
+# (类型码, 最大值)，array的类型码在各平台上的宽度可能不同，按itemsize选择
+WIDTHS = [(code, (1 << (8 * array(code).itemsize)) - 1)
+          for code in ("B", "H", "I", "Q")]
+COUNT = struct.Struct("<BI")
+INT64 = struct.Struct("<q")
+BIG_ENDIAN = sys.byteorder == "big"
+BYTE_CODE = ord("B")
+
+
+def pack_varint(number):
+    out = bytearray()
+    while number > 0x7f:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
+    return bytes(out)
+
+
+def unpack_varint(data, offset):
+    """:return: (整数, 新的offset)"""
+    byte = data[offset]
+    if byte < 0x80:
+        return byte, offset + 1
+    number = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, offset
+        shift += 7
+
+
+def pack_uints(numbers):
+    top = max(numbers) if numbers else 0
+    if top < 256:
+        # 最常见的情况，直接转换成bytes
+        return COUNT.pack(BYTE_CODE, len(numbers)) + bytes(numbers)
+    for code, limit in WIDTHS:
+        if top <= limit:
+            break
+    items = array(code, numbers)
+    if BIG_ENDIAN:
+        items.byteswap()
+    return COUNT.pack(ord(code), len(items)) + items.tobytes()
+
+
+def unpack_uints(data, offset):
+    """:return: (array, 新的offset)"""
+    code, count = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    if code == BYTE_CODE:
+        return data[offset: offset + count], offset + count
+    items = array(chr(code))
+    end = offset + count * items.itemsize
+    items.frombytes(data[offset: end])
+    if BIG_ENDIAN:
+        items.byteswap()
+    return items, end
+
+
+def encode_value(value):
+    if isinstance(value, bytes):
+        return TAG_BYTES, value
+    if isinstance(value, str):
+        return TAG_STR, value.encode("utf-8")
+    if isinstance(value, int) and not isinstance(value, bool):
+        return TAG_INT, b"%d" % value
+    return TAG_PICKLE, pickle.dumps(value)
+
+
+DECODERS = {
+    TAG_STR: lambda value: value.decode("utf-8"),
+    TAG_INT: int,
+    TAG_PICKLE: pickle.loads,
+}
+
+
+def pack_value(value):
+    """单个值：类型标记 + 数据"""
+    tag, value = encode_value(value)
+    return bytes([tag]) + value
+
+
+def unpack_value(data):
+    tag = data[0]
+    return data[1:] if tag == TAG_BYTES else DECODERS[tag](data[1:])
+
+
+def pack_values(values):
+    if all(value.__class__ is bytes for value in values):
+        # 全是bytes时类型标记都是TAG_BYTES(0)
+        return b"".join((pack_varint(len(values)), bytes(len(values)),
+                         pack_uints([len(value) for value in values]),
+                         b"".join(values)))
+    tags = bytearray()
+    lengths = []
+    chunks = []
+    for value in values:
+        tag, value = encode_value(value)
+        tags.append(tag)
+        lengths.append(len(value))
+        chunks.append(value)
+    return b"".join((pack_varint(len(tags)), tags, pack_uints(lengths),
+                     b"".join(chunks)))
+
+
+def unpack_values(data, offset=0):
+    """:return: (值列表, 新的offset)"""
+    count, offset = unpack_varint(data, offset)
+    tags = data[offset: offset + count]
+    lengths, offset = unpack_uints(data, offset + count)
+    if not any(tags):
+        # accumulate的initial参数需要python3.8
+        ends = [offset]
+        ends += (offset + end for end in accumulate(lengths))
+        return [data[start: end] for start, end in zip(ends, ends[1:])], \
+            ends[-1]
+    values = []
+    append = values.append
+    for tag, length in zip(tags, lengths):
+        end = offset + length
+        value = data[offset: end]
+        append(value if tag == TAG_BYTES else DECODERS[tag](value))
+        offset = end
+    return values, offset
+
+
+def unpack_value_at(data, index, offset=0):
+    """只解码值数组中的第index个值"""
+    count, offset = unpack_varint(data, offset)
+    tag = data[offset + index]
+    lengths, offset = unpack_uints(data, offset + count)
+    start = offset + sum(lengths[:index])
+    value = data[start: start + lengths[index]]
+    return value if tag == TAG_BYTES else DECODERS[tag](value)
+
+
+def pack_scores(scores):
+    """scores必须已经升序排列，格式为类型 + 个数 + 数据"""
+    header = pack_varint(len(scores))
+    if all(isinstance(score, int) and not isinstance(score, bool)
+           for score in scores):
+        if not scores:
+            return bytes([SCORE_INT]) + header
+        deltas = [b - a for a, b in zip(scores, scores[1:])]
+        if -(1 << 63) <= scores[0] < 1 << 63 and \
+                (not deltas or max(deltas) < 1 << 64):
+            return b"".join((bytes([SCORE_INT]), header,
+                             INT64.pack(scores[0]), pack_uints(deltas)))
+    if all(isinstance(score, float) for score in scores):
+        items = array("d", scores)
+        if BIG_ENDIAN:
+            items.byteswap()
+        return bytes([SCORE_FLOAT]) + header + items.tobytes()
+    data = pickle.dumps(list(scores))
+    return bytes([SCORE_PICKLE]) + header + pack_varint(len(data)) + data
+
+
+def unpack_scores(data, offset=0):
+    """:return: (分数列表, 新的offset)"""
+    kind = data[offset]
+    count, offset = unpack_varint(data, offset + 1)
+    if kind == SCORE_INT:
+        if not count:
+            return [], offset
+        score, = INT64.unpack_from(data, offset)
+        deltas, offset = unpack_uints(data, offset + INT64.size)
+        scores = [score]
+        append = scores.append
+        for delta in deltas:
+            score += delta
+            append(score)
+        return scores, offset
+    if kind == SCORE_FLOAT:
+        items = array("d")
+        end = offset + count * items.itemsize
+        items.frombytes(data[offset: end])
+        if BIG_ENDIAN:
+            items.byteswap()
+        return items.tolist(), end
+    size, offset = unpack_varint(data, offset)
+    return pickle.loads(data[offset: offset + size]), offset + size
@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+"""
+基于selectors(linux下为epoll)的事件循环
+每个socket注册一个回调，读事件常驻，写事件只在有待发送数据时注册；
+定时任务保存在最小堆中，select只阻塞到最近的定时任务到期为止，
+before_sleep中的回调在每次进入select前执行
+"""
+import time
+import heapq
+import socket
+import selectors
+import itertools
+
+EVENT_READ = selectors.EVENT_READ
+EVENT_WRITE = selectors.EVENT_WRITE
+
+
+class Timer(object):
+    """定时任务，可以通过cancel取消"""
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop(object):
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.timers = []
+        self.before_sleep = []
+        self.counter = itertools.count()
+        # 用于从信号处理函数或其它线程中唤醒select
+        self.waker, self.waker_w = socket.socketpair()
+        self.waker.setblocking(False)
+        self.waker_w.setblocking(False)
+        self.selector.register(self.waker, EVENT_READ, None)
+
+    def register(self, fileobj, callback, events=EVENT_READ):
+        """callback(fileobj, mask)在fileobj就绪时被调用"""
+        self.selector.register(fileobj, events, callback)
+
+    def unregister(self, fileobj):
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    def set_writable(self, fileobj, writable):
+        """按需开启或关闭写事件，兴趣没有变化时不做系统调用"""
+        key = self.selector.get_key(fileobj)
+        events = key.events | EVENT_WRITE if writable else \
+            key.events & ~EVENT_WRITE
+        if key.events != events:
+            self.selector.modify(fileobj, events, key.data)
+
+    def stop_reading(self, fileobj):
+        """对端关闭写端后不再关注读事件，否则每轮select都会立即返回"""
+        key = self.selector.get_key(fileobj)
+        self.selector.modify(fileobj, EVENT_WRITE, key.data)
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(time.monotonic() + delay, callback, args)
+        heapq.heappush(self.timers, (timer.deadline, next(self.counter), timer))
+        return timer
+
+    def wakeup(self):
+        try:
+            self.waker_w.send(b"\0")
+        except OSError:
+            pass
+
+    def next_timeout(self):
+        while self.timers and self.timers[0][2].cancelled:
+            heapq.heappop(self.timers)
+        if not self.timers:
+            return None
+        return max(0, self.timers[0][0] - time.monotonic())
+
+    def run_timers(self):
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            timer = heapq.heappop(self.timers)[2]
+            if not timer.cancelled:
+                timer.callback(*timer.args)
+
+    def run_once(self):
+        for callback in self.before_sleep:
+            callback()
+        for key, mask in self.selector.select(self.next_timeout()):
+            if key.data is None:
+                try:
+                    while self.waker.recv(1024):
+                        pass
+                except OSError:
+                    pass
+            else:
+                key.data(key.fileobj, mask)
+        self.run_timers()
+
+    def close(self):
+        self.selector.close()
+        self.waker.close()
+        self.waker_w.close()
@@ -0,0 +1,104 @@
+# -*- coding:utf-8 -*-
+"""
+内存达到maxmemory时的淘汰策略，与redis一样使用抽样的近似算法，每次淘汰的代价是O(1)
+    noeviction: 不淘汰，写指令返回OOM错误
+    allkeys-lru: 在所有key中抽样，淘汰最久没有访问的
+    allkeys-lfu: 在所有key中抽样，淘汰访问频率最低的
+    volatile-lru: 只在有过期时间的key中抽样，淘汰最久没有访问的
+    volatile-ttl: 淘汰过期时间最早的key
+访问时间及频率记录在数据实例上，频率是redis的对数计数器，每分钟衰减1
+"""
+import time
+import random
+
+from .keyspace import HOLE
+
+POLICIES = ("noeviction", "allkeys-lru", "allkeys-lfu", "volatile-lru",
+            "volatile-ttl")
+# 新key的访问频率，避免刚写入就被淘汰
+LFU_INIT_VAL = 5
+LFU_LOG_FACTOR = 10
+# 频率衰减的周期(分钟)
+LFU_DECAY_TIME = 1
+
+
+def lfu_decay(store, minutes):
+    """按距上次访问的分钟数衰减后的访问频率"""
+    periods = (minutes - store.lfu_time) // LFU_DECAY_TIME \
+        if store.lfu_time else 0
+    return max(store.lfu - periods, 0)
+
+
+def lfu_incr(counter):
+    """对数计数器，计数越大增加的概率越小，最大255"""
+    if counter >= 255:
+        return 255
+    base = max(counter - LFU_INIT_VAL, 0)
+    if random.random() < 1.0 / (base * LFU_LOG_FACTOR + 1):
+        counter += 1
+    return counter
+
+
+class Evictor(object):
+    """
+    :param datas: Keyspace，通过其游标索引随机抽样，第一次抽样时建立索引
+    :param expire_keys: Expires，通过其最小堆抽样有过期时间的key
+    :param samples: 每次淘汰抽样的key数
+    """
+    def __init__(self, datas, expire_keys, policy, samples=5):
+        self.datas = datas
+        self.expire_keys = expire_keys
+        self.policy = policy
+        self.samples = samples
+        self.lfu = policy.endswith("lfu")
+
+    def touch(self, store):
+        """访问key时更新访问时间或频率"""
+        if self.lfu:
+            minutes = int(time.monotonic() // 60)
+            store.lfu = lfu_incr(lfu_decay(store, minutes))
+            store.lfu_time = minutes
+        else:
+            store.lru = time.monotonic()
+
+    def sample_keys(self):
+        slots = self.datas.ensure_index().slots
+        keys = []
+        # 空洞较多时多试几次
+        for _ in range(self.samples * 4):
+            if not slots or len(keys) >= self.samples:
+                break
+            key = slots[random.randrange(len(slots))]
+            if key is not HOLE:
+                keys.append(key)
+        return keys
+
+    def sample_volatile_keys(self):
+        heap = self.expire_keys.heap
+        keys = []
+        for _ in range(self.samples * 4):
+            if not heap or len(keys) >= self.samples:
+                break
+            when, key = heap[random.randrange(len(heap))]
+            # 堆中可能有失效项
+            if self.expire_keys.get(key) == when and key in self.datas:
+                keys.append(key)
+        return keys
+
+    def pick(self):
+        """:return: 要淘汰的key，没有可以淘汰的key时返回None"""
+        if self.policy == "noeviction":
+            return None
+        if self.policy == "volatile-ttl":
+            return self.expire_keys.first()
+        if self.policy.startswith("volatile"):
+            keys = self.sample_volatile_keys()
+        else:
+            keys = self.sample_keys()
+        if not keys:
+            return None
+        datas = self.datas
+        if self.lfu:
+            minutes = int(time.monotonic() // 60)
+            return min(keys, key=lambda key: lfu_decay(datas[key], minutes))
+        return min(keys, key=lambda key: datas[key].lru)
@@ -0,0 +1,67 @@
+# -*- coding:utf-8 -*-
+"""
+过期时间，值是毫秒级的unix时间戳
+访问key时惰性删除已过期的key，另外由事件循环定时从最小堆中主动删除，
+每次主动删除有时间预算，不会长时间阻塞事件循环
+"""
+import time
+import heapq
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class Expires(dict):
+    """
+    {key: 过期时间}，同时维护一个(过期时间, key)的最小堆，
+    重新设置或删除过期时间时不修改堆，弹出时与字典中的值不一致的项视为失效
+    """
+    # 每处理多少项检查一次时间预算
+    check_every = 32
+
+    def __init__(self):
+        super().__init__()
+        self.heap = []
+
+    def __setitem__(self, key, when):
+        super().__setitem__(key, when)
+        heapq.heappush(self.heap, (when, key))
+        # 失效项过多时重建，避免频繁续期的key撑大堆
+        if len(self.heap) > 2 * len(self) + 1024:
+            self.heap = [(w, k) for k, w in self.items()]
+            heapq.heapify(self.heap)
+
+    def clear(self):
+        super().clear()
+        self.heap = []
+
+    def is_expired(self, key, now=None):
+        when = self.get(key)
+        return when is not None and when <= (now or now_ms())
+
+    def first(self):
+        """过期时间最早的key，没有时返回None，同时清理堆顶的失效项"""
+        heap = self.heap
+        while heap:
+            when, key = heap[0]
+            if self.get(key) == when:
+                return key
+            heapq.heappop(heap)
+
+    def pop_expired(self, now, deadline=None):
+        """
+        弹出所有已过期的key
+        :param deadline: time.monotonic()的时间预算，超出时剩下的留到下次
+        """
+        count = 0
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            when, key = heapq.heappop(heap)
+            if self.get(key) == when:
+                del self[key]
+                yield key
+            count += 1
+            if deadline and count % self.check_every == 0 \
+                    and time.monotonic() > deadline:
+                break
@@ -0,0 +1,166 @@
+# -*- coding:utf-8 -*-
+"""
+SCAN系列指令使用的游标索引
+所有key依次保存在一个数组中，cursor就是数组的下标，删除key时只把位置置空(空洞)，
+新的key优先填入空洞，已有的key位置不变，所以：
+    遍历期间一直存在的key一定会返回，并且只返回一次
+    遍历期间新增或删除的key可能返回也可能不返回
+与redis的SCAN相同，每次最多访问COUNT的10倍个位置，不会长时间阻塞事件循环
+索引在第一次需要时才建立，从不SCAN的keyspace没有额外开销
+"""
+HOLE = object()
+# 统计内存时每个key的额外开销(字典的槽位、索引等)
+KEY_OVERHEAD = 120
+
+
+class ScanIndex(object):
+
+    def __init__(self):
+        self.slots = []
+        # {key: 下标}
+        self.positions = {}
+        # 空洞的下标，数组末尾的空洞直接截掉，这里可能还留着，使用时再检查
+        self.free = []
+        # 集合类型的索引不是实时维护的，修改后标记为stale，下次从头遍历时再同步
+        self.stale = False
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, key):
+        if key in self.positions:
+            return
+        slots = self.slots
+        free = self.free
+        while free:
+            pos = free.pop()
+            if pos < len(slots) and slots[pos] is HOLE:
+                slots[pos] = key
+                self.positions[key] = pos
+                return
+        self.positions[key] = len(slots)
+        slots.append(key)
+
+    def discard(self, key):
+        pos = self.positions.pop(key, None)
+        if pos is None:
+            return
+        slots = self.slots
+        slots[pos] = HOLE
+        if pos == len(slots) - 1:
+            while slots and slots[-1] is HOLE:
+                slots.pop()
+        else:
+            self.free.append(pos)
+
+    def clear(self):
+        self.slots = []
+        self.positions = {}
+        self.free = []
+
+    def sync(self, members):
+        """
+        把members中新增的key加入索引，已有的key位置不变，
+        已删除的key由scan过滤，超过一半时才清理
+        """
+        positions = self.positions
+        if len(positions) > len(members) * 2:
+            for key in [key for key in positions if key not in members]:
+                self.discard(key)
+        for key in members:
+            if key not in positions:
+                self.add(key)
+        self.stale = False
+
+    def scan(self, cursor, count, members=None):
+        """
+        从cursor开始最多取count个key
+        :param members: 不为None时过滤掉已经不在其中的key
+        :return: (下一个cursor, key列表)，cursor为0表示遍历结束
+        """
+        slots = self.slots
+        end = min(len(slots), cursor + count * 10)
+        keys = []
+        while cursor < end and len(keys) < count:
+            key = slots[cursor]
+            cursor += 1
+            if key is not HOLE and (members is None or key in members):
+                keys.append(key)
+        if cursor >= len(slots):
+            cursor = 0
+        return cursor, keys
+
+
+class Keyspace(dict):
+    """
+    所有数据实例{key: 数据}，建立游标索引后同时维护索引
+    :param track_memory: 是否统计used_memory，每次写入(包括原地修改后重新赋值)时
+                         调用数据的memory_usage()重新估计，结果记录在数据的memory属性上
+    """
+    def __init__(self, track_memory=False):
+        super().__init__()
+        # 第一次SCAN或淘汰抽样时才建立
+        self.index = None
+        self.track_memory = track_memory
+        self.used_memory = 0
+
+    def __setitem__(self, key, value):
+        if self.index is None and not self.track_memory:
+            super().__setitem__(key, value)
+            return
+        old = self.get(key)
+        if old is None and self.index is not None:
+            self.index.add(key)
+        super().__setitem__(key, value)
+        if self.track_memory:
+            size = value.memory_usage()
+            if old is None:
+                self.used_memory += len(key) + KEY_OVERHEAD + size
+            else:
+                self.used_memory += size - old.memory
+            value.memory = size
+
+    def __delitem__(self, key):
+        self.forget(key, self[key])
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        value = self.get(key)
+        if value is not None:
+            self.forget(key, value)
+        return super().pop(key, *default)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.forget(key, value)
+        return key, value
+
+    def forget(self, key, value):
+        if self.index is not None:
+            self.index.discard(key)
+        if self.track_memory:
+            self.used_memory -= len(key) + KEY_OVERHEAD + value.memory
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        super().clear()
+        self.index = None
+        self.used_memory = 0
+
+    def ensure_index(self):
+        """:return: 游标索引，不存在时按当前的key建立"""
+        if self.index is None:
+            self.index = ScanIndex()
+            self.index.sync(self)
+        return self.index
+
+    def scan(self, cursor, count):
+        return self.ensure_index().scan(cursor, count)
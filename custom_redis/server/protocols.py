@@ -0,0 +1,122 @@
+# -*- coding:utf-8 -*-
+"""
+服务端协议，每个连接持有一个协议实例，负责解析请求和编码响应
+feed返回解析出的完整请求，execute负责执行请求并返回编码后的响应，
+响应统一是(code, info, data)
+"""
+from ..protocol import MAGIC, HELLO, VERSION, hello, \
+    pack_response, unpack_request
+from .utils import escape, unescape
+
+
+class Protocol(object):
+    """协议基类，请求是(cmd, key, val)"""
+    # 是否允许通过握手切换到二进制协议
+    negotiable = False
+    # keep-alive标志，为空时发送完响应后关闭连接
+    keep = b"1"
+
+    def feed(self, msg):
+        raise NotImplementedError
+
+    def feed_eof(self):
+        """对端关闭写端后调用，:return: 缓冲区中剩余的请求"""
+        return []
+
+    def encode(self, response):
+        raise NotImplementedError
+
+    def execute(self, server, request):
+        cmd, key, val = request
+        return self.encode(server.dispatch(cmd, key, val))
+
+
+class LegacyProtocol(Protocol):
+    """
+    旧版文本协议：cmd#-*-#key<->val#-*-#keep
+    报文本身没有结束标志，以第二个分隔符后的keep-alive标志(0或1)作为结束，
+    第二个分隔符后没有数据时视为keep-alive为空的完整请求
+    """
+    negotiable = True
+    keep = b""
+    sep = b"#-*-#"
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, msg, eof=False):
+        self.buffer += msg
+        buf = self.buffer
+        sep, sep_len = self.sep, len(self.sep)
+        requests = []
+        offset = 0
+        while True:
+            first = buf.find(sep, offset)
+            if first < 0:
+                break
+            second = buf.find(sep, first + sep_len)
+            if second < 0:
+                break
+            end = second + sep_len
+            if end == len(buf) and not eof:
+                # keep-alive标志可能在下一个报文中
+                break
+            if end < len(buf) and buf[end] in b"01":
+                self.keep = bytes(buf[end: end + 1])
+                end += 1
+            else:
+                self.keep = b""
+            key, val = bytes(buf[first + sep_len: second]).split(b"<->")
+            requests.append((bytes(buf[offset: first]).decode("utf-8"),
+                             unescape(key), unescape(val)))
+            offset = end
+        del buf[:offset]
+        return requests
+
+    def feed_eof(self):
+        return self.feed(b"", eof=True)
+
+    def encode(self, response):
+        code, info, data = response
+        return b"%s#-*-#%s#-*-#%s\r\n\r\n" % (code, info, escape(data))
+
+
+class BinaryProtocol(Protocol):
+    """长度前缀的二进制协议，不对报文做任何扫描和转义"""
+
+    def __init__(self, version=VERSION):
+        self.version = version
+        self.buffer = bytearray()
+
+    def feed(self, msg):
+        self.buffer += msg
+        requests = []
+        offset = 0
+        while True:
+            request, offset = unpack_request(self.buffer, offset)
+            if request is None:
+                break
+            cmd, key, val = request
+            requests.append((cmd.decode("utf-8"), key, val))
+        del self.buffer[:offset]
+        return requests
+
+    def encode(self, response):
+        code, info, data = response
+        return pack_response(int(code), info, data)
+
+
+def partial_hello(msg):
+    """:return: msg是否可能是还没有接收完整的握手报文"""
+    return len(msg) < len(HELLO) and MAGIC.startswith(msg)
+
+
+def negotiate(msg):
+    """
+    连接的第一个报文若以MAGIC开头则切换到二进制协议
+    :return: (协议实例, 握手响应, 剩余报文)，不需要切换时返回None
+    """
+    if not msg.startswith(MAGIC) or len(msg) <= len(MAGIC):
+        return None
+    version = min(msg[len(MAGIC)], VERSION)
+    return BinaryProtocol(version), hello(version), msg[len(HELLO):]
@@ -1,10 +1,13 @@
 # -*- coding:utf-8 -*-
 """这里定义的是一些通用的方法"""
-import time
 import pickle
 import fnmatch
 
-from .bases import RedisCommandMeta
+from .bases import RedisCommandMeta, command
+from .expire import now_ms
+from .data_types import StrStore
+from .stats import info
+from .utils import format_response, loads, to_bytes
 
 
 class RedisCommand(object, metaclass=RedisCommandMeta):
@@ -12,38 +15,242 @@ class RedisCommand(object, metaclass=RedisCommandMeta):
     expire_keys = None
     datas = None
 
+    @command(2, key=False)
     def keys(self, k, v, instance):
-        return b"%s#-*-#%s#-*-#%s\r\n\r\n" % (
+        now = now_ms()
+        return format_response(
             b"200", b"success",
             pickle.dumps([x for x in self.datas.keys()
-                          if fnmatch.fnmatch(x, k)]))
+                          if fnmatch.fnmatch(x, k) and
+                          not self.expire_keys.is_expired(x, now)]))
 
+    @command(-2, key=False)
+    def scan(self, k, v, instance):
+        """
+        k为cursor，v为(pattern, count, type)，均可以为None，
+        :return: (下一个cursor, key列表)
+        """
+        options = list(loads(v)) if v else []
+        pattern, count, type_name = options + [None] * (3 - len(options))
+        cursor, keys = self.datas.scan(int(k or 0), int(count or 10))
+        now = now_ms()
+        if pattern is not None:
+            pattern = to_bytes(pattern)
+            keys = [key for key in keys if fnmatch.fnmatchcase(key, pattern)]
+        if type_name is not None:
+            type_name = to_bytes(type_name).decode("utf-8")
+            keys = [key for key in keys
+                    if self.type_name(self.datas[key]) == type_name]
+        return format_response(b"200", b"success", pickle.dumps(
+            (cursor, [key for key in keys
+                      if not self.expire_keys.is_expired(key, now)])))
+
+    @command(3, write=True)
     def expire(self, k, v, instance):
+        return self.pexpireat(k, now_ms() + int(v) * 1000, instance)
+
+    @command(3, write=True)
+    def pexpire(self, k, v, instance):
+        return self.pexpireat(k, now_ms() + int(v), instance)
+
+    @command(3, write=True)
+    def expireat(self, k, v, instance):
+        return self.pexpireat(k, int(v) * 1000, instance)
+
+    @command(3, write=True)
+    def pexpireat(self, k, v, instance):
         if k in self.datas:
-            self.expire_keys[k] = int(time.time() + int(v))
-            return b"200#-*-#success#-*-#\r\n\r\n"
+            if int(v) <= now_ms():
+                # 与redis一致，过期时间已过时直接删除key
+                instance.remove_key(k)
+            else:
+                self.expire_keys[k] = int(v)
+                instance.mark_dirty(k)
+            return format_response(b"200", b"success", b"")
         raise KeyError(k)
 
+    @command(2)
     def type(self, k, v, instance):
-        data = self.datas[k]
-        return ("200#-*-#success#-*-#%s\r\n\r\n" %
-                data.__class__.__name__[:-5].lower()).encode("utf-8")
+        return format_response(
+            b"200", b"success",
+            self.type_name(self.datas[k]).encode("utf-8"))
+
+    @staticmethod
+    def type_name(store):
+        return store.__class__.__name__[:-5].lower()
 
+    @command(2)
     def ttl(self, k, v, instance):
         expire = self.expire_keys.get(k)
         if expire:
-            expire = int(expire - time.time())
+            expire = (expire - now_ms() + 500) // 1000
+        else:
+            expire = -1
+        return format_response(
+            b"200", b"success", ("%d" % expire).encode("utf-8"))
+
+    @command(2)
+    def pttl(self, k, v, instance):
+        expire = self.expire_keys.get(k)
+        if expire:
+            expire = expire - now_ms()
         else:
             expire = -1
-        return ("200#-*-#success#-*-#%d\r\n\r\n" % expire).encode("utf-8")
+        return format_response(
+            b"200", b"success", ("%d" % expire).encode("utf-8"))
 
+    @command(-2, write=True)
     def delete(self, k, v, instance):
-        try:
-            del self.datas[k]
-        except KeyError:
-            pass
-        return b"200#-*-#success#-*-#\r\n\r\n"
+        """v为其它要删除的key，:return: 删除的key数"""
+        deleted = 0
+        for key in [k] + (list(loads(v)) if v else []):
+            key = to_bytes(key)
+            if key in self.expire_keys:
+                instance.expire_if_needed(key)
+            if self.datas.pop(key, None) is not None:
+                deleted += 1
+                instance.mark_dirty(key)
+            self.expire_keys.pop(key, None)
+        return format_response(b"200", b"success", b"%d" % deleted)
+
+    @command(-2, key=False)
+    def mget(self, k, v, instance):
+        """v为key列表，不存在或不是字符串的key返回None"""
+        values = []
+        for key in loads(v):
+            key = to_bytes(key)
+            if key in self.expire_keys:
+                instance.expire_if_needed(key)
+            store = self.datas.get(key)
+            values.append(
+                store.data if isinstance(store, StrStore) else None)
+        return format_response(b"200", b"success", pickle.dumps(values))
+
+    @command(-3, write=True, key=False)
+    def mset(self, k, v, instance):
+        """v为{key: value}或[key, value, key, value...]"""
+        v = loads(v)
+        if isinstance(v, dict):
+            pairs = v.items()
+        else:
+            if len(v) % 2:
+                raise ValueError("wrong number of arguments for MSET")
+            pairs = zip(v[::2], v[1::2])
+        logger = self.logger
+        for key, value in pairs:
+            key = to_bytes(key)
+            self.datas[key] = StrStore(logger, to_bytes(value))
+            self.expire_keys.pop(key, None)
+            instance.mark_dirty(key)
+        return format_response(b"200", b"success", b"")
 
+    @command(-1, write=True, key=False)
     def flushall(self, k, v, instance):
         self.datas.clear()
-        return b"200#-*-#success#-*-#\r\n\r\n"
+        self.expire_keys.clear()
+        instance.mark_all_dirty()
+        return format_response(b"200", b"success", b"")
+
+    @command(-1, key=False)
+    def ping(self, k, v, instance):
+        return format_response(b"200", b"success", v or b"PONG")
+
+    @command(2, key=False)
+    def echo(self, k, v, instance):
+        return format_response(b"200", b"success", v)
+
+    @command(2, key=False)
+    def select(self, k, v, instance):
+        if int(v) != 0:
+            raise ValueError("DB index is out of range")
+        return format_response(b"200", b"success", b"")
+
+    @command(1, key=False)
+    def save(self, k, v, instance):
+        if instance.child_pid:
+            raise RuntimeError("Background save already in progress")
+        instance.persist()
+        return format_response(b"200", b"success", b"")
+
+    @command(-1, key=False)
+    def bgsave(self, k, v, instance):
+        if not instance.bgsave():
+            raise RuntimeError("Background save already in progress")
+        return format_response(b"200", b"success", b"")
+
+    @command(1, key=False)
+    def bgrewriteaof(self, k, v, instance):
+        if not instance.aof:
+            raise RuntimeError("Append only file is not enabled")
+        if not instance.bgrewriteaof():
+            raise RuntimeError("Background child process already in progress")
+        return format_response(b"200", b"success", b"")
+
+    @command(3, write=True)
+    def restore(self, k, v, instance):
+        """aof重写后使用，v为(类型名, 编码后的数据)"""
+        type_name, value = loads(v)
+        self.datas[k] = instance.data_type[type_name].from_dump(
+            self.logger, value)
+        self.expire_keys.pop(k, None)
+        instance.mark_dirty(k)
+        return format_response(b"200", b"success", b"")
+
+    @command(1, key=False)
+    def lastsave(self, k, v, instance):
+        return format_response(b"200", b"success", b"%d" % instance.lastsave)
+
+    @command(-1, key=False)
+    def info(self, k, v, instance):
+        """v为section名列表，为空时返回默认的section"""
+        sections = [to_bytes(name).decode("utf-8")
+                    for name in (loads(v) if v else [])]
+        return format_response(b"200", b"success", info(instance, sections))
+
+    @command(-2, key=False)
+    def config(self, k, v, instance):
+        """只支持CONFIG RESETSTAT"""
+        sub = to_bytes(k).lower()
+        if sub != b"resetstat":
+            raise ValueError(
+                "Unsupported CONFIG subcommand %s" % sub.decode("utf-8"))
+        instance.reset_stats()
+        return format_response(b"200", b"success", b"")
+
+    @command(-2, key=False)
+    def slowlog(self, k, v, instance):
+        """
+        k为子指令(get, len, reset)，get时v为返回的记录数，默认10，负数返回全部
+        :return: get时为记录列表，见SlowLog.record
+        """
+        sub = to_bytes(k).lower()
+        if sub == b"get":
+            return format_response(b"200", b"success", pickle.dumps(
+                instance.slowlog.get(int(v) if v else 10)))
+        if sub == b"len":
+            return format_response(
+                b"200", b"success", b"%d" % len(instance.slowlog))
+        if sub == b"reset":
+            instance.slowlog.reset()
+            return format_response(b"200", b"success", b"")
+        raise ValueError(
+            "Unsupported SLOWLOG subcommand %s" % sub.decode("utf-8"))
+
+    # 方法名不能是command，否则会覆盖类中使用的装饰器
+    @command(-1, key=False, name="command")
+    def command_(self, k, v, instance):
+        """
+        指令表的内容，k为子指令(count, info)，info时v为指令名列表
+        """
+        sub = to_bytes(k).lower()
+        if sub == b"count":
+            return format_response(
+                b"200", b"success", b"%d" % len(instance.commands))
+        if sub == b"info":
+            names = [to_bytes(name).decode("utf-8") for name in loads(v or [])]
+        else:
+            names = list(instance.commands)
+        return format_response(
+            b"200", b"success", pickle.dumps(
+                [instance.commands[name].info()
+                 if name in instance.commands else None for name in names]))
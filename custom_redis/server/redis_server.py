@@ -1,29 +1,47 @@
 # -*- coding:utf-8 -*-
 """
 redis server
-主线程使用select进程socket监听和任务处理
-守护线程用来持久化数据和删除过期key
+使用基于selectors(epoll)的事件循环进行socket监听和任务处理，
+过期key在访问时及事件循环的定时任务中删除，
+持久化时fork子进程写入快照，不阻塞事件循环，
+开启增量快照时只保存修改过的key，追加到快照末尾，增量段过多时再合并成完整的快照
 """
 import os
 import sys
 import time
-import errno
 import signal
 import socket
-import select
 import pickle
 import logging
 import traceback
 
 from logging import handlers
 from functools import reduce
+from time import perf_counter_ns
 from argparse import ArgumentParser
-from threading import Thread, RLock
 
 from .data_types import *
 from .redis_command import RedisCommand
-from .errors import MethodNotExist, ClientClosed
-from .utils import stream_wrapper, cache_property
+from .errors import ClientClosed
+from .resp import RespProtocol
+from .connection import Connection
+from .expire import Expires, now_ms
+from .keyspace import Keyspace
+from .eviction import Evictor, POLICIES
+from .stats import Stats, LINEAR_MAX, bucket_index
+from .slowlog import SlowLog
+from .tracing import Tracer
+from .aof import AppendOnlyFile, FSYNC_POLICIES, replay, rewrite
+from .snapshot import BUFFER_SIZE, TOMBSTONE, LoadProgress, SnapshotError, \
+    SnapshotReader, dump, is_snapshot
+from .command_table import build_command_table
+from .event_loop import EventLoop, EVENT_READ, EVENT_WRITE
+from .protocols import LegacyProtocol, negotiate, partial_hello
+from .utils import stream_wrapper, cache_property, format_response, \
+    parse_size, positive_int
+
+
+OOM_ERROR = b"OOM command not allowed when used memory > 'maxmemory'."
 
 
 class RedisServer(object):
@@ -36,6 +54,19 @@ class RedisServer(object):
     expire_keys = None
     alive = True
     int_signal_count = 1
+    # 每次唤醒最多接收的连接数
+    max_accepts = 1000
+    # 主动删除过期key的间隔及每次的时间预算(秒)
+    expire_interval = 0.1
+    expire_budget = 0.025
+    # 定时任务(检查快照子进程及保存规则)的间隔(秒)
+    cron_interval = 0.1
+    # 启动时加载数据期间不淘汰key
+    loading = False
+    # 快照文件
+    dbfilename = "redis_data.db"
+    # 后台保存失败后，至少间隔多少秒才会再次按保存规则触发
+    bgsave_retry_delay = 5
 
     def __init__(self):
         self.args = self.parse_args()
@@ -43,18 +74,91 @@ class RedisServer(object):
         self.port = self.args.get("port")
         # 所有数据类型
         self.data_type = {}
-        # 所有数据实例
-        self.datas = {}
+        # 内存上限，0表示不限制，超过时写指令执行前按淘汰策略删除key
+        self.maxmemory = parse_size(self.args.get("maxmemory"))
+        # 所有数据实例，有内存上限时统计各数据的内存占用
+        self.datas = Keyspace(track_memory=bool(self.maxmemory))
         # 所有数据的过期时间
-        self.expire_keys = {}
-        self.lock = RLock()
+        self.expire_keys = Expires()
+        self.evictor = Evictor(
+            self.datas, self.expire_keys, self.args.get("maxmemory_policy"),
+            self.args.get("maxmemory_samples")) if self.maxmemory else None
+        self.evicted_keys = 0
+        # INFO指令使用的运行统计，每latency_sample次调用记录一次指令的耗时
+        self.stats = Stats()
+        self.latency_sample = self.args.get("latency_sample")
+        self.slowlog = SlowLog(self.args.get("slowlog_log_slower_than"),
+                               self.args.get("slowlog_max_len"))
+        # 开启SLOWLOG时对每次调用计时，只用来判断是否超过阈值
+        self.time_calls = self.slowlog.enabled
+        # 正在执行请求的连接，记录在SLOWLOG中
+        self.current_client = None
+        # 请求的抽样追踪，没有指定时DEBUG级别追踪所有请求
+        trace_sample = self.args.get("trace_sample")
+        if trace_sample is None:
+            trace_sample = 1 if self.args.get("log_level") == "DEBUG" else 0
+        self.tracer = Tracer(self.logger, trace_sample)
+        # 上次保存后数据的修改次数
+        self.dirty = 0
+        # 开始后台保存时的修改次数，保存成功后从dirty中减去
+        self.dirty_before_bgsave = 0
+        self.lastsave = int(time.time())
+        self.lastbgsave_ok = True
+        # 启动时加载快照的统计信息
+        self.load_stats = None
+        self.lastbgsave_try = 0
+        # 上次保存后修改过的key，只在开启增量快照时记录
+        self.dirty_keys = set() if self.args.get("snapshot_deltas") else None
+        # 后台保存中的key，保存失败时放回dirty_keys
+        self.saving_keys = None
+        self.saving_delta = False
+        # 快照文件的有效长度、其中完整快照的长度及增量段数，
+        # snapshot_size为None时下次必须保存完整的快照
+        self.snapshot_size = None
+        self.snapshot_base_size = 0
+        self.snapshot_segments = 0
+        # 正在写快照或重写aof的子进程，及其类型(rdb, aof)
+        self.child_pid = None
+        self.child_type = None
+        self.aof = None
+        # [(秒数, 修改次数)]，秒数内修改次数达到要求时后台保存
+        self.save_params = self.parse_save_params(self.args.get("save"))
         self.data_type.update(self.default_data_types)
-        self.r_lst = {}
-        self.w_lst = {}
+        self.configure_encodings()
+        # 所有客户端连接
+        self.connections = {}
+        # 监听socket及其连接所使用的协议
+        self.listeners = {}
+        self.loop = EventLoop()
+        # 本轮事件循环中产生了新响应的连接
+        self.pending_writes = {}
+        self.output_limits = (
+            parse_size(self.args.get("client_output_buffer_limit")[0]),
+            parse_size(self.args.get("client_output_buffer_limit")[1]),
+            int(self.args.get("client_output_buffer_limit")[2]))
+        # 先写aof再发送响应，客户端收到响应时写指令已经写入aof
+        self.loop.before_sleep.append(self.flush_aof)
+        self.loop.before_sleep.append(self.flush_replies)
+        self.loop.call_later(self.expire_interval, self.active_expire)
+        self.loop.call_later(self.cron_interval, self.cron)
         self.redis_command = self.get_common_command()
+        # 指令名到处理方法等元信息的映射
+        self.commands = build_command_table(self.redis_command, self.data_type)
+        self.stats.bind(self.commands)
         signal.signal(signal.SIGINT, self.stop)
         signal.signal(signal.SIGTERM, self.stop)
 
+    def configure_encodings(self):
+        """小集合使用紧凑编码的阈值"""
+        args = self.args
+        HashStore.max_listpack_entries = args.get("hash_max_listpack_entries")
+        HashStore.max_listpack_value = args.get("hash_max_listpack_value")
+        SetStore.max_intset_entries = args.get("set_max_intset_entries")
+        SetStore.max_listpack_entries = args.get("set_max_listpack_entries")
+        SetStore.max_listpack_value = args.get("set_max_listpack_value")
+        ListStore.max_listpack_entries = args.get("list_max_listpack_entries")
+        ListStore.max_listpack_value = args.get("list_max_listpack_value")
+
     def get_common_command(self):
         redis_command = RedisCommand()
         redis_command.expire_keys = self.expire_keys
@@ -69,13 +173,14 @@ class RedisServer(object):
             os.kill(pid, 9)
         else:
             self.alive = False
+            self.loop.wakeup()
             self.logger.info("Close process %s..." % self.name)
             self.int_signal_count += 1
 
     @cache_property
     def logger(self):
         logger = logging.getLogger(self.name)
-        logger.setLevel(getattr(logging, self.args.get("log_level", "DEBUG")))
+        logger.setLevel(getattr(logging, self.args.get("log_level", "INFO")))
         if self.args.get("log_file"):
             handler = handlers.RotatingFileHandler(
                 os.path.join(self.args.get("log_dir", "."),
@@ -90,15 +195,131 @@ class RedisServer(object):
 
     def install(self, **kwds):
         self.data_type.update(kwds)
+        self.commands = build_command_table(self.redis_command, self.data_type)
+        self.stats.bind(self.commands)
+
+    @property
+    def type_names(self):
+        return dict((cls, name) for name, cls in self.data_type.items())
 
     def setup(self):
-        if os.path.exists("redis_data.db"):
-            lines = open(
-                "redis_data.db", "rb").read().split(b"fdfsafafdsfsfdsfafdff")
-            if lines:
-                self.logger.info("load datas...")
-                for line in lines:
-                    self.load(line)
+        self.loading = True
+        try:
+            self.load_datas()
+        finally:
+            self.loading = False
+        # 加载数据时执行的指令不算作修改，也不计入统计
+        self.dirty = 0
+        if self.dirty_keys is not None:
+            self.dirty_keys.clear()
+        self.stats.reset()
+        self.slowlog.reset()
+
+    def load_datas(self):
+        if self.args.get("appendonly"):
+            filename = self.args.get("appendfilename")
+            exists = os.path.exists(filename)
+            if exists:
+                self.load_aof(filename)
+            else:
+                self.load_snapshot()
+            self.aof = AppendOnlyFile(filename, self.args.get("appendfsync"))
+            if not exists and self.datas:
+                # 首次开启aof时用快照中的数据生成aof
+                tmp = "temp-rewriteaof-%d.aof" % os.getpid()
+                self.aof.start_rewrite()
+                rewrite(tmp, self.datas, self.expire_keys, self.type_names)
+                self.aof.finish_rewrite(tmp)
+        else:
+            self.load_snapshot()
+
+    def load_aof(self, filename):
+        self.logger.info("load datas from %s..." % filename)
+        start = time.time()
+        count, truncated = replay(filename, self.dispatch)
+        if truncated:
+            self.logger.warning(
+                "%s bytes of incomplete command at the end of %s truncated" % (
+                    truncated, filename))
+        seconds = time.time() - start
+        self.logger.info("%s commands loaded in %.3f seconds" % (
+            count, seconds))
+        self.load_stats = {"keys": len(self.datas), "commands": count,
+                           "bytes": os.path.getsize(filename),
+                           "seconds": seconds}
+
+    def load_snapshot(self):
+        if not os.path.exists(self.dbfilename):
+            return
+        if not is_snapshot(self.dbfilename):
+            return self.load_legacy_snapshot()
+        self.logger.info("load datas from %s..." % self.dbfilename)
+        progress = LoadProgress(self.logger, self.dbfilename)
+        with open(self.dbfilename, "rb") as stream:
+            reader = SnapshotReader(stream)
+            for record in reader:
+                self.load_record(*record)
+                progress.update(stream)
+            base_size = stream.tell()
+            segments = self.load_deltas(stream, progress)
+            self.snapshot_saved(
+                stream.tell(), base_size=base_size, segments=segments)
+        self.load_stats = progress.finish()
+
+    def load_deltas(self, stream, progress):
+        """
+        依次加载快照末尾的增量段，不完整或损坏的增量段(比如写入时宕机)会被截掉
+        :return: 加载的增量段数
+        """
+        segments = 0
+        while True:
+            start = stream.tell()
+            if not stream.read(1):
+                return segments
+            stream.seek(start)
+            try:
+                # 增量段只包含修改过的key，读完整个段后再加载，不会只加载一部分
+                reader = SnapshotReader(stream)
+                records = list(reader)
+            except SnapshotError as e:
+                self.logger.warning(
+                    "%s bytes of incomplete delta at the end of %s "
+                    "truncated: %s" % (
+                        os.path.getsize(self.dbfilename) - start,
+                        self.dbfilename, e))
+                os.truncate(self.dbfilename, start)
+                stream.seek(start)
+                return segments
+            for record in records:
+                self.load_record(*record)
+                progress.update(stream)
+            segments += 1
+
+    def load_record(self, type_name, key, expire, value):
+        if type_name == TOMBSTONE:
+            self.datas.pop(key, None)
+            self.expire_keys.pop(key, None)
+            return
+        cls = self.data_type.get(type_name)
+        if cls is None:
+            self.logger.error(
+                "skip key %s of unknown type %s" % (key, type_name))
+            return
+        self.datas[key] = cls.from_dump(self.logger, value)
+        if expire != -1:
+            self.expire_keys[key] = expire
+        else:
+            # 增量段中的值会覆盖之前的过期时间
+            self.expire_keys.pop(key, None)
+
+    def load_legacy_snapshot(self):
+        """旧版本使用分隔符的快照，值中包含分隔符时会解析错误"""
+        lines = open(
+            self.dbfilename, "rb").read().split(b"fdfsafafdsfsfdsfafdff")
+        if lines:
+            self.logger.info("load datas...")
+            for line in lines:
+                self.load(line)
 
     def load(self, line):
         # 加载数据类型
@@ -113,156 +334,592 @@ class RedisServer(object):
                                  (x.loads(val) if hasattr(x, "loads") else None)
                                  or y.loads(val),
                                  self.data_type.values())
-                if cls:
+                # 旧版本可能保存了空集合
+                if cls and (val or cls.keep_empty):
                     self.datas[key] = cls(self.logger, val)
                     if expire_time != b"-1":
-                        self.expire_keys[key] = int(expire_time)
+                        expire_time = int(expire_time)
+                        # 旧版本保存的是秒级时间戳
+                        if expire_time < 10 ** 11:
+                            expire_time *= 1000
+                        self.expire_keys[key] = expire_time
         except Exception:
             self.logger.error(traceback.format_exc())
 
-    def __getattr__(self, item):
-        cmd = getattr(self.redis_command, item, None)
-        if cmd:
-            return cmd
-        # 遍历所有数据类型，找到数据类型对应方法并返回
-        for k, v in self.data_type.items():
-            attr = getattr(v, item, None)
-            if attr:
-                return getattr(v.from_redis(self), item)
-        raise MethodNotExist
-
     def start(self):
         self.setup()
-        poll_thread = Thread(target=self.poll)
-        poll_thread.start()
         self.listen_request(self.host, self.port)
 
-    def poll(self):
-        """删除过期的Key, 删除空集合及持久化数据的守护线程"""
-        t = time.time()
-        while self.alive:
-            # 每30秒持久化一次数据
-            if time.time()-t > 30:
-                t = time.time()
-                self.persist()
-            for key in list(self.expire_keys.keys()):
-                if self.expire_keys[key] < time.time():
-                    del self.datas[key], self.expire_keys[key]
-            for key in [i for i in self.datas.keys()]:
-                if not self.datas[key].data:
-                    del self.datas[key]
-            time.sleep(1)
+    @staticmethod
+    def parse_save_params(rules):
+        """["900 1", "300 10"] -> [(900, 1), (300, 10)]，空字符串表示不保存"""
+        params = []
+        for rule in rules or []:
+            items = rule.split()
+            for i in range(0, len(items) - 1, 2):
+                params.append((int(items[i]), int(items[i + 1])))
+        return params
 
-    def listen_request(self, host, port):
-        """监听函数"""
+    def cron(self):
+        """检查后台保存的子进程是否结束，以及是否满足保存规则"""
+        self.stats.track_ops()
+        if self.child_pid:
+            self.check_child()
+        elif self.dirty and self.save_params:
+            now = time.time()
+            for seconds, changes in self.save_params:
+                if self.dirty >= changes and \
+                        now - self.lastsave >= seconds and \
+                        (self.lastbgsave_ok or now - self.lastbgsave_try >=
+                         self.bgsave_retry_delay):
+                    self.logger.info("%s changes in %s seconds. Saving..." % (
+                        changes, seconds))
+                    self.bgsave()
+                    break
+        if self.aof and not self.child_pid and self.need_rewrite_aof():
+            self.logger.info(
+                "Starting automatic rewriting of AOF on %s%% growth" %
+                self.args.get("auto_aof_rewrite_percentage"))
+            self.bgrewriteaof()
+        self.loop.call_later(self.cron_interval, self.cron)
+
+    def listen(self, host, port, protocol):
+        """创建监听socket，其接收的连接使用protocol协议"""
         self.logger.info("listen  to %s:%s"%(host, port))
         server = socket.socket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind((host, port))
-        server.listen(10)
-        self.r_lst[server] = None
-        # 若执行过程中出现异常r_lst中的server也被清掉，程序退出
+        server.listen(self.args.get("backlog", 511))
+        server.setblocking(False)
+        self.listeners[server] = protocol
+        self.loop.register(server, self.accept)
+        return server
+
+    def listen_request(self, host, port):
+        """监听函数"""
+        self.listen(host, port, LegacyProtocol)
+        if self.args.get("resp_port"):
+            # RESP协议监听在单独的端口上
+            self.listen(host, self.args["resp_port"], RespProtocol)
         try:
-            while self.alive and self.r_lst:
-                readable, writable, _ = select.select(
-                    self.r_lst.keys(), self.w_lst.keys(), [], 0.1)
-                for r in readable:
-                    self.recv(r, self.w_lst, self.r_lst, server)
-                for w in writable:
-                    self.send(w, self.w_lst, self.r_lst, None)
-        except select.error as e:
-            if e.args[0] != 4:
-                raise
+            while self.alive:
+                self.loop.run_once()
         finally:
-            self.persist()
-            # 只关r_list的即可
-            for i in self.r_lst.keys():
+            self.kill_child()
+            if self.aof:
+                self.aof.close()
+            if self.save_params:
+                self.persist()
+            for i in list(self.listeners) + list(self.connections):
                 try:
                     i.close()
                 except Exception:
                     pass
+            self.loop.close()
+
+    def accept(self, server, mask):
+        """每次唤醒时尽可能多的接收新连接"""
+        for _ in range(self.max_accepts):
+            try:
+                client, adr = server.accept()
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # 比如文件描述符耗尽，等待下次唤醒再试
+                self.logger.error(traceback.format_exc())
+                break
+            self.logger.debug("get connection from %s:%s", adr[0], adr[1])
+            # 将新收到的socket设置为非阻塞， 并将其保存在connections中
+            client.setblocking(0)
+            self.stats.connections += 1
+            self.connections[client] = Connection(
+                client, adr, self.listeners[server]())
+            self.loop.register(client, self.handle)
+
+    def handle(self, stream, mask):
+        """连接的读写事件"""
+        conn = self.connections[stream]
+        if mask & EVENT_READ:
+            self.recv(conn)
+        if mask & EVENT_WRITE and stream in self.connections:
+            self.send(conn)
+
+    def flush_replies(self):
+        """进入select前直接发送本轮产生的响应，发送不完整时才关注写事件"""
+        pending, self.pending_writes = self.pending_writes, {}
+        for conn in pending:
+            if conn.sock in self.connections:
+                self.send(conn)
+
+    def close_connection(self, conn):
+        self.pending_writes.pop(conn, None)
+        if self.connections.pop(conn.sock, None):
+            self.loop.unregister(conn.sock)
+            try:
+                conn.sock.close()
+            except Exception:
+                pass
 
     def persist(self, stream=None):
-        with self.lock:
-            with open("redis_data.db", "wb") as stream:
-                self.logger.info("persist datas...")
-                for key, val in self.datas.items():
-                    stream.write(key)
-                    stream.write(
-                        b'1qazxsw23edc%d' % self.expire_keys.get(key, -1))
-                    stream.write(b'1qazxsw23edc')
-                    val.persist(stream)
+        """同步保存，先写入临时文件再重命名，不会留下不完整的快照"""
+        self.logger.info("persist datas...")
+        tmp = "temp-%d.db" % os.getpid()
+        try:
+            with open(tmp, "wb", buffering=BUFFER_SIZE) as stream:
+                dump(stream, self.datas, self.expire_keys, self.type_names,
+                     self.args.get("rdbcompression") == "yes")
+                stream.flush()
+                os.fsync(stream.fileno())
+            os.replace(tmp, self.dbfilename)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.dirty = 0
+        self.lastsave = int(time.time())
+        if self.dirty_keys is not None:
+            self.dirty_keys.clear()
+            self.snapshot_saved(os.path.getsize(self.dbfilename))
+
+    def persist_delta(self, keys, size):
+        """
+        在快照末尾追加一个增量段，只保存keys当前的值，已删除的key写入删除标记
+        :param size: 快照文件的有效长度，之后的内容是保存失败留下的，直接截掉
+        """
+        self.logger.info("persist %s modified keys..." % len(keys))
+        with open(self.dbfilename, "r+b", buffering=BUFFER_SIZE) as stream:
+            stream.truncate(size)
+            stream.seek(size)
+            dump(stream, self.datas, self.expire_keys, self.type_names,
+                 self.args.get("rdbcompression") == "yes", keys=keys)
+            stream.flush()
+            os.fsync(stream.fileno())
+
+    def snapshot_saved(self, size, base_size=None, segments=0):
+        """
+        记录快照文件的状态，用于判断下次能否增量保存
+        :param base_size: 完整快照的长度，None表示整个文件都是完整的快照
+        """
+        self.snapshot_size = size
+        self.snapshot_base_size = size if base_size is None else base_size
+        self.snapshot_segments = segments
+
+    def need_full_save(self):
+        """增量段过多或总长度超过完整快照时合并成完整的快照"""
+        if self.snapshot_size is None or \
+                not os.path.exists(self.dbfilename) or \
+                os.path.getsize(self.dbfilename) < self.snapshot_size:
+            return True
+        return self.snapshot_segments >= self.args.get("snapshot_deltas") or \
+            self.snapshot_size - self.snapshot_base_size >= \
+            self.snapshot_base_size
+
+    def mark_dirty(self, key):
+        """key被修改或删除，下次增量保存时写入"""
+        if self.dirty_keys is not None:
+            self.dirty_keys.add(key)
+
+    def mark_all_dirty(self):
+        """所有数据都被清空，下次必须保存完整的快照"""
+        if self.dirty_keys is not None:
+            self.dirty_keys.clear()
+            self.snapshot_size = None
+
+    def bgsave(self):
+        """
+        fork子进程写入快照，子进程拥有fork时数据的一致副本(写时复制)，
+        不支持fork的系统上退化为同步保存，
+        开启增量快照时只保存修改过的key，必要时保存完整的快照
+        :return: 是否开始保存，已经有子进程在保存时返回False
+        """
+        if self.child_pid:
+            return False
+        if not hasattr(os, "fork"):
+            self.persist()
+            return True
+        self.lastbgsave_try = time.time()
+        self.dirty_before_bgsave = self.dirty
+        target = self.persist
+        if self.dirty_keys is not None:
+            # fork之后的修改留给下次保存
+            keys, self.dirty_keys = self.dirty_keys, set()
+            self.saving_keys = keys
+            self.saving_delta = not self.need_full_save()
+            if self.saving_delta:
+                size = self.snapshot_size
+                target = lambda: self.persist_delta(keys, size)
+        self.fork("rdb", target)
+        self.logger.info(
+            "Background saving started by pid %s" % self.child_pid)
+        return True
+
+    def bgrewriteaof(self):
+        """
+        fork子进程根据当前数据重写aof，期间的写指令同时保存在重写缓冲区中
+        :return: 是否开始重写
+        """
+        if self.child_pid or not self.aof:
+            return False
+        self.aof.start_rewrite()
+        self.fork("aof", lambda: rewrite(
+            "temp-rewriteaof-bg-%d.aof" % os.getpid(), self.datas,
+            self.expire_keys, self.type_names))
+        self.logger.info(
+            "Background append only file rewriting started by pid %s" %
+            self.child_pid)
+        return True
+
+    def need_rewrite_aof(self):
+        percentage = self.args.get("auto_aof_rewrite_percentage")
+        min_size = parse_size(self.args.get("auto_aof_rewrite_min_size"))
+        if not percentage or self.aof.size < min_size:
+            return False
+        base = self.aof.base_size or 1
+        return (self.aof.size - base) * 100 / base >= percentage
+
+    def fork(self, child_type, target):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                target()
+            except Exception:
+                self.logger.error(traceback.format_exc())
+                code = 1
+            finally:
+                os._exit(code)
+        self.child_pid = pid
+        self.child_type = child_type
+
+    def check_child(self, block=False):
+        pid, status = os.waitpid(self.child_pid, 0 if block else os.WNOHANG)
+        if not pid:
+            return
+        child_type = self.child_type
+        self.child_pid = self.child_type = None
+        ok = os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+        if child_type == "aof":
+            self.rewrite_aof_done(ok, pid, status)
+        else:
+            self.bgsave_done(ok, status)
+
+    def rewrite_aof_done(self, ok, pid, status):
+        tmp = "temp-rewriteaof-bg-%d.aof" % pid
+        if ok:
+            self.aof.finish_rewrite(tmp)
+            self.logger.info("Background AOF rewrite terminated with success")
+        else:
+            self.aof.abort_rewrite()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            self.logger.error(
+                "Background AOF rewrite error, status: %s" % status)
+
+    def bgsave_done(self, ok, status):
+        self.lastbgsave_ok = ok
+        if ok:
+            # 保存期间产生的修改留给下次保存
+            self.dirty -= self.dirty_before_bgsave
+            self.lastsave = int(time.time())
+            self.logger.info("Background saving terminated with success")
+        else:
+            self.logger.error(
+                "Background saving error, status: %s" % status)
+        if self.saving_keys is not None:
+            if ok:
+                size = os.path.getsize(self.dbfilename)
+                if self.saving_delta:
+                    self.snapshot_saved(size, self.snapshot_base_size,
+                                        self.snapshot_segments + 1)
+                else:
+                    self.snapshot_saved(size)
+            else:
+                self.dirty_keys |= self.saving_keys
+            self.saving_keys = None
+
+    def kill_child(self):
+        """关闭时不等待后台保存，直接杀死子进程"""
+        pid = self.child_pid
+        if pid:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+            self.check_child(block=True)
+            # 被杀死的子进程会留下临时文件
+            for tmp in ("temp-%d.db" % pid, "temp-rewriteaof-bg-%d.aof" % pid):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
 
     @stream_wrapper
-    def send(self, w, w_lst, r_lst, server):
-        # item会被保存在w_lst相应的val中
-        item = w_lst[w]
-        self.logger.debug(
-            "start to send item %s to %s:%s" % (item, r_lst[w][0], r_lst[w][1]))
-        w.send(item)
+    def send(self, conn):
+        pending = conn.pending
+        done = conn.write()
+        self.stats.net_output_bytes += pending - conn.pending
+        if done and (conn.keep in (b"", b"0") or conn.eof):
+            # keep-alive为空或对端已关闭写端时，发送完响应后关闭连接
+            self.close_connection(conn)
+        elif not done and conn.over_limit(*self.output_limits):
+            self.logger.warning(
+                "close %s for overcoming output buffer limits, "
+                "%s bytes pending" % (conn, conn.pending))
+            self.close_connection(conn)
+        else:
+            self.loop.set_writable(conn.sock, not done)
 
     @stream_wrapper
-    def recv(self, r, w_lst, r_lst, server):
-        if r is server:
-            client, adr = r.accept()
-            self.logger.debug("get connection from %s:%s" % (adr[0], adr[1]))
-            # 将新收到的socket设置为非阻塞， 并将其保存在r_lst中
-            client.setblocking(0)
-            r_lst[client] = adr
+    def recv(self, conn):
+        received = conn.read()
+        self.stats.net_input_bytes += len(received)
+        protocol = conn.protocol
+        if protocol.negotiable:
+            # 只有连接开头的数据可以握手，握手报文可能分多次到达
+            received = conn.greeting + received
+            if partial_hello(received) and not conn.eof:
+                conn.greeting = received
+                return
+            conn.greeting = b""
+            protocol.negotiable = False
+            negotiated = negotiate(received)
+            if negotiated:
+                # 切换到二进制协议，并回复握手报文
+                protocol, greeting, received = negotiated
+                conn.protocol = protocol
+                conn.queue(greeting)
+        # 解析出所有完整的请求，按顺序执行并保存响应
+        self.current_client = conn
+        requests = protocol.feed(received)
+        if conn.eof:
+            requests += protocol.feed_eof()
+        if self.tracer.sample:
+            self.tracer.execute(self, conn, requests)
         else:
-            self.logger.debug(
-                "start to recv data from %s:%s" % (r_lst[r][0], r_lst[r][1]))
-            received = self._recv(r)
-            if received:
-                cmd, data, keep = received.split(b"#-*-#")
-                cmd = cmd.decode("utf-8")
-                key, val = data.split(b"<->")
-                # 根据指令生成item返回结果
-                try:
-                    method = getattr(self.datas.get(key, None), cmd, None) \
-                             or getattr(self, cmd)
-                    # 数据类型的方法
-                    if method and key in self.datas and method.__self__ != self.redis_command \
-                            and self.datas[key].__class__ != \
-                                    method.__self__.__class__:
-                        # 类型不符合
-                        item = b"503#-*-#Type Not Format#-*-#\r\n\r\n"
-                    else:
-                        item = method(key, val, self)
-                    # else:
-                    #     # 通用方法
-                    #     item = getattr(self, cmd)(key, val, self)
-                except MethodNotExist:
-                    item = b"404#-*-#Method Not Found#-*-#\r\n\r\n"
-                # 将socket保存在w_lst中，并将keep-alive 标志保存在其val中
-                w_lst[r] = item
-                r_lst[r] = r_lst[r][:2] + (keep,)
-            else:
+            for request in requests:
+                conn.queue(protocol.execute(self, request))
+        self.current_client = None
+        if conn.eof:
+            if not conn.replies:
                 raise ClientClosed("closed")
+            # 发送完剩余的响应后关闭连接
+            self.loop.stop_reading(conn.sock)
+        if conn.replies:
+            if conn.over_limit(*self.output_limits):
+                self.logger.warning(
+                    "close %s for overcoming output buffer limits, "
+                    "%s bytes pending" % (conn, conn.pending))
+                self.close_connection(conn)
+            else:
+                self.pending_writes[conn] = True
 
-    def _recv(self, r):
-        msg = b""
-        try:
-            buf = r.recv(1024)
-            while buf:
-                msg += buf
-                buf = r.recv(1024)
-        except Exception as e:
-            # 非阻塞异常直接返回
-            if e.args[0] != errno.EAGAIN:
-                pass
-        self.logger.debug("received massage is %s" % (msg or None))
-        return msg
+    def dispatch(self, cmd, key, val):
+        """根据指令生成响应，并记录指令的调用次数及耗时"""
+        command = self.commands.get(cmd)
+        if command is None:
+            return format_response(b"404", b"Method Not Found", b"")
+        stats = command.stats
+        # 读取时钟的代价比其它统计高得多，直方图只记录每latency_sample次调用中的一次
+        sampled = not stats.calls % self.latency_sample
+        start = perf_counter_ns() if sampled or self.time_calls else 0
+        stats.calls += 1
+        if command.key and key in self.expire_keys:
+            self.expire_if_needed(key)
+        if self.maxmemory and command.write and \
+                self.datas.used_memory > self.maxmemory and \
+                not self.loading and not self.free_memory() and \
+                cmd not in ("delete", "flushall"):
+            response = format_response(b"503", OOM_ERROR, b"")
+        elif command.owner is None:
+            response = command.handlers[None](
+                self.redis_command, key, val, self)
+        else:
+            store = self.datas.get(key)
+            if store is None:
+                # 读指令命中的次数由调用次数减去未命中的次数得到
+                if not command.write:
+                    self.stats.keyspace_misses += 1
+                # key不存在时使用指令所属的数据类型新建
+                store = command.owner.from_redis(self)
+                func = command.handlers[command.owner]
+            else:
+                func = command.handlers.get(store.__class__)
+            if func is None:
+                # 类型不符合
+                response = format_response(b"503", b"Type Not Format", b"")
+            else:
+                if self.evictor is not None:
+                    self.evictor.touch(store)
+                response = func(store, key, val, self)
+        if command.write and response[0] == b"200":
+            self.dirty += 1
+            if self.aof:
+                self.propagate(cmd, key, val)
+        # 统计直接写在这里，不增加函数调用，耗时小于LINEAR_MAX微秒时不需要计算桶
+        if response[0] == b"503":
+            stats.failed += 1
+        if start:
+            usec = (perf_counter_ns() - start) // 1000
+            if sampled:
+                stats.usec += usec
+                stats.total += 1
+                stats.counts[
+                    usec if usec < LINEAR_MAX else bucket_index(usec)] += 1
+            if usec >= self.slowlog.slower_than:
+                self.slowlog.record(cmd, key, val, usec, self.current_client)
+        return response
+
+    def count_missing(self, cmd):
+        """key不存在时协议直接回复，没有经过dispatch的指令也计入统计"""
+        command = self.commands[cmd]
+        command.stats.calls += 1
+        if not command.write:
+            self.stats.keyspace_misses += 1
+
+    def propagate(self, cmd, key, val):
+        """将写指令追加到aof，相对的过期时间转换成绝对时间，使重放的结果不变"""
+        if cmd == "set" and isinstance(val, tuple):
+            self.aof.feed(cmd, key, val[0])
+            cmd = "pexpireat"
+        if cmd in ("expire", "pexpire", "expireat", "pexpireat"):
+            when = self.expire_keys.get(key)
+            if when is not None:
+                self.aof.feed("pexpireat", key, b"%d" % when)
+        else:
+            self.aof.feed(cmd, key, val)
+
+    def flush_aof(self):
+        if self.aof:
+            self.aof.flush()
+
+    def remove_key(self, key):
+        """过期或淘汰时删除key，并作为一次修改写入aof"""
+        self.datas.pop(key, None)
+        self.expire_keys.pop(key, None)
+        self.dirty += 1
+        self.mark_dirty(key)
+        if self.aof:
+            self.aof.feed("delete", key, b"")
+
+    def expire_if_needed(self, key):
+        """惰性删除，访问key时发现已过期则直接删除"""
+        if self.expire_keys.is_expired(key):
+            self.remove_key(key)
+            self.stats.expired_keys += 1
+
+    def active_expire(self):
+        """定时从过期时间堆中删除已过期的key，每次最多占用expire_budget秒"""
+        deadline = time.monotonic() + self.expire_budget
+        for key in self.expire_keys.pop_expired(now_ms(), deadline):
+            self.remove_key(key)
+            self.stats.expired_keys += 1
+        self.loop.call_later(self.expire_interval, self.active_expire)
+
+    def reset_stats(self):
+        self.stats.reset()
+        self.evicted_keys = 0
+
+    def free_memory(self):
+        """
+        按淘汰策略删除key直到内存占用不超过maxmemory
+        :return: 是否已经不超过maxmemory
+        """
+        while self.datas.used_memory > self.maxmemory:
+            key = self.evictor.pick()
+            if key is None:
+                return False
+            self.remove_key(key)
+            self.evicted_keys += 1
+        return True
 
     def parse_args(self):
         parser = ArgumentParser()
         parser.add_argument("--host", help="host", default="127.0.0.1")
         parser.add_argument("-p", "--port", type=int, help="port", default=6379)
+        parser.add_argument(
+            "--resp-port", type=int,
+            help="port speaking RESP2 for standard redis clients. ")
+        parser.add_argument(
+            "--backlog", type=int, default=511, help="listen backlog. ")
+        parser.add_argument(
+            "--client-output-buffer-limit", nargs=3,
+            metavar=("HARD", "SOFT", "SOFT_SECONDS"),
+            default=["256mb", "64mb", "60"],
+            help="close clients whose pending output exceeds HARD bytes, or "
+                 "stays above SOFT bytes for SOFT_SECONDS, 0 to disable. ")
+        parser.add_argument(
+            "--save", nargs="*", default=["3600 1", "300 100", "60 10000"],
+            help="save the dataset in background after SECONDS if at least "
+                 "CHANGES writes happened, each rule as \"SECONDS CHANGES\", "
+                 "pass --save \"\" to disable. ")
+        parser.add_argument(
+            "--snapshot-deltas", type=int, default=0,
+            help="save only the keys modified since the last save, appended "
+                 "to the snapshot as delta segments, and merge them into a "
+                 "full snapshot after this many deltas, 0 to always save "
+                 "the full dataset. ")
+        parser.add_argument(
+            "--maxmemory", default="0",
+            help="evict keys by --maxmemory-policy when the estimated memory "
+                 "used by the dataset exceeds this size, e.g. 100mb, "
+                 "0 for no limit. ")
+        parser.add_argument(
+            "--maxmemory-policy", default="noeviction", choices=POLICIES,
+            help="noeviction rejects write commands with an OOM error "
+                 "instead of evicting keys. ")
+        parser.add_argument(
+            "--maxmemory-samples", type=int, default=5,
+            help="number of keys sampled by the approximated LRU/LFU. ")
+        encodings = parser.add_argument_group(
+            "encodings", "small hashes, sets and lists use compact encodings "
+                         "until they have more entries or longer values "
+                         "than these limits. ")
+        for name, default in (("hash-max-listpack-entries", 128),
+                              ("hash-max-listpack-value", 64),
+                              ("set-max-intset-entries", 512),
+                              ("set-max-listpack-entries", 128),
+                              ("set-max-listpack-value", 64),
+                              ("list-max-listpack-entries", 128),
+                              ("list-max-listpack-value", 64)):
+            encodings.add_argument("--" + name, type=int, default=default)
+        parser.add_argument(
+            "--latency-sample", type=positive_int, default=16,
+            help="record one in this many calls of each command in the "
+                 "latency percentiles of INFO, 1 to record every call. ")
+        parser.add_argument(
+            "--slowlog-log-slower-than", type=int, default=10000,
+            help="log commands taking at least this many microseconds to "
+                 "the slow log, every call is timed while it is enabled, "
+                 "a negative value disables it. ")
+        parser.add_argument(
+            "--slowlog-max-len", type=int, default=128,
+            help="number of entries kept in the slow log. ")
+        parser.add_argument(
+            "--rdbcompression", default="yes", choices=["yes", "no"],
+            help="compress snapshot blocks with zlib. ")
+        parser.add_argument(
+            "--appendonly", action="store_true",
+            help="log every write command to the append only file, "
+                 "which is loaded instead of the snapshot on startup. ")
+        parser.add_argument("--appendfilename", default="appendonly.aof")
+        parser.add_argument(
+            "--appendfsync", default="everysec", choices=FSYNC_POLICIES)
+        parser.add_argument(
+            "--auto-aof-rewrite-percentage", type=int, default=100,
+            help="rewrite the append only file when it grows by this "
+                 "percentage since the last rewrite, 0 to disable. ")
+        parser.add_argument("--auto-aof-rewrite-min-size", default="64mb")
         parser.add_argument(
             "-lf", "--log-file", action="store_true",
             help="log to file, else log to stdout. ")
         parser.add_argument("-ld", "--log-dir", default=".")
         parser.add_argument(
-            "-ll", "--log-level", default="DEBUG",
+            "--trace-sample", type=int,
+            help="log one in this many requests with its command, sizes and "
+                 "duration, 0 to disable, defaults to every request at the "
+                 "DEBUG log level and none otherwise. ")
+        parser.add_argument(
+            "-ll", "--log-level", default="INFO",
             choices=["DEBUG", "INFO", "WARN", "ERROR", "CRITICAL"])
         parser.add_argument(
             "--log-format",
@@ -0,0 +1,498 @@
+# -*- coding:utf-8 -*-
+"""
+RESP2协议，使标准redis客户端及redis-benchmark可以直接访问服务端
+请求是bulk string数组(或inline指令)，根据COMMANDS中的配置转换成
+现有数据类型方法所需的(key, val)，并将其响应转换成带类型的RESP回复
+"""
+import pickle
+
+from .protocols import Protocol
+from .utils import to_bytes, format_score
+
+
+class Status(bytes):
+    """简单字符串回复"""
+
+
+class Error(bytes):
+    """错误回复"""
+
+
+class ArgumentError(Exception):
+    """参数错误，args[0]为错误回复"""
+
+
+OK = Status(b"OK")
+NOTSET = object()
+TYPE_NAMES = {b"str": b"string"}
+# SCAN的TYPE选项使用redis的类型名
+SCAN_TYPES = dict((name, type_) for type_, name in TYPE_NAMES.items())
+
+
+def encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Status):
+        return b"+%s\r\n" % value
+    if isinstance(value, Error):
+        return b"-%s\r\n" % value
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n%s" % (
+            len(value), b"".join(encode(item) for item in value))
+    value = to_bytes(value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def key_value(argv):
+    return argv[1], argv[2] if len(argv) > 2 else b""
+
+
+def no_key(argv):
+    return b"", argv[1] if len(argv) > 1 else b""
+
+
+def bulk(data, argv):
+    return data
+
+
+def ok(data, argv):
+    return OK
+
+
+def integer(data, argv):
+    return int(data)
+
+
+def unpickle(data, argv):
+    return pickle.loads(data)
+
+
+def flatten(data, argv):
+    return [item for pair in pickle.loads(data).items() for item in pair]
+
+
+def scored_items(items):
+    """有序集合的成员列表，(成员, 分数)展开成成员及分数的字符串"""
+    reply = []
+    for item in items:
+        if isinstance(item, tuple):
+            reply.append(item[0])
+            reply.append(format_score(item[1]))
+        else:
+            reply.append(item)
+    return reply
+
+
+def scored(data, argv):
+    return scored_items(pickle.loads(data))
+
+
+def cursor_reply(convert):
+    """SCAN系列的回复：[cursor, 元素列表]"""
+    def reply(data, argv):
+        cursor, items = pickle.loads(data)
+        return [b"%d" % cursor, convert(items)]
+    return reply
+
+
+def decode(field):
+    return field.decode("utf-8")
+
+
+def set_args(argv):
+    """SET key value [EX seconds|PX milliseconds]"""
+    if len(argv) == 3:
+        return argv[1], argv[2]
+    option = argv[3].lower()
+    if len(argv) != 5 or option not in (b"ex", b"px"):
+        raise ArgumentError(b"ERR syntax error")
+    return argv[1], (argv[2], expire_ms(argv[4], option == b"ex", b"set"))
+
+
+def pairs(argv, start, name):
+    """MSET、ZADD等成对出现的参数"""
+    if (len(argv) - start) % 2:
+        raise ArgumentError(
+            b"ERR wrong number of arguments for '%s' command" % name)
+    return argv[start:]
+
+
+def withscores(options):
+    if not options:
+        return False
+    if len(options) == 1 and options[0].lower() == b"withscores":
+        return True
+    raise ArgumentError(b"ERR syntax error")
+
+
+def zrange_args(argv):
+    """ZRANGE key start stop [WITHSCORES]"""
+    return argv[1], [int(argv[2]), int(argv[3]), withscores(argv[4:])]
+
+
+def zrangebyscore_args(argv):
+    """ZRANGEBYSCORE key min max [WITHSCORES] [LIMIT offset count]"""
+    scores, offset, count = False, 0, -1
+    options = argv[4:]
+    i = 0
+    while i < len(options):
+        option = options[i].lower()
+        if option == b"withscores":
+            scores = True
+            i += 1
+        elif option == b"limit" and i + 2 < len(options):
+            offset, count = int(options[i + 1]), int(options[i + 2])
+            i += 3
+        else:
+            raise ArgumentError(b"ERR syntax error")
+    return argv[1], [argv[2], argv[3], scores, offset, count]
+
+
+def scan_options(options, names):
+    """SCAN系列的[MATCH pattern] [COUNT count]等选项，:return: 按names排列的值"""
+    values = dict.fromkeys(names)
+    if len(options) % 2:
+        raise ArgumentError(b"ERR syntax error")
+    for i in range(0, len(options), 2):
+        name = options[i].lower()
+        if name not in values:
+            raise ArgumentError(b"ERR syntax error")
+        values[name] = options[i + 1]
+    if values[b"count"] is not None and int(values[b"count"]) < 1:
+        raise ArgumentError(b"ERR syntax error")
+    return [values[name] for name in names]
+
+
+def scan_args(argv):
+    """SCAN cursor [MATCH pattern] [COUNT count] [TYPE type]"""
+    pattern, count, type_name = scan_options(
+        argv[2:], (b"match", b"count", b"type"))
+    if type_name is not None:
+        type_name = type_name.lower()
+        type_name = SCAN_TYPES.get(type_name, type_name)
+    return b"%d" % int(argv[1]), [pattern, count, type_name]
+
+
+def member_scan_args(argv):
+    """HSCAN、SSCAN、ZSCAN key cursor [MATCH pattern] [COUNT count]"""
+    return argv[1], [int(argv[2])] + scan_options(
+        argv[3:], (b"match", b"count"))
+
+
+def expire_ms(value, seconds, name):
+    ms = int(value) * (1000 if seconds else 1)
+    if ms <= 0:
+        raise ArgumentError(
+            b"ERR invalid expire time in '%s' command" % name)
+    return ms
+
+
+def command_args(argv):
+    """COMMAND [COUNT|INFO name...|DOCS]，INFO的指令名转换成内部方法名"""
+    sub = argv[1].lower() if len(argv) > 1 else b""
+    names = [decode(name).lower() for name in argv[2:]]
+    return sub, [COMMANDS[name].cmd if name in COMMANDS else name
+                 for name in names]
+
+
+def command_reply(data, argv):
+    sub = argv[1].lower() if len(argv) > 1 else b""
+    if sub == b"count":
+        return len(RESP_NAMES)
+    if sub == b"docs":
+        return []
+    infos = []
+    for info in pickle.loads(data):
+        if info is None or info[0] not in RESP_NAMES:
+            # 没有对应RESP指令的内部方法只在INFO中占位
+            if sub == b"info":
+                infos.append(None)
+            continue
+        name, arity, flags, first, last, step = info
+        infos.append([RESP_NAMES[name], arity,
+                      [Status(to_bytes(flag)) for flag in flags],
+                      first, last, step])
+    return infos
+
+
+def slowlog_reply(data, argv):
+    """
+    SLOWLOG GET的每条记录：[id, 时间戳, 耗时, [指令名, key, 参数大小], 客户端地址, 客户端名]
+    """
+    sub = argv[1].lower()
+    if sub == b"len":
+        return int(data)
+    if sub == b"reset":
+        return OK
+    entries = []
+    for id_, timestamp, usec, cmd, key, size, client in pickle.loads(data):
+        args = [RESP_NAMES.get(cmd, cmd)]
+        if key:
+            args.append(key)
+        if size:
+            args.append(b"(%d bytes)" % size)
+        entries.append([id_, timestamp, usec, args, client, b""])
+    return entries
+
+
+class RespCommand(object):
+    """
+    RESP指令到内部方法的映射
+    :param cmd: 内部方法名，参数个数等元信息来自服务端的指令表
+    :param args: 将参数数组转换成(key, val)
+    :param reply: 将内部方法的响应数据转换成回复
+    :param missing: key不存在时直接返回的回复，可以是函数
+    """
+    def __init__(self, cmd, args=key_value, reply=bulk, missing=NOTSET):
+        self.cmd = cmd
+        self.args = args
+        self.reply = reply
+        self.missing = missing
+
+
+def check_arity(arity, argv):
+    if arity < 0:
+        return len(argv) >= -arity
+    return len(argv) == arity
+
+
+COMMANDS = {
+    "ping": RespCommand(
+        "ping", no_key,
+        lambda data, argv: Status(data) if len(argv) == 1 else data),
+    "echo": RespCommand("echo", no_key),
+    "select": RespCommand("select", no_key, ok),
+    "keys": RespCommand("keys", lambda argv: (argv[1], b""), unpickle),
+    "scan": RespCommand("scan", scan_args, cursor_reply(list)),
+    "type": RespCommand(
+        "type", reply=lambda data, argv: Status(TYPE_NAMES.get(data, data)),
+        missing=Status(b"none")),
+    "del": RespCommand(
+        "delete", lambda argv: (argv[1], argv[2:]), integer),
+    "mget": RespCommand("mget", lambda argv: (b"", argv[1:]), unpickle),
+    "mset": RespCommand(
+        "mset", lambda argv: (b"", pairs(argv, 1, b"mset")), ok),
+    "expire": RespCommand("expire", reply=lambda data, argv: 1, missing=0),
+    "pexpire": RespCommand("pexpire", reply=lambda data, argv: 1, missing=0),
+    "expireat": RespCommand(
+        "expireat", reply=lambda data, argv: 1, missing=0),
+    "pexpireat": RespCommand(
+        "pexpireat", reply=lambda data, argv: 1, missing=0),
+    "ttl": RespCommand("ttl", reply=integer, missing=-2),
+    "pttl": RespCommand("pttl", reply=integer, missing=-2),
+    "flushall": RespCommand("flushall", lambda argv: (b"", b""), ok),
+    "set": RespCommand("set", set_args, ok),
+    "setex": RespCommand("set", lambda argv: (
+        argv[1], (argv[3], expire_ms(argv[2], True, b"setex"))), ok),
+    "psetex": RespCommand("set", lambda argv: (
+        argv[1], (argv[3], expire_ms(argv[2], False, b"psetex"))), ok),
+    "get": RespCommand("get", missing=None),
+    "hset": RespCommand(
+        "hset", lambda argv: (argv[1], dict(
+            (decode(argv[i]), argv[i + 1]) for i in range(2, len(argv), 2))),
+        integer),
+    "hget": RespCommand("hget", missing=None),
+    "hmset": RespCommand(
+        "hmset", lambda argv: (argv[1], dict(
+            (decode(argv[i]), argv[i + 1]) for i in range(2, len(argv), 2))),
+        ok),
+    "hmget": RespCommand(
+        "hmget", lambda argv: (argv[1], [decode(i) for i in argv[2:]]),
+        lambda data, argv: [
+            pickle.loads(data).get(decode(i)) for i in argv[2:]],
+        lambda argv: [None] * (len(argv) - 2)),
+    "hgetall": RespCommand("hgetall", reply=flatten, missing=[]),
+    "hincrby": RespCommand(
+        "hincrby",
+        lambda argv: (argv[1], {decode(argv[2]): int(argv[3])}), integer),
+    "hscan": RespCommand(
+        "hscan", member_scan_args, cursor_reply(
+            lambda items: [item for pair in items for item in pair]),
+        [b"0", []]),
+    "zadd": RespCommand(
+        "zadd", lambda argv: (argv[1], pairs(argv, 2, b"zadd")), integer),
+    "zpop": RespCommand(
+        "zpop", reply=lambda data, argv: (
+            lambda item: list(item) if isinstance(item, tuple) else item)(
+            pickle.loads(data)),
+        missing=None),
+    "zpopmin": RespCommand(
+        "zpopmin", lambda argv: (argv[1], int(argv[2]) if len(argv) > 2
+                                 else 1), scored, []),
+    "zpopmax": RespCommand(
+        "zpopmax", lambda argv: (argv[1], int(argv[2]) if len(argv) > 2
+                                 else 1), scored, []),
+    "zcard": RespCommand("zcard", reply=integer, missing=0),
+    "zrem": RespCommand(
+        "zrem", lambda argv: (argv[1], argv[2:]), integer, 0),
+    "zscore": RespCommand("zscore", missing=None),
+    "zrank": RespCommand("zrank", reply=integer, missing=None),
+    "zrevrank": RespCommand("zrevrank", reply=integer, missing=None),
+    "zcount": RespCommand(
+        "zcount", lambda argv: (argv[1], argv[2:]), integer, 0),
+    "zincrby": RespCommand(
+        "zincrby", lambda argv: (argv[1], [argv[2], argv[3]])),
+    "zrange": RespCommand("zrange", zrange_args, scored, []),
+    "zrevrange": RespCommand("zrevrange", zrange_args, scored, []),
+    "zrangebyscore": RespCommand(
+        "zrangebyscore", zrangebyscore_args, scored, []),
+    "zrevrangebyscore": RespCommand(
+        "zrevrangebyscore", zrangebyscore_args, scored, []),
+    "zscan": RespCommand(
+        "zscan", member_scan_args, cursor_reply(scored_items), [b"0", []]),
+    "lpop": RespCommand("lpop", missing=None),
+    "rpop": RespCommand("rpop", missing=None),
+    "lpush": RespCommand(
+        "lpush", lambda argv: (argv[1], argv[2:]), integer),
+    "rpush": RespCommand(
+        "rpush", lambda argv: (argv[1], argv[2:]), integer),
+    "llen": RespCommand("llen", reply=integer, missing=0),
+    "lrange": RespCommand(
+        "lrange", lambda argv: (argv[1], [int(argv[2]), int(argv[3])]),
+        unpickle, []),
+    "lindex": RespCommand(
+        "lindex", lambda argv: (argv[1], int(argv[2])), missing=None),
+    "ltrim": RespCommand(
+        "ltrim", lambda argv: (argv[1], [int(argv[2]), int(argv[3])]), ok,
+        OK),
+    "lrem": RespCommand(
+        "lrem", lambda argv: (argv[1], [int(argv[2]), argv[3]]), integer, 0),
+    "sadd": RespCommand(
+        "sadd", lambda argv: (argv[1], argv[2:]), integer),
+    "srem": RespCommand(
+        "srem", lambda argv: (argv[1], argv[2:]), integer, 0),
+    "scard": RespCommand("scard", reply=integer, missing=0),
+    "smembers": RespCommand("smembers", reply=unpickle, missing=[]),
+    "sismember": RespCommand(
+        "sismember", reply=lambda data, argv: int(data == b"True"),
+        missing=0),
+    "srandmember": RespCommand("srchoice", missing=None),
+    "sscan": RespCommand(
+        "sscan", member_scan_args, cursor_reply(list), [b"0", []]),
+    "save": RespCommand("save", no_key, ok),
+    "bgsave": RespCommand(
+        "bgsave", no_key,
+        lambda data, argv: Status(b"Background saving started")),
+    "lastsave": RespCommand("lastsave", no_key, integer),
+    "bgrewriteaof": RespCommand(
+        "bgrewriteaof", no_key,
+        lambda data, argv: Status(
+            b"Background append only file rewriting started")),
+    "info": RespCommand("info", lambda argv: (b"", argv[1:])),
+    "config": RespCommand(
+        "config", lambda argv: (argv[1], argv[2:]), ok),
+    "slowlog": RespCommand(
+        "slowlog", lambda argv: (argv[1], argv[2] if len(argv) > 2 else b""),
+        slowlog_reply),
+    "command": RespCommand("command", command_args, command_reply),
+}
+# 内部方法名到RESP指令名的映射，setex等别名不覆盖原指令名
+RESP_NAMES = dict(
+    (spec.cmd, name) for name, spec in reversed(list(COMMANDS.items())))
+
+
+class RespProtocol(Protocol):
+    """RESP2协议"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, msg):
+        self.buffer += msg
+        requests = []
+        offset = 0
+        while offset < len(self.buffer):
+            argv, offset = self.parse(self.buffer, offset)
+            if argv is None:
+                break
+            if argv:
+                requests.append(argv)
+        del self.buffer[:offset]
+        return requests
+
+    @staticmethod
+    def parse(buf, offset):
+        """
+        解析一个完整的请求
+        :return: (参数数组, 新的offset)，数据不完整时返回(None, offset)
+        """
+        end = buf.find(b"\r\n", offset)
+        if end < 0:
+            return None, offset
+        if buf[offset] != ord("*"):
+            # inline指令
+            return [bytes(arg) for arg in buf[offset: end].split()], end + 2
+        argv = []
+        pos = end + 2
+        for _ in range(int(buf[offset + 1: end])):
+            end = buf.find(b"\r\n", pos)
+            if end < 0:
+                return None, offset
+            if buf[pos] != ord("$"):
+                raise ValueError("Protocol error: expected '$'")
+            start = end + 2
+            pos = start + int(buf[pos + 1: end])
+            if len(buf) < pos + 2:
+                return None, offset
+            argv.append(bytes(buf[start: pos]))
+            pos += 2
+        return argv, pos
+
+    def execute(self, server, argv):
+        name = argv[0].decode("utf-8", "replace").lower()
+        if name == "quit":
+            self.keep = b""
+            return encode(OK)
+        if name == "hello":
+            return encode(self.hello(argv))
+        spec = COMMANDS.get(name)
+        command = spec and server.commands.get(spec.cmd)
+        if command is None:
+            return encode(Error(b"ERR unknown command '%s'" % argv[0]))
+        if not check_arity(command.arity, argv):
+            return encode(Error(
+                b"ERR wrong number of arguments for '%s' command" % argv[0]))
+        return encode(self.call(server, spec, argv))
+
+    @staticmethod
+    def hello(argv):
+        """只支持RESP2，客户端要求RESP3时回复NOPROTO"""
+        if len(argv) > 1 and argv[1] != b"2":
+            return Error(b"NOPROTO unsupported protocol version")
+        return [b"server", b"custom_redis", b"proto", 2,
+                b"mode", b"standalone", b"role", b"master", b"modules", []]
+
+    @staticmethod
+    def call(server, spec, argv):
+        if spec.missing is not NOTSET:
+            # 与dispatch一样先惰性删除已过期的key
+            if argv[1] in server.expire_keys:
+                server.expire_if_needed(argv[1])
+            if argv[1] not in server.datas:
+                server.count_missing(spec.cmd)
+                return spec.missing(argv) if callable(spec.missing) \
+                    else spec.missing
+        try:
+            key, val = spec.args(argv)
+        except ArgumentError as e:
+            return Error(e.args[0])
+        except IndexError:
+            return Error(
+                b"ERR wrong number of arguments for '%s' command" % argv[0])
+        except ValueError:
+            return Error(b"ERR value is not an integer or out of range")
+        code, info, data = server.dispatch(spec.cmd, key, val)
+        if code == b"200":
+            return spec.reply(data, argv)
+        elif code == b"502":
+            return None
+        elif code == b"404":
+            return Error(b"ERR unknown command '%s'" % argv[0])
+        elif info.startswith(b"OOM "):
+            return Error(info)
+        elif info == b"Type Not Format":
+            return Error(b"WRONGTYPE Operation against a key holding "
+                         b"the wrong kind of value")
+        return Error(b"ERR " + info.replace(b"\r", b" ").replace(b"\n", b" "))
@@ -0,0 +1,60 @@
+# -*- coding:utf-8 -*-
+"""
+SLOWLOG，记录耗时超过阈值的指令
+单线程的事件循环执行慢指令(比如大hash的hgetall、大量key时的keys *)时所有客户端都要等待，
+dispatch对每次调用计时，超过slower_than微秒时记录到固定长度的环形缓冲区中，
+只记录参数的大小，不保存参数本身
+"""
+import time
+
+from collections import deque
+
+
+def arg_size(value):
+    """参数的大小(字节数)，容器类型为所有元素的大小之和"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(arg_size(k) + arg_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(arg_size(item) for item in value)
+    if value is None:
+        return 0
+    return len(str(value))
+
+
+class SlowLog(object):
+    """
+    :param slower_than: 阈值(微秒)，负数代表不记录
+    :param max_len: 最多保留的记录数，超过时丢弃最早的
+    """
+    def __init__(self, slower_than=10000, max_len=128):
+        self.slower_than = slower_than if slower_than >= 0 else float("inf")
+        self.entries = deque(maxlen=max_len)
+        # 每条记录的唯一id，reset后也不重复
+        self.next_id = 0
+
+    @property
+    def enabled(self):
+        return self.slower_than != float("inf")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, cmd, key, val, usec, client=None):
+        """
+        :return: 记录项(id, 时间戳, 耗时微秒, 指令名, key, 参数大小, 客户端地址)
+        """
+        entry = (self.next_id, int(time.time()), usec, cmd, key,
+                 arg_size(val), str(client) if client else "")
+        self.next_id += 1
+        self.entries.appendleft(entry)
+        return entry
+
+    def get(self, count=10):
+        """:return: 最新的count条记录，count为负数时返回全部"""
+        entries = list(self.entries)
+        return entries if count < 0 else entries[:count]
+
+    def reset(self):
+        self.entries.clear()
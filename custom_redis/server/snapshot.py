@@ -0,0 +1,187 @@
+# -*- coding:utf-8 -*-
+"""
+快照文件格式(版本2)
+    MAGIC + 版本号
+    类型表：!H(类型数) + 每个类型 !H(名称长度) + 名称
+    若干块：!BII(标志, 原始长度, 保存长度) + 数据 + !I(数据的crc32)，
+            标志位COMPRESSED表示数据经过zlib压缩，原始长度为0的块表示结束
+    块中的记录：类型序号(1字节) + varint(key长度) + varint(过期时间+1，0表示不过期)
+                + varint(值长度) + key + 值，值由各数据类型的encode编码
+每条记录都有类型标记和长度前缀，加载时逐块流式读取，
+内存中最多只有一个块，值中包含任何字节都不会影响解析
+
+增量保存时在文件末尾追加增量段，格式与完整的快照相同，只包含上次保存后修改过的key，
+被删除的key使用类型名为TOMBSTONE的记录，加载时依次用增量段覆盖之前的数据
+"""
+import os
+import time
+import zlib
+import struct
+
+from .encoding import pack_varint, unpack_varint
+
+SNAPSHOT_MAGIC = b"\x00CRDB"
+SNAPSHOT_VERSION = 2
+BLOCK_HEADER = struct.Struct("!BII")
+CRC = struct.Struct("!I")
+LENGTH = struct.Struct("!H")
+COMPRESSED = 1
+# 增量段中表示key已被删除的类型名
+TOMBSTONE = ""
+# 读写文件时的缓冲区大小，也是块的大小
+BUFFER_SIZE = 1024 * 1024
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def write_block(stream, block, compress):
+    raw = bytes(block)
+    data, flags = raw, 0
+    if compress:
+        compressed = zlib.compress(raw, 1)
+        # 压缩效果不好时直接保存原始数据
+        if len(compressed) < len(raw):
+            data, flags = compressed, COMPRESSED
+    stream.write(BLOCK_HEADER.pack(flags, len(raw), len(data)))
+    stream.write(data)
+    stream.write(CRC.pack(zlib.crc32(data)))
+
+
+def dump(stream, datas, expire_keys, type_names, compress=True, keys=None):
+    """
+    :param type_names: {数据类型: 类型名}
+    :param compress: 是否使用zlib压缩每个块
+    :param keys: 只保存这些key(增量段)，不在datas中的key写入删除标记
+    :return: 写入的key数
+    """
+    names = sorted(set(type_names.values()))
+    if keys is not None:
+        names.append(TOMBSTONE)
+    index = dict((type_, names.index(name))
+                 for type_, name in type_names.items())
+    stream.write(SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]))
+    stream.write(LENGTH.pack(len(names)))
+    for name in names:
+        name = name.encode("utf-8")
+        stream.write(LENGTH.pack(len(name)) + name)
+    if keys is None:
+        items = datas.items()
+    else:
+        items = ((key, datas.get(key)) for key in keys)
+    block = bytearray()
+    count = 0
+    for key, store in items:
+        if store is None:
+            block.append(len(names) - 1)
+            block += pack_varint(len(key))
+            block += b"\x00\x00"
+            block += key
+        else:
+            value = store.dumps()
+            expire = expire_keys.get(key)
+            block.append(index[store.__class__])
+            block += pack_varint(len(key))
+            block += pack_varint(0 if expire is None else expire + 1)
+            block += pack_varint(len(value))
+            block += key
+            block += value
+        count += 1
+        if len(block) >= BUFFER_SIZE:
+            write_block(stream, block, compress)
+            block = bytearray()
+    if block:
+        write_block(stream, block, compress)
+    stream.write(BLOCK_HEADER.pack(0, 0, 0))
+    return count
+
+
+def is_snapshot(filename):
+    with open(filename, "rb") as stream:
+        return stream.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+
+def read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise SnapshotError("unexpected end of snapshot")
+    return data
+
+
+class SnapshotReader(object):
+    """
+    for type_name, key, expire, value in SnapshotReader(stream)
+    过期时间为-1表示不过期，读完一个段后stream正好位于段的末尾，后面可能还有增量段
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        header = read_exactly(stream, len(SNAPSHOT_MAGIC) + 1)
+        if header[:-1] != SNAPSHOT_MAGIC:
+            raise SnapshotError("not a snapshot file")
+        self.version = header[-1]
+        if self.version != SNAPSHOT_VERSION:
+            raise SnapshotError(
+                "unsupported snapshot version %d" % self.version)
+        self.names = []
+        for _ in range(LENGTH.unpack(read_exactly(stream, LENGTH.size))[0]):
+            size, = LENGTH.unpack(read_exactly(stream, LENGTH.size))
+            self.names.append(read_exactly(stream, size).decode("utf-8"))
+
+    def __iter__(self):
+        stream = self.stream
+        names = self.names
+        while True:
+            flags, raw_len, size = BLOCK_HEADER.unpack(
+                read_exactly(stream, BLOCK_HEADER.size))
+            if not raw_len:
+                break
+            data = read_exactly(stream, size)
+            crc, = CRC.unpack(read_exactly(stream, CRC.size))
+            if zlib.crc32(data) != crc:
+                raise SnapshotError(
+                    "block checksum mismatch at %d" % stream.tell())
+            if flags & COMPRESSED:
+                data = zlib.decompress(data)
+            offset = 0
+            while offset < raw_len:
+                type_index = data[offset]
+                key_len, offset = unpack_varint(data, offset + 1)
+                expire, offset = unpack_varint(data, offset)
+                value_len, offset = unpack_varint(data, offset)
+                start = offset + key_len
+                offset = start + value_len
+                yield names[type_index], data[start - key_len: start], \
+                    expire - 1, data[start: offset]
+
+
+class LoadProgress(object):
+    """加载进度，每隔interval秒输出一次日志"""
+
+    def __init__(self, logger, filename, interval=1):
+        self.logger = logger
+        self.filename = filename
+        self.interval = interval
+        self.total = os.path.getsize(filename)
+        self.start = self.last = time.time()
+        self.keys = 0
+
+    def update(self, stream):
+        self.keys += 1
+        if self.keys & 1023:
+            return
+        now = time.time()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.logger.info("loading %s: %d keys, %.1f%%" % (
+                self.filename, self.keys,
+                stream.tell() * 100.0 / (self.total or 1)))
+
+    def finish(self):
+        """:return: 加载统计信息"""
+        seconds = time.time() - self.start
+        self.logger.info(
+            "%d keys loaded from %s in %.3f seconds (%d bytes, %.0f keys/s)" % (
+                self.keys, self.filename, seconds, self.total,
+                self.keys / seconds if seconds else 0))
+        return {"keys": self.keys, "bytes": self.total, "seconds": seconds}
@@ -0,0 +1,290 @@
+# -*- coding:utf-8 -*-
+"""
+INFO指令使用的运行统计
+    Stats: 服务端的计数器及每秒操作数
+    LatencyHistogram: 固定桶的对数-线性直方图，用来估计p50/p99/p999
+    CommandStats: 每个指令的调用次数、总耗时、失败次数及耗时的直方图
+计数器都是在请求处理路径上直接累加的整数，总指令数、命中次数等在INFO时再汇总，
+读取时钟的代价较高，直方图按--latency-sample抽样记录耗时，与SLOWLOG是否开启无关，
+info()按redis INFO的格式生成各section
+"""
+import os
+import time
+import resource
+
+from collections import OrderedDict
+
+from .utils import human_size
+
+# 每个2的幂区间分成2**SUB_BITS个等宽的桶，相对误差不超过1/2**SUB_BITS
+SUB_BITS = 3
+SUB_COUNT = 1 << SUB_BITS
+# 小于这个值(微秒)时每微秒一个桶
+LINEAR_MAX = SUB_COUNT << 1
+# 超过约12天的耗时都计入最后一个桶
+MAX_BITS = 40
+BUCKETS = (MAX_BITS - SUB_BITS + 1) * SUB_COUNT
+# 计算每秒操作数时保留的采样数
+OPS_SAMPLES = 16
+
+
+def bucket_index(usec):
+    if usec < LINEAR_MAX:
+        return usec
+    shift = usec.bit_length() - SUB_BITS - 1
+    return min((shift + 1) * SUB_COUNT + ((usec >> shift) & (SUB_COUNT - 1)),
+               BUCKETS - 1)
+
+
+def bucket_bound(index):
+    """:return: 桶中最大的值(微秒)"""
+    if index < LINEAR_MAX:
+        return index
+    shift = index // SUB_COUNT - 1
+    return ((SUB_COUNT + index % SUB_COUNT + 1) << shift) - 1
+
+
+class LatencyHistogram(object):
+    """耗时以微秒为单位"""
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.total = 0
+
+    def record(self, usec):
+        self.counts[bucket_index(usec)] += 1
+        self.total += 1
+
+    def percentile(self, percent):
+        """:return: 不小于percent%的样本的耗时上界，没有样本时返回0"""
+        if not self.total:
+            return 0
+        rank = self.total * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bucket_bound(index)
+        return bucket_bound(BUCKETS - 1)
+
+    def reset(self):
+        self.counts[:] = [0] * BUCKETS
+        self.total = 0
+
+
+class CommandStats(LatencyHistogram):
+    """
+    一个指令的统计，由dispatch直接累加，不经过方法调用，
+    耗时是抽样记录的，total为计时的次数，usec为计时的调用的总耗时
+    """
+    __slots__ = ("calls", "usec", "failed")
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.usec = 0
+        self.failed = 0
+
+    def reset(self):
+        super().reset()
+        self.calls = 0
+        self.usec = 0
+        self.failed = 0
+
+    @property
+    def usec_per_call(self):
+        return self.usec / self.total if self.total else 0.0
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.start_time = time.time()
+        # {指令名: CommandStats}，重置时原地清零，指令表中保存的引用一直有效
+        self.command_stats = {}
+        # 读指令的调用次数，由bind从指令表中得到
+        self.read_commands = ()
+        self.reset()
+
+    def reset(self):
+        """CONFIG RESETSTAT"""
+        self.connections = 0
+        self.net_input_bytes = 0
+        self.net_output_bytes = 0
+        self.keyspace_misses = 0
+        self.expired_keys = 0
+        for stats in self.command_stats.values():
+            stats.reset()
+        # [(时间, 已处理的指令数)]
+        self.ops_samples = []
+
+    def bind(self, commands):
+        """指令表生成后，将每个指令的统计保存在指令表中"""
+        for name, command in commands.items():
+            command.stats = self.command_stats.get(name)
+            if command.stats is None:
+                command.stats = self.command_stats[name] = CommandStats()
+        self.read_commands = [
+            command.stats for command in commands.values()
+            if command.owner is not None and not command.write]
+
+    @property
+    def commands(self):
+        return sum(stats.calls for stats in self.command_stats.values())
+
+    @property
+    def keyspace_hits(self):
+        return sum(stats.calls for stats in self.read_commands) - \
+            self.keyspace_misses
+
+    def called(self):
+        """:return: [(指令名, CommandStats)]，只包括调用过的指令"""
+        return [(name, stats) for name, stats in sorted(
+            self.command_stats.items()) if stats.calls]
+
+    def track_ops(self, now=None):
+        """定时任务中采样，每秒操作数是最近OPS_SAMPLES次采样的平均值"""
+        samples = self.ops_samples
+        samples.append((time.monotonic() if now is None else now,
+                        self.commands))
+        if len(samples) > OPS_SAMPLES + 1:
+            del samples[0]
+
+    @property
+    def ops_per_sec(self):
+        samples = self.ops_samples
+        if len(samples) < 2:
+            return 0
+        (start, first), (end, last) = samples[0], samples[-1]
+        if end <= start:
+            return 0
+        return int((last - first) / (end - start))
+
+    @property
+    def uptime(self):
+        return int(time.time() - self.start_time)
+
+
+def rss():
+    """:return: (当前常驻内存, 峰值常驻内存)，单位字节"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize(), peak
+    except (OSError, IndexError, ValueError):
+        return peak, peak
+
+
+def server_section(server):
+    from .. import __version__
+    uptime = server.stats.uptime
+    return [("custom_redis_version", __version__),
+            ("process_id", os.getpid()),
+            ("tcp_port", server.port),
+            ("resp_port", server.args.get("resp_port") or 0),
+            ("uptime_in_seconds", uptime),
+            ("uptime_in_days", uptime // 86400)]
+
+
+def clients_section(server):
+    return [("connected_clients", len(server.connections)),
+            ("client_pending_output_bytes",
+             sum(conn.pending for conn in server.connections.values()))]
+
+
+def memory_section(server):
+    used, peak = rss()
+    # 只有设置了maxmemory时才统计数据的内存占用
+    dataset = server.datas.used_memory if server.datas.track_memory else used
+    return [("used_memory", dataset),
+            ("used_memory_human", human_size(dataset)),
+            ("used_memory_rss", used),
+            ("used_memory_rss_human", human_size(used)),
+            ("used_memory_peak", peak),
+            ("used_memory_peak_human", human_size(peak)),
+            ("maxmemory", server.maxmemory),
+            ("maxmemory_human", human_size(server.maxmemory)),
+            ("maxmemory_policy", server.args.get("maxmemory_policy"))]
+
+
+def persistence_section(server):
+    load_stats = server.load_stats or {}
+    return [("loading", int(server.loading)),
+            ("loaded_keys", load_stats.get("keys", 0)),
+            ("load_seconds", "%.3f" % load_stats.get("seconds", 0)),
+            ("rdb_changes_since_last_save", server.dirty),
+            ("rdb_bgsave_in_progress", int(server.child_type == "rdb")),
+            ("rdb_last_save_time", server.lastsave),
+            ("rdb_last_bgsave_status",
+             "ok" if server.lastbgsave_ok else "err"),
+            ("aof_enabled", int(bool(server.aof))),
+            ("aof_rewrite_in_progress", int(server.child_type == "aof"))]
+
+
+def stats_section(server):
+    stats = server.stats
+    return [("total_connections_received", stats.connections),
+            ("total_commands_processed", stats.commands),
+            ("instantaneous_ops_per_sec", stats.ops_per_sec),
+            ("total_net_input_bytes", stats.net_input_bytes),
+            ("total_net_output_bytes", stats.net_output_bytes),
+            ("expired_keys", stats.expired_keys),
+            ("evicted_keys", server.evicted_keys),
+            ("keyspace_hits", stats.keyspace_hits),
+            ("keyspace_misses", stats.keyspace_misses)]
+
+
+def commandstats_section(server):
+    return [("cmdstat_%s" % name,
+             "calls=%d,usec=%d,usec_per_call=%.2f,failed_calls=%d" % (
+                 stats.calls, stats.usec_per_call * stats.calls,
+                 stats.usec_per_call, stats.failed))
+            for name, stats in server.stats.called()]
+
+
+def latencystats_section(server):
+    return [("latency_percentiles_usec_%s" % name,
+             "p50=%d,p99=%d,p99.9=%d" % tuple(
+                 stats.percentile(percent) for percent in (50, 99, 99.9)))
+            for name, stats in server.stats.called()]
+
+
+def keyspace_section(server):
+    if not server.datas:
+        return []
+    return [("db0", "keys=%d,expires=%d" % (
+        len(server.datas), len(server.expire_keys)))]
+
+
+SECTIONS = OrderedDict([
+    ("server", server_section),
+    ("clients", clients_section),
+    ("memory", memory_section),
+    ("persistence", persistence_section),
+    ("stats", stats_section),
+    ("commandstats", commandstats_section),
+    ("latencystats", latencystats_section),
+    ("keyspace", keyspace_section),
+])
+# 不指定section时不包括每个指令的统计，与redis一致
+DEFAULT_SECTIONS = ("server", "clients", "memory", "persistence", "stats",
+                    "keyspace")
+
+
+def info(server, sections=()):
+    """
+    :param sections: section名列表，为空时返回默认的section，all返回所有
+    :return: redis INFO格式的文本
+    """
+    names = [name.lower() for name in sections] or DEFAULT_SECTIONS
+    if "all" in names or "everything" in names:
+        names = list(SECTIONS)
+    lines = []
+    for name in SECTIONS:
+        if name in names:
+            if lines:
+                lines.append("")
+            lines.append("# %s" % name.capitalize())
+            lines.extend("%s:%s" % item for item in SECTIONS[name](server))
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
@@ -0,0 +1,54 @@
+# -*- coding:utf-8 -*-
+"""
+请求的抽样追踪
+关闭时(sample为0)请求处理路径上只有一次属性判断，不格式化任何日志，
+开启时每sample个请求记录一条日志：客户端、指令、key、参数大小、响应大小及耗时
+"""
+from time import perf_counter_ns
+
+from .slowlog import arg_size
+
+
+def describe(request):
+    """:return: (指令名, key, 参数大小)，请求是(cmd, key, val)或RESP的参数数组"""
+    if isinstance(request, tuple):
+        cmd, key, val = request
+        return cmd, key, arg_size(val)
+    return (request[0].decode("utf-8", "replace").lower(),
+            request[1] if len(request) > 1 else b"", arg_size(request[2:]))
+
+
+class Tracer(object):
+    """
+    :param sample: 每sample个请求追踪一个，0表示关闭
+    """
+    def __init__(self, logger, sample=0):
+        self.logger = logger
+        self.sample = sample
+        self.countdown = sample
+
+    def sampled(self):
+        self.countdown -= 1
+        if self.countdown > 0:
+            return False
+        self.countdown = self.sample
+        return True
+
+    def execute(self, server, conn, requests):
+        """与不追踪时一样依次执行请求并保存响应，抽中的请求记录日志"""
+        protocol = conn.protocol
+        for request in requests:
+            if self.sampled():
+                start = perf_counter_ns()
+                reply = protocol.execute(server, request)
+                self.trace(conn, request, reply,
+                           (perf_counter_ns() - start) // 1000)
+            else:
+                reply = protocol.execute(server, request)
+            conn.queue(reply)
+
+    def trace(self, conn, request, reply, usec):
+        cmd, key, size = describe(request)
+        self.logger.info(
+            "trace %s %s %r args=%dB reply=%dB %dus",
+            conn, cmd, key, size, len(reply), usec)
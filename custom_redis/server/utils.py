@@ -1,44 +1,30 @@
 # -*- coding:utf-8 -*-
+import sys
+import pickle
 import traceback
 
 from functools import wraps
+from argparse import ArgumentTypeError
+from itertools import islice
 
 from .errors import ClientClosed
 
 
 def stream_wrapper(func):
     """
-    处理流异常的装饰器
+    处理流异常的装饰器，出现异常或客户端关闭时关闭连接
     :param func:
     :return:
     """
     @wraps(func)
-    def wrapper(*args):
-        self, stream, w_lst, r_lst, server = args
-        is_error = None
-        is_closed = None
+    def wrapper(self, conn):
         try:
-            return func(*args)
+            return func(self, conn)
         except ClientClosed:
-            is_closed = True
-            is_error = True
+            self.close_connection(conn)
         except Exception:
             self.logger.info(traceback.format_exc())
-            is_error = True
-        finally:
-            if is_error or server is None:
-                # 只有send的时候，server才会为空
-                # 也就是说出了异常，或者send时，才会做下面的操作
-                if stream in w_lst:
-                    del w_lst[stream]
-                # 如果每个socket属性元组中keep-alive 不为空，则不关闭stream
-                if (stream in r_lst and (len(r_lst[stream]) != 3 or not int(
-                        r_lst[stream][2]))) or is_closed:
-                    del r_lst[stream]
-                    try:
-                        stream.close()
-                    except:
-                        pass
+            self.close_connection(conn)
     return wrapper
 
 
@@ -60,6 +46,140 @@ def cache_property(func):
 
 
 def format_response(code, info, data):
+    """响应统一为(code, info, data)，由连接所使用的协议负责编码"""
     if data is None:
         data = b""
-    return b"%s#-*-#%s#-*-#%s\r\n\r\n" % (code, info, data)
+    return code, info, data
+
+
+def escape(data):
+    """旧协议的转义，避免数据中出现分隔符及响应的结束标志"""
+    return data.replace(
+        b"<->", b"1qaxsw234fds3gbhfvhtedfvfg").replace(
+        b"#-*-#", b"jp0n988n80434nlj3pdf0909mn").replace(
+        b"\r\n\r\n", b"r4n7kd02vbx9q3mw8zt5ylc6hs")
+
+
+def unescape(data):
+    return data.replace(
+        b"1qaxsw234fds3gbhfvhtedfvfg", b"<->").replace(
+        b"jp0n988n80434nlj3pdf0909mn", b"#-*-#")
+
+
+def loads(data):
+    """
+    客户端通过pickle传递结构化参数，RESP等协议解析出的参数已经是python对象，
+    直接返回即可
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return pickle.loads(data)
+    return data
+
+
+def as_values(data):
+    """
+    单值指令(RPUSH、SADD等)的参数：请求中的bytes是一个原始值，
+    RESP等协议解析出的参数数组是多个值，多值的请求使用MRPUSH、MSADD等指令
+    """
+    if isinstance(data, (list, tuple)):
+        return data
+    return [data]
+
+
+def to_bytes(data):
+    if isinstance(data, bytes):
+        return data
+    return str(data).encode("utf-8")
+
+
+def parse_size(size):
+    """将1gb, 64mb, 512kb这样的大小转换成字节数"""
+    size = str(size).strip().lower()
+    for unit, scale in (("gb", 1024 ** 3), ("mb", 1024 ** 2),
+                        ("kb", 1024), ("b", 1)):
+        if size.endswith(unit):
+            return int(size[:-len(unit)]) * scale
+    return int(size)
+
+
+def positive_int(value):
+    """命令行参数的类型，不小于1的整数"""
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError("must be at least 1, got %s" % value)
+    return number
+
+
+def human_size(size):
+    """与redis的INFO一致，比如1.50M"""
+    for unit, scale in (("G", 1024 ** 3), ("M", 1024 ** 2), ("K", 1024)):
+        if size >= scale:
+            return "%.2f%s" % (size / scale, unit)
+    return "%dB" % size
+
+
+def normalize_range(start, stop, length):
+    """
+    将redis的闭区间下标(可以为负数)转换成python的[start, stop)
+    区间为空时start >= stop
+    """
+    if start < 0:
+        start = max(start + length, 0)
+    if stop < 0:
+        stop += length
+    return start, min(stop + 1, length)
+
+
+def to_score(value):
+    """
+    有序集合的分数，整数保持int(编码更紧凑)，否则为float，支持inf/-inf
+    """
+    if isinstance(value, (bytes, str)):
+        try:
+            score = int(value)
+        except ValueError:
+            score = float(value)
+    elif isinstance(value, int) and not isinstance(value, bool):
+        score = value
+    else:
+        score = float(value)
+    if score != score:
+        raise ValueError("score is not a valid float")
+    return score
+
+
+def parse_bound(value):
+    """
+    分数区间的边界，以"("开头表示不包含边界
+    :return: (分数, 是否不包含)
+    """
+    if isinstance(value, (bytes, str)) and value[:1] in (b"(", "("):
+        return to_score(value[1:]), True
+    return to_score(value), False
+
+
+def format_score(score):
+    """分数的字符串形式，与redis一致，比如1, 1.5, inf"""
+    if isinstance(score, int) or score.is_integer() and abs(score) < 1e17:
+        return b"%d" % score
+    return repr(score).encode("utf-8")
+
+
+def sizeof_pair(item):
+    return sys.getsizeof(item[0]) + sys.getsizeof(item[1])
+
+
+def sampled_size(data, items=None, item_size=sys.getsizeof, per_item=0,
+                 samples=5):
+    """
+    近似的内存占用，容器本身的大小加上抽样估计的元素大小，与redis的MEMORY USAGE类似
+    :param items: 元素的迭代器，默认为iter(data)
+    :param item_size: 计算一个元素大小的函数
+    :param per_item: 每个元素额外的开销，比如跳表节点
+    """
+    size = sys.getsizeof(data)
+    if isinstance(data, bytes) or not data:
+        return size
+    sample = list(islice(iter(data) if items is None else items, samples))
+    return size + len(data) * (
+        sum(map(item_size, sample)) // len(sample) + per_item)
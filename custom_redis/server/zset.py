@@ -1,164 +1,440 @@
 # -*- coding:utf-8 -*-
+"""
+有序集合，使用带跨度的跳表保存(分数, 成员)的顺序，与redis的zskiplist一致，
+分数相同时按成员排序，另外用字典保存成员到分数的映射
+插入、删除及排名都是O(log n)，范围查询是O(log n + k)
+"""
+import gc
+import random
+
 from .errors import Empty
-from bisect import bisect_left, bisect_right, insort
+from .utils import normalize_range
+
+# 最大层数及节点升高一层的概率
+MAX_LEVEL = 32
+P = 0.25
+
 
+def random_level():
+    level = 1
+    while random.random() < P and level < MAX_LEVEL:
+        level += 1
+    return level
 
-class SNode:
+
+class SkipListNode(object):
     """
-    节点
+    节点，key为(分数, 成员)，比较时直接比较元组，
+    forward[i]为第i层的下一个节点，span[i]为到该节点跨过的节点数，
+    下一个节点为None时span[i]为之后剩余的节点数
     """
-    def __init__(self, key=None, score=float('-inf'), next=None):
-        self.key = key
-        self.score = score
+    __slots__ = ("key", "backward", "forward", "span")
 
-    def __lt__(self, other):
-        return self.score < getattr(other, 'score', other)
+    def __init__(self, key, level):
+        self.key = key
+        self.backward = None
+        self.forward = [None] * level
+        self.span = [0] * level
 
-    def __gt__(self, other):
-        """
-        没定义__gt__的话会导致bisect_right出问题,即使已经定义了__lt__
-        :param other:
-        :return:
-        """
-        return self.score > getattr(other, 'score', other)
 
+class SkipList(object):
+    """按(分数, 成员)升序排列的跳表，排名从1开始"""
 
-class SList(object):
-    """
-    定义数组,用bisect维护顺序
-    """
     def __init__(self):
-        self.key2node = {}
-        self.card = 0
-        self.orderlist = []
-
-    def findpos(self, snode):
-        curpos = bisect_left(self.orderlist, snode)
-        while 1:
-            if self.orderlist[curpos].key == snode.key:
-                break
-            curpos += 1
-        return curpos
-
-    def insert(self, key, score):
-        if not isinstance(score, int):
-            raise Exception('score must be integer')
-        snode = self.key2node.get(key)
-        if snode:
-            if score == snode.score:
-                return 0
-            del self.orderlist[self.findpos(snode)]
-            snode.score = score
+        self.header = SkipListNode(None, MAX_LEVEL)
+        self.tail = None
+        self.level = 1
+        self.length = 0
+
+    def insert(self, key):
+        """插入一个不存在的(分数, 成员)"""
+        header = self.header
+        level_now = self.level
+        # 每一层插入位置的前一个节点及其排名
+        update = [header] * level_now
+        rank = [0] * level_now
+        x = header
+        traversed = 0
+        for i in range(level_now - 1, -1, -1):
+            while True:
+                nxt = x.forward[i]
+                if nxt is None or nxt.key >= key:
+                    break
+                traversed += x.span[i]
+                x = nxt
+            update[i] = x
+            rank[i] = traversed
+        level = random_level()
+        if level > level_now:
+            for i in range(level_now, level):
+                update.append(header)
+                rank.append(0)
+                header.span[i] = self.length
+            self.level = level
+        node = SkipListNode(key, level)
+        forward, span = node.forward, node.span
+        for i in range(level):
+            prev = update[i]
+            forward[i] = prev.forward[i]
+            prev.forward[i] = node
+            span[i] = prev.span[i] - (traversed - rank[i])
+            prev.span[i] = traversed - rank[i] + 1
+        for i in range(level, level_now):
+            update[i].span[i] += 1
+        node.backward = None if update[0] is header else update[0]
+        if forward[0] is None:
+            self.tail = node
         else:
-            self.card += 1
-            snode = SNode(key=key, score=score)
-            self.key2node[key] = snode
-        insort(self.orderlist, snode)
-        return 1
+            forward[0].backward = node
+        self.length += 1
+        return node
 
     def delete(self, key):
-        snode = self.key2node.get(key)
-        if not snode:
-            return 0
-        self.card -= 1
-        del self.orderlist[self.findpos(snode)]
-        del self.key2node[key]
-        del snode
-        return 1
+        """:return: 是否找到并删除"""
+        update = [None] * self.level
+        x = self.header
+        for i in range(self.level - 1, -1, -1):
+            while True:
+                nxt = x.forward[i]
+                if nxt is None or nxt.key >= key:
+                    break
+                x = nxt
+            update[i] = x
+        x = x.forward[0]
+        if x is None or x.key != key:
+            return False
+        for i in range(self.level):
+            prev = update[i]
+            if prev.forward[i] is x:
+                prev.span[i] += x.span[i] - 1
+                prev.forward[i] = x.forward[i]
+            else:
+                prev.span[i] -= 1
+        if x.forward[0] is None:
+            self.tail = x.backward
+        else:
+            x.forward[0].backward = x.backward
+        while self.level > 1 and self.header.forward[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
+        return True
+
+    def load(self, keys):
+        """
+        用已经升序排列的keys生成跳表，每个节点直接追加到末尾，O(n)
+        只新建节点不会产生垃圾，期间暂停gc，避免大量新对象反复触发回收
+        """
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.append_all(keys)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def append_all(self, keys):
+        header = self.header
+        rand = random.random
+        # 每一层最后一个节点及其排名
+        last = [header] * MAX_LEVEL
+        last_rank = [0] * MAX_LEVEL
+        prev = None
+        length = 0
+        max_level = self.level
+        for key in keys:
+            length += 1
+            if rand() >= P:
+                # 大部分节点只有一层
+                node = SkipListNode(key, 1)
+                tail = last[0]
+                tail.forward[0] = node
+                tail.span[0] = length - last_rank[0]
+                last[0] = node
+                last_rank[0] = length
+            else:
+                level = random_level() + 1
+                if level > MAX_LEVEL:
+                    level = MAX_LEVEL
+                node = SkipListNode(key, level)
+                for i in range(level):
+                    last[i].forward[i] = node
+                    last[i].span[i] = length - last_rank[i]
+                    last[i] = node
+                    last_rank[i] = length
+                if level > max_level:
+                    max_level = level
+            node.backward = prev
+            prev = node
+        self.level = max_level
+        for i in range(max_level):
+            last[i].span[i] = length - last_rank[i]
+        self.tail = prev
+        self.length = length
+
+    def rank(self, key):
+        """:return: 排名，不存在时返回0"""
+        rank = 0
+        x = self.header
+        for i in range(self.level - 1, -1, -1):
+            while True:
+                nxt = x.forward[i]
+                if nxt is None or nxt.key > key:
+                    break
+                rank += x.span[i]
+                x = nxt
+            if x.key == key:
+                return rank
+        return 0
+
+    def by_rank(self, rank):
+        """:return: 排名为rank的节点"""
+        traversed = 0
+        x = self.header
+        for i in range(self.level - 1, -1, -1):
+            while x.forward[i] is not None and traversed + x.span[i] <= rank:
+                traversed += x.span[i]
+                x = x.forward[i]
+            if traversed == rank:
+                return x
+        return None
+
+    def first_in_range(self, min_score, exclusive=False):
+        """:return: 第一个分数不小于(exclusive时大于)min_score的节点"""
+        x = self.header
+        for i in range(self.level - 1, -1, -1):
+            while x.forward[i] is not None and (
+                    x.forward[i].key[0] <= min_score if exclusive
+                    else x.forward[i].key[0] < min_score):
+                x = x.forward[i]
+        return x.forward[0]
+
+    def last_in_range(self, max_score, exclusive=False):
+        """:return: 最后一个分数不大于(exclusive时小于)max_score的节点"""
+        x = self.header
+        for i in range(self.level - 1, -1, -1):
+            while x.forward[i] is not None and (
+                    x.forward[i].key[0] < max_score if exclusive
+                    else x.forward[i].key[0] <= max_score):
+                x = x.forward[i]
+        return None if x is self.header else x
+
+    def __iter__(self):
+        x = self.header.forward[0]
+        while x is not None:
+            yield x
+            x = x.forward[0]
+
+
+def walk(node, count, backward=False):
+    """从node开始向前或向后最多取count个节点"""
+    nodes = []
+    while node is not None and len(nodes) < count:
+        nodes.append(node)
+        node = node.backward if backward else node.forward[0]
+    return nodes
+
+
+def in_range(score, bound, exclusive, upper):
+    """score是否没有超出区间的上界(upper)或下界"""
+    if upper:
+        return score < bound if exclusive else score <= bound
+    return score > bound if exclusive else score >= bound
+
+
+def pack(nodes, withscores):
+    if withscores:
+        return [(x.key[1], x.key[0]) for x in nodes]
+    return [x.key[1] for x in nodes]
+
+
+class SNode(object):
+    """旧版本的节点，只用于加载旧快照中pickle的有序集合"""
 
-    def search(self, key):
-        return self.key2node.get(key)
 
+class SList(object):
+    """旧版本基于有序数组的实现，只用于加载旧快照中pickle的有序集合"""
+
+
+class SortedSet(object):
 
-class SortedSet:
     def __init__(self):
-        self.slist = SList()
+        # {成员: 分数}
+        self.dict = {}
+        self.zsl = SkipList()
+
+    def __getstate__(self):
+        # 跳表是很长的链表，直接pickle会超出递归深度
+        return {"items": self.items()}
+
+    def __setstate__(self, state):
+        if "slist" in state:
+            # 旧版本的SList
+            items = [(node.key, node.score)
+                     for node in state["slist"].orderlist]
+        else:
+            items = state["items"]
+        zset = self.from_items(items)
+        self.dict, self.zsl = zset.dict, zset.zsl
 
     def zadd(self, key, score):
-        return self.slist.insert(key, score)
+        """分数可以是整数或浮点数"""
+        if score != score:
+            raise ValueError("score is not a number")
+        old = self.dict.get(key)
+        if old is not None:
+            if old == score:
+                return 0
+            self.zsl.delete((old, key))
+        self.zsl.insert((score, key))
+        self.dict[key] = score
+        return 1
+
+    def zadd_many(self, items):
+        """
+        items为[(成员, 分数)]，:return: 新增的成员数
+        批量添加的成员比现有的多时合并后排序，一次生成跳表，比逐个插入快得多
+        """
+        if len(items) <= self.zcard:
+            card = self.zcard
+            for key, score in items:
+                self.zadd(key, score)
+            return self.zcard - card
+        merged = dict(self.dict)
+        for key, score in items:
+            if score != score:
+                raise ValueError("score is not a number")
+            merged[key] = score
+        zset = self.from_items(merged.items())
+        added = len(merged) - len(self.dict)
+        self.dict, self.zsl = zset.dict, zset.zsl
+        return added
 
     def zrem(self, key):
-        return self.slist.delete(key)
+        score = self.dict.pop(key, None)
+        if score is None:
+            return 0
+        self.zsl.delete((score, key))
+        return 1
 
     def zrank(self, key):#score相同则按字典序
-        snode = self.slist.key2node.get(key)
-        if not snode:
+        score = self.dict.get(key)
+        if score is None:
             return None
-        return self.slist.findpos(snode)
+        return self.zsl.rank((score, key)) - 1
 
     def zrevrank(self, key):
-        return self.zcard - 1 - self.zrank(key)
+        rank = self.zrank(key)
+        if rank is None:
+            return None
+        return self.zcard - 1 - rank
 
     def zscore(self, key):
-        snode = self.slist.key2node.get(key)
-        return getattr(snode, 'score', None)
+        return self.dict.get(key)
 
-    def zcount(self, start, end):
-        ol = self.slist.orderlist
-        return bisect_left(ol, end+1) - bisect_right(ol, start-1)
+    def zcount(self, start, end, min_exclusive=False, max_exclusive=False):
+        first = self.zsl.first_in_range(start, min_exclusive)
+        if first is None or not in_range(
+                first.key[0], end, max_exclusive, True):
+            return 0
+        last = self.zsl.last_in_range(end, max_exclusive)
+        return self.zsl.rank(last.key) - self.zsl.rank(first.key) + 1
 
     @property
     def zcard(self):
-        return self.slist.card
+        return self.zsl.length
 
     def zrange(self, start, end, withscores=False):#score相同则按字典序
-        nodes = self.slist.orderlist[start: end+1]
-        if not nodes:
+        start, end = normalize_range(start, end, self.zcard)
+        if start >= end:
             return []
-        if withscores:
-            return [(x.key, x.score) for x in nodes]
-        else:
-            return [x.key for x in nodes]
+        return pack(walk(self.zsl.by_rank(start + 1), end - start),
+                    withscores)
 
     def zrevrange(self, start, end, withscores=False):
-        card = self.zcard
-        if end<0:
-            end = end + card
-        if start<0:
-            start = start + card
-        nodes = self.slist.orderlist[max(card-end-1, 0):max(card-start, 0)][::-1]
-        if not nodes:
+        start, end = normalize_range(start, end, self.zcard)
+        if start >= end:
             return []
-        if withscores:
-            return [(x.key, x.score) for x in nodes]
-        else:
-            return [x.key for x in nodes]
+        return pack(walk(self.zsl.by_rank(self.zcard - start), end - start,
+                         backward=True), withscores)
 
-    def zrangebyscore(self, start, end, withscores=False):
-        ol = self.slist.orderlist
-        nodes = ol[bisect_left(ol, start):bisect_right(ol, end)]
-        if not nodes:
+    def zrangebyscore(self, start, end, withscores=False, offset=0,
+                      count=-1, min_exclusive=False, max_exclusive=False):
+        """
+        分数在[start, end]之间的成员，跳过offset个后最多取count个，
+        count为负数时不限制，offset通过排名直接定位，不需要逐个跳过，
+        offset为负数时与redis一样返回空列表
+        """
+        if offset < 0:
             return []
-        if withscores:
-            return [(x.key, x.score) for x in nodes]
-        else:
-            return [x.key for x in nodes]
+        node = self.zsl.first_in_range(start, min_exclusive)
+        if node is not None and offset:
+            node = self.zsl.by_rank(self.zsl.rank(node.key) + offset)
+        nodes = []
+        while node is not None and len(nodes) != count and \
+                in_range(node.key[0], end, max_exclusive, True):
+            nodes.append(node)
+            node = node.forward[0]
+        return pack(nodes, withscores)
+
+    def zrevrangebyscore(self, end, start, withscores=False, offset=0,
+                         count=-1, min_exclusive=False, max_exclusive=False):
+        if offset < 0:
+            return []
+        node = self.zsl.last_in_range(end, max_exclusive)
+        if node is not None and offset:
+            rank = self.zsl.rank(node.key) - offset
+            node = self.zsl.by_rank(rank) if rank > 0 else None
+        nodes = []
+        while node is not None and len(nodes) != count and \
+                in_range(node.key[0], start, min_exclusive, False):
+            nodes.append(node)
+            node = node.backward
+        return pack(nodes, withscores)
 
     def zpop(self, withscores=False):
-        data = self.zrange(0, 0, withscores)
-        if data:
-            data = data[0]
-            if withscores:
-                self.zrem(data[0])
-            else:
-                self.zrem(data)
-            return data
-        raise Empty
-
-    def zrevrangebyscore(self, end, start, withscores=False):
-        return self.zrangebyscore(start, end, withscores)[::-1]
-
-    def zincrby(self, key):
-        snode = self.slist.key2node.get(key)
-        if not snode:
-            return self.zadd(key, 1)
-        score = snode.score
+        node = self.zsl.header.forward[0]
+        if node is None:
+            raise Empty
+        score, key = node.key
         self.zrem(key)
-        return self.zadd(key, score+1)
+        if withscores:
+            return key, score
+        return key
 
-    def __len__(self):
-        return self.zcard
+    def zpopmin(self, count=1):
+        """弹出分数最小的count个成员，:return: [(成员, 分数)]"""
+        items = pack(walk(self.zsl.header.forward[0], count), True)
+        for key, _ in items:
+            self.zrem(key)
+        return items
+
+    def zpopmax(self, count=1):
+        items = pack(walk(self.zsl.tail, count, backward=True), True)
+        for key, _ in items:
+            self.zrem(key)
+        return items
 
+    def zincrby(self, key, increment=1):
+        """:return: 新的分数"""
+        score = self.dict.get(key, 0) + increment
+        self.zadd(key, score)
+        return score
 
-if __name__ == "__main__":
-    a = SortedSet()
\ No newline at end of file
+    def items(self):
+        """按分数排列的(key, score)"""
+        return [(x.key[1], x.key[0]) for x in self.zsl]
+
+    @classmethod
+    def from_items(cls, items):
+        """
+        items通常已经按分数排列(比如来自快照)，排序几乎是线性的，
+        旧快照中分数相同的成员按插入顺序排列，排序后再直接生成跳表
+        """
+        zset = cls()
+        keys = sorted((score, key) for key, score in items)
+        zset.dict = dict((key, score) for score, key in keys)
+        zset.zsl.load(keys)
+        return zset
+
+    def __len__(self):
+        return self.zcard
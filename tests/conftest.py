@@ -0,0 +1,13 @@
+import sys
+
+import pytest
+
+from custom_redis.server import RedisServer
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["redis_server", "-ll", "ERROR"])
+    server = RedisServer()
+    yield server
+    server.loop.close()
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+
+from custom_redis.server import RedisServer
+from custom_redis.server.aof import AppendOnlyFile, replay
+from custom_redis.server.resp import RespProtocol
+
+
+def aof_server(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", [
+        "redis_server", "-ll", "ERROR", "--appendonly",
+        "--appendfsync", "always", "--save", ""] + list(args))
+    server = RedisServer()
+    server.setup()
+    return server
+
+
+def test_replay_restores_state(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    server = aof_server(monkeypatch)
+    protocol = RespProtocol()
+    protocol.execute(server, [b"SET", b"a", b"1", b"PX", b"100000"])
+    protocol.execute(server, [b"HSET", b"h", b"f", b"1", b"g", b"2"])
+    protocol.execute(server, [b"RPUSH", b"l", b"x"])
+    protocol.execute(server, [b"LPOP", b"l"])
+    protocol.execute(server, [b"GET", b"a"])
+    server.flush_aof()
+    deadline = server.expire_keys[b"a"]
+    server.aof.close()
+
+    restored = aof_server(monkeypatch)
+    assert sorted(restored.datas) == [b"a", b"h"]
+    assert restored.datas[b"h"].data == {"f": b"1", "g": b"2"}
+    assert restored.expire_keys[b"a"] == deadline
+    restored.aof.close()
+
+
+def test_truncated_tail(tmp_path):
+    filename = str(tmp_path / "appendonly.aof")
+    aof = AppendOnlyFile(filename, "no")
+    aof.feed("set", b"a", b"1")
+    aof.feed("set", b"b", b"2")
+    aof.flush()
+    aof.close()
+    size = os.path.getsize(filename)
+    os.truncate(filename, size - 1)
+    calls = []
+    count, truncated = replay(filename, lambda *args: calls.append(args))
+    assert calls == [("set", b"a", b"1")]
+    assert count == 1 and truncated > 0
+    assert replay(filename, lambda *args: None) == (1, 0)
+
+
+def test_background_rewrite(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    server = aof_server(monkeypatch)
+    for i in range(100):
+        server.dispatch("rpush", b"l", [b"%d" % i])
+    server.flush_aof()
+    size = server.aof.size
+    assert server.bgrewriteaof()
+    # 重写期间的写指令追加到新文件中
+    server.dispatch("rpush", b"l", [b"last"])
+    for _ in range(500):
+        server.check_child()
+        if not server.child_pid:
+            break
+        time.sleep(0.01)
+    assert server.aof.size < size
+    server.aof.close()
+
+    restored = aof_server(monkeypatch)
+    assert list(restored.datas[b"l"].data) == [b"%d" % i for i in range(100)] + \
+        [b"last"]
+    restored.aof.close()
@@ -0,0 +1,142 @@
+import time
+import socket
+import asyncio
+import threading
+
+import pytest
+
+from custom_redis.client import AsyncRedis
+from custom_redis.client.errors import RedisError
+from custom_redis.client.connection import Connection
+from custom_redis.protocol import pack_response
+from custom_redis.server.protocols import LegacyProtocol
+
+
+def make_connection(binary):
+    conn = Connection.__new__(Connection)
+    conn.binary = binary
+    conn.buffer = bytearray()
+    conn.sock, peer = socket.socketpair()
+    return conn, peer
+
+
+def test_read_pipelined_binary_responses():
+    conn, peer = make_connection(True)
+    peer.sendall(pack_response(200, b"success", b"a" * 100000) +
+                 pack_response(502, b"Empty", b""))
+    assert conn.read_response() == (b"200", b"success", b"a" * 100000)
+    assert conn.read_response() == (b"502", b"Empty", b"")
+    peer.close()
+    conn.disconnect()
+
+
+def test_read_pipelined_legacy_responses():
+    conn, peer = make_connection(False)
+    peer.sendall(b"200#-*-#success#-*-#ar4n7kd02vbx9q3mw8zt5ylc6hsb\r\n\r\n"
+                 b"200#-*-#success#-*-#jp0n988n80434nlj3pdf0909mn\r\n\r\n")
+    assert conn.read_response() == (b"200", b"success", b"a\r\n\r\nb")
+    assert conn.read_response() == (b"200", b"success", b"#-*-#")
+    peer.close()
+    conn.disconnect()
+
+
+def test_legacy_response_split_after_crlf():
+    conn, peer = make_connection(False)
+    reply = LegacyProtocol().encode((b"200", b"success", b"abc\r\n\r\ndef"))
+    # 在数据中的\r\n\r\n之后拆开时不会截断响应
+    peer.sendall(reply[:reply.index(b"abc") + 3])
+    peer.sendall(reply[reply.index(b"abc") + 3:] + reply)
+    assert conn.read_response() == (b"200", b"success", b"abc\r\n\r\ndef")
+    assert conn.read_response() == (b"200", b"success", b"abc\r\n\r\ndef")
+    peer.close()
+    conn.disconnect()
+
+
+@pytest.fixture
+def port(server):
+    """在后台线程中运行服务端的事件循环"""
+    listener = server.listen("127.0.0.1", 0, LegacyProtocol)
+
+    def run():
+        while server.alive:
+            server.loop.run_once()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    yield listener.getsockname()[1]
+    server.alive = False
+    server.loop.wakeup()
+    thread.join(5)
+    for sock in list(server.connections) + [listener]:
+        sock.close()
+
+
+def test_async_concurrent_replies_in_order(port):
+
+    async def main():
+        async with AsyncRedis("127.0.0.1", port, max_connections=1) as r:
+            await asyncio.gather(*[r.set("k%d" % i, i) for i in range(200)])
+            values = await asyncio.gather(
+                *[r.get("k%d" % i) for i in range(200)])
+            lengths = await asyncio.gather(
+                *[r.rpush("queue", i) for i in range(200)])
+            assert len(r.connection_pool.connections) == 1
+            return values, lengths, await r.lrange("queue", 0, -1)
+
+    values, lengths, queue = asyncio.run(main())
+    assert values == [b"%d" % i for i in range(200)]
+    assert lengths == [b"%d" % i for i in range(1, 201)]
+    assert queue == [b"%d" % i for i in range(200)]
+
+
+def test_async_pool_grows_to_max_connections(port):
+
+    async def main():
+        async with AsyncRedis("127.0.0.1", port, max_connections=3) as r:
+            await asyncio.gather(*[r.set("k%d" % i, i) for i in range(50)])
+            return len(r.connection_pool.connections)
+
+    assert asyncio.run(main()) == 3
+
+
+def test_async_pipeline_raise_on_error(port):
+
+    async def main():
+        async with AsyncRedis("127.0.0.1", port) as r:
+            async with r.pipeline(raise_on_error=False) as pipe:
+                pipe.rpush("a", 1).hget("a", "f").llen("a")
+                results = await pipe.execute()
+            pipe = r.pipeline()
+            pipe.rpush("a", 2).hget("a", "f")
+            with pytest.raises(RedisError):
+                await pipe.execute()
+            return results, len(pipe), await r.llen("a")
+
+    results, queued, length = asyncio.run(main())
+    assert results[0] == b"1" and results[2] == 1
+    assert isinstance(results[1], RedisError)
+    # 出错的指令之前的指令已经执行
+    assert queued == 0 and length == 2
+
+
+def test_async_late_reply_discarded(server, port, monkeypatch):
+    dispatch = server.dispatch
+
+    def slow_dispatch(cmd, key, val):
+        if key == b"slow":
+            time.sleep(0.8)
+        return dispatch(cmd, key, val)
+
+    monkeypatch.setattr(server, "dispatch", slow_dispatch)
+
+    async def main():
+        async with AsyncRedis("127.0.0.1", port, timeout=0.5,
+                              max_connections=1) as r:
+            await r.set("a", 1)
+            await r.set("b", 2)
+            with pytest.raises(asyncio.TimeoutError):
+                await r.get("slow")
+            # 超时的指令的响应在之后的指令等待时到达，被丢弃而不错位
+            return await asyncio.gather(r.get("a"), r.get("b"))
+
+    assert asyncio.run(main()) == [b"1", b"2"]
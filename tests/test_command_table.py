@@ -0,0 +1,42 @@
+import pickle
+
+from custom_redis.server.bases import DataStore, command
+from custom_redis.server.data_types import StrStore, HashStore
+
+
+def test_command_table(server):
+    get = server.commands["get"]
+    assert (get.owner, get.arity, get.write) == (StrStore, 2, False)
+    assert server.commands["hset"].write
+    assert server.commands["keys"].owner is None
+    assert server.commands["keys"].info() == ["keys", 2, ["readonly"], 0, 0, 0]
+    # 方法名与指令名不同时按声明的指令名注册
+    assert "command" in server.commands and "command_" not in server.commands
+
+
+def test_dispatch(server):
+    assert server.dispatch("set", b"a", b"1")[0] == b"200"
+    assert server.dispatch("get", b"a", b"")[2] == b"1"
+    assert server.dispatch("hget", b"a", b"f")[1] == b"Type Not Format"
+    assert server.dispatch("nosuch", b"a", b"")[0] == b"404"
+    assert server.dispatch("type", b"a", b"")[2] == b"str"
+    count = server.dispatch("command", b"count", b"")[2]
+    assert int(count) == len(server.commands)
+
+
+def test_install_rebuilds_table(server):
+    class CounterStore(DataStore):
+        data_type = int
+
+        @command(2, write=True)
+        def incr(self, k, v, instance):
+            self.data += 1
+            return str(self.data).encode("utf-8")
+
+    server.install(counter=CounterStore)
+    assert server.commands["incr"].owner is CounterStore
+    assert server.dispatch("incr", b"c", b"")[2] == b"1"
+    assert server.dispatch("incr", b"c", b"")[2] == b"2"
+    info = pickle.loads(server.dispatch("command", b"info", [b"incr"])[2])
+    assert info == [["incr", 2, ["write"], 1, 1, 1]]
+    assert HashStore in server.commands["hset"].handlers
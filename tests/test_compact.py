@@ -0,0 +1,94 @@
+import sys
+import pickle
+from collections import deque
+
+from custom_redis.server.compact import PackedList, PackedSet, PackedHash, \
+    IntSet, as_int64
+from custom_redis.server.data_types import ListStore, SetStore, HashStore
+from custom_redis.server.encoding import pack_values
+
+
+def test_as_int64():
+    assert as_int64(b"-12") == -12
+    for member in (b"012", b"+1", b"1.0", b"", b"a", b"%d" % 2 ** 63):
+        assert as_int64(member) is None
+
+
+def test_set_encodings(server):
+    server.dispatch("sadd", b"s", [b"3", b"1", b"2"])
+    data = server.datas[b"s"].data
+    assert isinstance(data, IntSet) and list(data) == [b"1", b"2", b"3"]
+    server.dispatch("srem", b"s", [b"2"])
+    assert server.dispatch("sismember", b"s", b"3")[2] == b"True"
+    server.dispatch("sadd", b"s", [b"x"])
+    data = server.datas[b"s"].data
+    assert isinstance(data, PackedSet) and data == {b"1", b"3", b"x"}
+    server.dispatch("sadd", b"s", [b"m%d" % i for i in range(200)])
+    assert isinstance(server.datas[b"s"].data, set)
+    assert server.dispatch("scard", b"s", b"")[2] == b"203"
+
+    server.dispatch("sadd", b"ints", list(range(600)))
+    assert isinstance(server.datas[b"ints"].data, set)
+    server.dispatch("sadd", b"long", [b"x" * 65])
+    assert isinstance(server.datas[b"long"].data, set)
+
+
+def test_hash_encodings(server):
+    server.dispatch("hmset", b"h", pickle.dumps({"a": b"1", "b": b"2"}))
+    assert isinstance(server.datas[b"h"].data, PackedHash)
+    assert server.dispatch("hset", b"h", {"a": b"9", "c": b"3"})[2] == b"1"
+    assert server.dispatch("hincrby", b"h", pickle.dumps({"n": 5}))[2] == b"5"
+    assert server.dispatch("hget", b"h", b"a")[2] == b"9"
+    assert server.dispatch("hget", b"h", b"missing")[0] == b"502"
+    assert pickle.loads(server.dispatch("hgetall", b"h", b"")[2]) == \
+        {"a": b"9", "b": b"2", "c": b"3", "n": 5}
+    assert pickle.loads(server.dispatch(
+        "hmget", b"h", pickle.dumps(["a", "x"]))[2]) == {"a": b"9"}
+    server.dispatch("hset", b"h", {"big": b"v" * 100})
+    data = server.datas[b"h"].data
+    assert isinstance(data, dict) and data["n"] == 5
+
+
+def test_list_encodings(server):
+    server.dispatch("rpush", b"l", [b"a", b"b", b"c"])
+    server.dispatch("lpush", b"l", [b"y", b"x"])
+    data = server.datas[b"l"].data
+    assert isinstance(data, PackedList)
+    assert list(data) == [b"x", b"y", b"a", b"b", b"c"]
+    assert server.dispatch("lpop", b"l", b"")[2] == b"x"
+    assert server.dispatch("rpop", b"l", b"")[2] == b"c"
+    assert server.dispatch("lindex", b"l", -1)[2] == b"b"
+    assert pickle.loads(server.dispatch("lrange", b"l", [-2, -1])[2]) == \
+        [b"a", b"b"]
+    server.dispatch("lrem", b"l", [0, b"a"])
+    assert list(server.datas[b"l"].data) == [b"y", b"b"]
+    server.dispatch("rpush", b"l", [b"%d" % i for i in range(200)])
+    data = server.datas[b"l"].data
+    assert isinstance(data, deque) and len(data) == 202
+
+
+def test_compact_snapshot_encodings():
+    store = HashStore(None, PackedHash({"a": b"1", "b": 2}))
+    assert store.dumps() is store.data.blob
+    restored = HashStore.from_dump(None, store.dumps())
+    assert isinstance(restored.data, PackedHash) and restored.data == store.data
+    # 保存时使用dict的大hash加载时也使用相同的编码
+    restored = HashStore.from_dump(None, HashStore(None, {"a": b"1"}).dumps())
+    assert isinstance(restored.data, PackedHash)
+
+    ints = SetStore(None, IntSet([b"5", b"-1"]))
+    restored = SetStore.from_dump(None, ints.dumps())
+    assert isinstance(restored.data, IntSet) and restored.data == {b"5", b"-1"}
+    legacy = SetStore.from_dump(None, pack_values([b"a", b"b"]))
+    assert isinstance(legacy.data, PackedSet)
+    big = ListStore.from_dump(None, pack_values([b"x"] * 1000))
+    assert isinstance(big.data, deque)
+
+
+def test_compact_is_smaller():
+    mapping = {"name": b"alice", "age": b"30", "city": b"paris"}
+    packed = PackedHash(mapping)
+    full = sys.getsizeof(mapping) + sum(
+        sys.getsizeof(x) for item in mapping.items() for x in item)
+    assert sys.getsizeof(packed) * 3 < full
+    assert HashStore(None, packed).memory_usage() == sys.getsizeof(packed)
@@ -0,0 +1,34 @@
+import socket
+
+from custom_redis.server.connection import Connection
+from custom_redis.server.protocols import BinaryProtocol
+
+
+def test_partial_writes_resume_in_order():
+    a, b = socket.socketpair()
+    a.setblocking(False)
+    b.setblocking(False)
+    conn = Connection(a, ("127.0.0.1", 0), BinaryProtocol())
+    replies = [bytes([i % 256]) * 300000 for i in range(5)]
+    for reply in replies:
+        conn.queue(reply)
+    received = bytearray()
+    while not conn.write():
+        assert 0 < conn.pending < sum(map(len, replies))
+        received += b.recv(1 << 20)
+    assert conn.pending == 0 and not conn.replies
+    while len(received) < sum(map(len, replies)):
+        received += b.recv(1 << 20)
+    assert bytes(received) == b"".join(replies)
+    a.close()
+    b.close()
+
+
+def test_output_limits():
+    conn = Connection(None, ("127.0.0.1", 0), BinaryProtocol())
+    conn.queue(b"x" * 10)
+    assert conn.over_limit(5, 0, 0)
+    assert not conn.over_limit(0, 5, 60)
+    assert conn.soft_since is not None
+    assert conn.over_limit(0, 5, -1)
+    assert not conn.over_limit(0, 0, 0)
@@ -0,0 +1,91 @@
+import pickle
+
+
+def test_reads_do_not_create_keys(server):
+    assert server.dispatch("llen", b"l", b"")[2] == b"0"
+    assert server.dispatch("get", b"s", b"")[2] == b""
+    assert server.dispatch("lpop", b"l", b"")[0] == b"502"
+    assert server.datas == {}
+
+
+def test_empty_collections_removed_on_mutation(server):
+    server.dispatch("rpush", b"l", [b"1"])
+    server.dispatch("pexpire", b"l", b"10000")
+    assert server.dispatch("lpop", b"l", b"")[2] == b"1"
+    assert b"l" not in server.datas and b"l" not in server.expire_keys
+    server.dispatch("sadd", b"s", [b"a"])
+    server.dispatch("srem", b"s", pickle.dumps([b"a"]))
+    server.dispatch("zadd", b"z", pickle.dumps({1: b"m"}))
+    server.dispatch("zpop", b"z", b"")
+    assert server.datas == {}
+
+
+def test_empty_string_kept(server):
+    server.dispatch("set", b"a", b"")
+    assert b"a" in server.datas
+    assert server.dispatch("type", b"a", b"")[2] == b"str"
+
+
+def test_list_commands(server):
+    from custom_redis.server.resp import RespProtocol
+    resp = RespProtocol()
+
+    def call(*argv):
+        return resp.execute(server, [arg.encode() for arg in argv])
+
+    assert call("rpush", "l", "a", "b", "c") == b":3\r\n"
+    assert call("lpush", "l", "y", "x") == b":5\r\n"
+    assert call("lrange", "l", "0", "-1") == \
+        b"*5\r\n$1\r\nx\r\n$1\r\ny\r\n$1\r\na\r\n$1\r\nb\r\n$1\r\nc\r\n"
+    assert call("lrange", "l", "-2", "100") == b"*2\r\n$1\r\nb\r\n$1\r\nc\r\n"
+    assert call("lrange", "l", "3", "1") == b"*0\r\n"
+    assert call("lindex", "l", "-1") == b"$1\r\nc\r\n"
+    assert call("lindex", "l", "5") == b"$-1\r\n"
+    assert call("rpop", "l") == b"$1\r\nc\r\n"
+    assert call("ltrim", "l", "1", "-2") == b"+OK\r\n"
+    assert list(server.datas[b"l"].data) == [b"y", b"a"]
+
+    call("rpush", "r", "a", "b", "a", "c", "a")
+    assert call("lrem", "r", "-2", "a") == b":2\r\n"
+    assert list(server.datas[b"r"].data) == [b"a", b"b", b"c"]
+    assert call("lrem", "r", "0", "b") == b":1\r\n"
+    assert call("ltrim", "r", "5", "10") == b"+OK\r\n"
+    assert b"r" not in server.datas
+
+
+def test_batch_commands(server):
+    from custom_redis.server.resp import RespProtocol
+    resp = RespProtocol()
+
+    def call(*argv):
+        return resp.execute(server, [arg.encode() for arg in argv])
+
+    assert call("mset", "a", "1", "b", "2") == b"+OK\r\n"
+    assert call("mset", "a", "1", "b").startswith(b"-ERR wrong number")
+    call("sadd", "s", "x", "y", "x")
+    assert server.datas[b"s"].data == {b"x", b"y"}
+    assert call("mget", "a", "s", "none", "b") == \
+        b"*4\r\n$1\r\n1\r\n$-1\r\n$-1\r\n$1\r\n2\r\n"
+    assert call("zadd", "z", "1", "m1", "2", "m2", "1", "m1") == b":2\r\n"
+    assert call("zadd", "z", "3", "m1", "3", "m3") == b":1\r\n"
+    assert server.datas[b"z"].data.items() == [(b"m2", 2), (b"m1", 3),
+                                               (b"m3", 3)]
+    server.dispatch("hset", b"h", {"f": b"1", "g": b"2"})
+    assert pickle.loads(server.dispatch("hmget", b"h", ["g", "x"])[2]) == \
+        {"g": b"2"}
+    server.dispatch("pexpire", b"b", b"-1")
+    assert call("del", "a", "b", "s", "none") == b":2\r\n"
+    assert list(server.datas) == [b"z", b"h"]
+
+
+def test_batch_zadd_merges_large_batches(server):
+    members = [b"m%d" % i for i in range(1000)]
+    server.dispatch("zadd", b"z", [b"1", members[0]])
+    batch = [item for i, member in enumerate(members)
+             for item in (i % 7, member)]
+    assert server.dispatch("zadd", b"z", batch)[2] == b"999"
+    zset = server.datas[b"z"].data
+    assert zset.items() == sorted(
+        ((m, i % 7) for i, m in enumerate(members)),
+        key=lambda item: (item[1], item[0]))
+    assert [zset.zrank(m) for m, _ in zset.items()] == list(range(1000))
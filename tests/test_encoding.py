@@ -0,0 +1,33 @@
+import pickle
+
+from custom_redis.server.encoding import pack_values, unpack_values, \
+    pack_scores, unpack_scores, pack_varint, unpack_varint
+from custom_redis.server.data_types import ZsetStore, HashStore
+
+
+def test_values_round_trip():
+    values = [b"a", "b", 3, -5, 2 ** 70, None, b"", (1, 2)]
+    data = pack_values(values) + b"tail"
+    assert unpack_values(data) == (values, len(data) - 4)
+    assert unpack_varint(pack_varint(300), 0) == (300, 2)
+
+
+def test_scores_round_trip():
+    for scores in ([], [1], [-3, 0, 5, 5, 2 ** 40], [1.5, 2.0], [1, 2.5]):
+        data = pack_scores(scores)
+        assert unpack_scores(data) == (scores, len(data))
+    # 整数分数保存差值，比pickle紧凑得多
+    scores = list(range(0, 30000, 3))
+    assert len(pack_scores(scores)) < len(pickle.dumps(scores)) / 2
+
+
+def test_store_encodings():
+    zset = ZsetStore(None)
+    for i in range(100):
+        zset.data.zadd(b"m%d" % i, 100 - i)
+    restored = ZsetStore.from_dump(None, zset.dumps())
+    assert restored.data.items() == zset.data.items()
+    assert restored.data.zscore(b"m1") == 99
+    assert len(zset.dumps()) < len(pickle.dumps(zset.data.items())) / 1.5
+    hash_ = HashStore(None, {"f": b"1", "n": 2})
+    assert HashStore.from_dump(None, hash_.dumps()).data == hash_.data
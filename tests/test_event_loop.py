@@ -0,0 +1,39 @@
+import time
+import socket
+
+from custom_redis.server.event_loop import EventLoop, EVENT_READ, \
+    EVENT_WRITE
+
+
+def test_timers_run_in_deadline_order():
+    loop = EventLoop()
+    fired = []
+    loop.call_later(0.02, fired.append, 2)
+    loop.call_later(0.01, fired.append, 1)
+    loop.call_later(0.01, fired.append, 3).cancel()
+    start = time.monotonic()
+    while len(fired) < 2:
+        loop.run_once()
+    assert fired == [1, 2]
+    assert time.monotonic() - start < 1
+    assert loop.next_timeout() is None
+    loop.close()
+
+
+def test_write_interest_and_wakeup():
+    loop = EventLoop()
+    a, b = socket.socketpair()
+    events = []
+    loop.register(a, lambda sock, mask: events.append(mask))
+    loop.set_writable(a, True)
+    assert loop.selector.get_key(a).events == EVENT_READ | EVENT_WRITE
+    loop.run_once()
+    assert events == [EVENT_WRITE]
+    loop.set_writable(a, False)
+    loop.wakeup()
+    loop.run_once()
+    assert events == [EVENT_WRITE]
+    loop.unregister(a)
+    loop.close()
+    a.close()
+    b.close()
@@ -0,0 +1,82 @@
+import sys
+import pickle
+
+import pytest
+
+from custom_redis.server import RedisServer
+from custom_redis.server.resp import RespProtocol
+
+
+def make_server(monkeypatch, policy, maxmemory="200kb"):
+    monkeypatch.setattr(sys, "argv", [
+        "redis_server", "-ll", "ERROR", "--maxmemory", maxmemory,
+        "--maxmemory-policy", policy])
+    return RedisServer()
+
+
+def recount(server):
+    datas = server.datas
+    return sum(len(key) + 120 + store.memory_usage()
+               for key, store in datas.items())
+
+
+@pytest.fixture
+def lru_server(monkeypatch):
+    server = make_server(monkeypatch, "allkeys-lru")
+    yield server
+    server.loop.close()
+
+
+def test_memory_accounting(lru_server):
+    server = lru_server
+    server.dispatch("rpush", b"l", [b"x" * 100] * 10)
+    server.dispatch("sadd", b"s", [b"m%d" % i for i in range(50)])
+    server.dispatch("hmset", b"h", pickle.dumps({"f": b"v" * 500}))
+    server.dispatch("zadd", b"z", [1, b"a", 2, b"b"])
+    server.dispatch("set", b"k", b"v" * 1000)
+    server.dispatch("rpop", b"l", b"")
+    server.dispatch("srem", b"s", [b"m1"])
+    server.dispatch("delete", b"h", b"")
+    assert server.datas.used_memory == recount(server)
+    server.dispatch("flushall", b"", b"")
+    assert server.datas.used_memory == 0
+
+
+@pytest.mark.parametrize("policy", ["allkeys-lru", "allkeys-lfu"])
+def test_allkeys_keeps_hot_keys(monkeypatch, policy):
+    server = make_server(monkeypatch, policy)
+    for i in range(2000):
+        server.dispatch("set", b"key:%d" % i, b"v" * 100)
+        # 一直访问的key不会被淘汰
+        server.dispatch("get", b"hot", b"")
+        if i == 0:
+            server.dispatch("set", b"hot", b"v")
+    assert server.evicted_keys > 0
+    assert server.datas.used_memory <= server.maxmemory + 1024
+    assert b"hot" in server.datas
+    assert b"key:1999" in server.datas
+    assert server.datas.used_memory == recount(server)
+    server.loop.close()
+
+
+def test_volatile_ttl_and_noeviction(monkeypatch):
+    server = make_server(monkeypatch, "volatile-ttl", "20kb")
+    server.dispatch("set", b"keep", b"v" * 5000)
+    for i in range(20):
+        server.dispatch("set", b"tmp:%d" % i, b"v" * 1000)
+        server.dispatch("expire", b"tmp:%d" % i, b"%d" % (100 + i))
+    assert b"keep" in server.datas and b"tmp:0" not in server.datas
+    assert b"tmp:19" in server.datas
+    server.loop.close()
+
+    server = make_server(monkeypatch, "noeviction", "20kb")
+    for i in range(30):
+        code, info, _ = server.dispatch("set", b"k%d" % i, b"v" * 1000)
+    assert code == b"503" and info.startswith(b"OOM")
+    assert server.evicted_keys == 0
+    # 删除key的指令不受限制
+    assert server.dispatch("delete", b"k0", b"")[0] == b"200"
+    resp = RespProtocol()
+    server.dispatch("set", b"big", b"v" * 20000)
+    assert resp.execute(server, [b"SET", b"a", b"1"]).startswith(b"-OOM ")
+    server.loop.close()
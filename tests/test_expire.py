@@ -0,0 +1,75 @@
+import time
+import pickle
+
+from custom_redis.server.expire import Expires, now_ms
+from custom_redis.server.resp import RespProtocol
+
+
+def test_pop_expired_skips_stale_entries():
+    expires = Expires()
+    now = now_ms()
+    expires[b"a"] = now - 10
+    expires[b"b"] = now - 5
+    expires[b"a"] = now + 10000
+    expires[b"c"] = now - 1
+    del expires[b"c"]
+    assert list(expires.pop_expired(now)) == [b"b"]
+    assert list(expires) == [b"a"]
+
+
+def test_lazy_expire(server):
+    server.dispatch("set", b"a", b"1")
+    server.dispatch("pexpire", b"a", b"20")
+    assert 0 < int(server.dispatch("pttl", b"a", b"")[2]) <= 20
+    assert pickle.loads(server.dispatch("keys", b"*", b"")[2]) == [b"a"]
+    time.sleep(0.03)
+    assert pickle.loads(server.dispatch("keys", b"*", b"")[2]) == []
+    assert server.dispatch("get", b"a", b"")[2] == b""
+    assert b"a" not in server.expire_keys
+
+
+def test_active_expire(server):
+    for i in range(100):
+        server.dispatch("set", b"%d" % i, b"1")
+        server.dispatch("pexpireat", b"%d" % i, now_ms() - 1)
+    server.dispatch("set", b"keep", b"1")
+    server.active_expire()
+    assert list(server.datas) == [b"keep"]
+    assert not server.expire_keys
+
+
+def test_resp_set_px_and_ttl(server):
+    protocol = RespProtocol()
+    assert protocol.execute(server, [b"SET", b"a", b"1", b"PX", b"5000"]) \
+        == b"+OK\r\n"
+    assert protocol.execute(server, [b"TTL", b"a"]) == b":5\r\n"
+    assert protocol.execute(server, [b"SET", b"a", b"1", b"EX", b"0"]) == \
+        b"-ERR invalid expire time in 'set' command\r\n"
+    # SET不带过期参数时清除过期时间
+    protocol.execute(server, [b"SET", b"a", b"2"])
+    assert protocol.execute(server, [b"PTTL", b"a"]) == b":-1\r\n"
+    assert protocol.execute(server, [b"PTTL", b"b"]) == b":-2\r\n"
+
+
+def test_timers_do_not_multiply(server):
+    # 定时删除和定时任务各自只重新调度自己
+    assert len(server.loop.timers) == 2
+    for _ in range(5):
+        server.loop.run_once()
+        assert len(server.loop.timers) == 2
+
+
+def test_resp_expired_keys(server):
+    protocol = RespProtocol()
+    for cmd in ([b"GET", b"k"], [b"TTL", b"k"], [b"TYPE", b"k"],
+                [b"EXPIRE", b"k", b"10"]):
+        protocol.execute(server, [b"SET", b"k", b"v", b"PX", b"1"])
+        time.sleep(0.005)
+        reply = protocol.execute(server, cmd)
+        assert reply == {b"GET": b"$-1\r\n", b"TTL": b":-2\r\n",
+                         b"TYPE": b"+none\r\n", b"EXPIRE": b":0\r\n"}[cmd[0]]
+        assert b"k" not in server.datas
+    # 过期时间已过时直接删除key
+    protocol.execute(server, [b"SET", b"k", b"v"])
+    assert protocol.execute(server, [b"EXPIRE", b"k", b"-1"]) == b":1\r\n"
+    assert protocol.execute(server, [b"GET", b"k"]) == b"$-1\r\n"
@@ -0,0 +1,157 @@
+import time
+import pickle
+
+import pytest
+
+from custom_redis.server import RedisServer
+from custom_redis.server.snapshot import SnapshotError
+
+
+def wait_child(server):
+    for _ in range(500):
+        server.check_child()
+        if not server.child_pid:
+            return
+        time.sleep(0.01)
+
+
+def test_bgsave_snapshot_is_point_in_time(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server.dispatch("set", b"a", b"1")
+    server.dispatch("rpush", b"l", [b"x"])
+    server.dispatch("pexpire", b"l", b"100000")
+    assert server.dirty == 3
+    assert server.bgsave()
+    assert not server.bgsave()
+    # fork之后的修改不会出现在快照中
+    server.dispatch("set", b"b", b"2")
+    wait_child(server)
+    assert server.lastbgsave_ok and server.dirty == 1
+    assert list(tmp_path.iterdir()) == [tmp_path / server.dbfilename]
+
+    restored = RedisServer()
+    restored.setup()
+    assert sorted(restored.datas) == [b"a", b"l"]
+    assert b"l" in restored.expire_keys
+    restored.loop.close()
+
+
+def test_save_rules(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert server.parse_save_params(["3600 1", "60 10000"]) == \
+        [(3600, 1), (60, 10000)]
+    assert server.parse_save_params([""]) == []
+    server.save_params = [(0, 2)]
+    server.dispatch("set", b"a", b"1")
+    server.cron()
+    assert server.child_pid is None
+    server.dispatch("set", b"a", b"2")
+    server.cron()
+    assert server.child_pid
+    wait_child(server)
+    assert server.dirty == 0
+
+
+def test_snapshot_values_with_old_separators(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    value = b"a1qazxsw23edcbfdfsafafdsfsfdsfafdffc"
+    server.dispatch("set", value, value)
+    server.dispatch("sadd", b"s", [value])
+    server.dispatch("pexpire", b"s", b"100000")
+    # 比读缓冲区大的值
+    server.dispatch("set", b"big", b"x" * (3 * 1024 * 1024))
+    server.persist()
+
+    restored = RedisServer()
+    restored.setup()
+    assert restored.datas[value].data == value
+    assert restored.datas[b"s"].data == {value}
+    assert restored.expire_keys[b"s"] == server.expire_keys[b"s"]
+    assert len(restored.datas[b"big"].data) == 3 * 1024 * 1024
+    assert restored.load_stats["keys"] == 3
+    restored.loop.close()
+
+
+def test_load_legacy_snapshot(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open(server.dbfilename, "wb") as stream:
+        stream.write(b"a1qazxsw23edc-11qazxsw23edc")
+        stream.write(pickle.dumps(b"1") + b"fdfsafafdsfsfdsfafdff")
+        stream.write(b"l1qazxsw23edc99999999991qazxsw23edc")
+        stream.write(pickle.dumps([b"x"]) + b"fdfsafafdsfsfdsfafdff")
+    server.setup()
+    assert server.datas[b"a"].data == b"1"
+    assert list(server.datas[b"l"].data) == [b"x"]
+    assert server.expire_keys[b"l"] == 9999999999000
+
+
+def test_corrupted_block_detected(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server.dispatch("set", b"a", b"1" * 100)
+    server.persist()
+    with open(server.dbfilename, "r+b") as stream:
+        stream.seek(-20, 2)
+        byte = stream.read(1)
+        stream.seek(-20, 2)
+        stream.write(bytes([byte[0] ^ 0xff]))
+    with pytest.raises(SnapshotError):
+        RedisServer().setup()
+
+
+def test_incremental_snapshot(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server.args["snapshot_deltas"] = 2
+    server.dirty_keys = set()
+    for i in range(1000):
+        server.dispatch("set", b"cold%d" % i, b"x" * 100)
+    server.dispatch("set", b"a", b"1")
+    server.dispatch("hset", b"h", pickle.dumps({b"f": b"v"}))
+    server.dispatch("set", b"tmp", b"1")
+    server.persist()
+    base_size = server.snapshot_size
+    assert not server.dirty_keys
+
+    server.dispatch("set", b"a", b"2")
+    server.dispatch("delete", b"tmp", b"")
+    server.dispatch("pexpire", b"h", b"100000")
+    assert server.dirty_keys == {b"a", b"tmp", b"h"}
+    assert server.bgsave()
+    wait_child(server)
+    assert server.snapshot_segments == 1
+    # 增量段只包含修改过的key
+    assert server.snapshot_size - base_size < 200
+
+    # 不完整的增量段被截掉
+    with open(server.dbfilename, "ab") as stream:
+        stream.write(b"\x00CRDB\x02\x00")
+    restored = RedisServer()
+    restored.args["snapshot_deltas"] = 2
+    restored.setup()
+    assert restored.datas[b"a"].data == b"2"
+    assert b"tmp" not in restored.datas
+    assert restored.expire_keys[b"h"] == server.expire_keys[b"h"]
+    assert len(restored.datas) == 1002
+    assert restored.snapshot_size == server.snapshot_size
+    assert restored.snapshot_segments == 1
+    restored.loop.close()
+
+    server.dispatch("set", b"a", b"3")
+    server.bgsave()
+    wait_child(server)
+    assert server.snapshot_segments == 2
+    # 增量段达到上限后合并成完整的快照
+    server.dispatch("set", b"a", b"4")
+    server.bgsave()
+    wait_child(server)
+    assert server.snapshot_segments == 0
+    assert server.snapshot_size == server.snapshot_base_size
+    # 清空数据后保存完整的快照
+    server.dispatch("flushall", b"", b"")
+    server.dispatch("set", b"b", b"1")
+    server.bgsave()
+    wait_child(server)
+    assert server.snapshot_size == server.snapshot_base_size < base_size
+    restored = RedisServer()
+    restored.setup()
+    assert list(restored.datas) == [b"b"]
+    restored.loop.close()
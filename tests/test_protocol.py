@@ -0,0 +1,136 @@
+import pickle
+import socket
+
+from custom_redis.protocol import HELLO, pack_request, pack_response, \
+    unpack_request, RESPONSE_HEADER, unpack_response_header
+from custom_redis.server.connection import Connection
+from custom_redis.server.protocols import LegacyProtocol, BinaryProtocol, \
+    negotiate, partial_hello
+
+
+def test_binary_request_round_trip_with_separators():
+    val = b"a<->b#-*-#c\r\n\r\n"
+    frame = pack_request(b"set", b"k<->", val)
+    protocol = BinaryProtocol()
+    assert protocol.feed(frame[:5]) == []
+    assert protocol.feed(frame[5:] + frame) == [
+        ("set", b"k<->", val), ("set", b"k<->", val)]
+
+
+def test_unpack_request_incomplete():
+    frame = pack_request(b"get", b"key", b"")
+    assert unpack_request(frame[:-1]) == (None, 0)
+    assert unpack_request(frame) == ((b"get", b"key", b""), len(frame))
+
+
+def test_binary_response():
+    data = BinaryProtocol().encode((b"200", b"success", b"#-*-#"))
+    assert data == pack_response(200, b"success", b"#-*-#")
+    code, info_len, data_len = unpack_response_header(
+        data[:RESPONSE_HEADER.size])
+    assert (code, info_len, data_len) == (200, 7, 5)
+
+
+def test_legacy_escaping_round_trip():
+    protocol = LegacyProtocol()
+    request = b"set#-*-#k<->1qaxsw234fds3gbhfvhtedfvfg#-*-#1"
+    assert protocol.feed(request) == [("set", b"k", b"<->")]
+    assert protocol.keep == b"1"
+    assert protocol.encode((b"200", b"success", b"#-*-#")) == \
+        b"200#-*-#success#-*-#jp0n988n80434nlj3pdf0909mn\r\n\r\n"
+
+
+def test_negotiate():
+    assert negotiate(b"get#-*-#a<->#-*-#1") is None
+    protocol, greeting, rest = negotiate(HELLO + b"rest")
+    assert isinstance(protocol, BinaryProtocol) and greeting == HELLO and rest == b"rest"
+
+
+def test_negotiate_split_hello(server):
+    assert partial_hello(HELLO[:1]) and not partial_hello(HELLO)
+    assert not partial_hello(b"\x00get")
+    sock, peer = socket.socketpair()
+    sock.setblocking(False)
+    conn = Connection(sock, ("peer", 0), LegacyProtocol())
+    server.connections[sock] = conn
+    # 握手报文分两次到达时仍然切换到二进制协议
+    peer.sendall(HELLO[:2])
+    server.recv(conn)
+    assert conn.protocol.negotiable and not conn.replies
+    peer.sendall(HELLO[2:] + pack_request(b"set", b"a", b"1"))
+    server.recv(conn)
+    assert isinstance(conn.protocol, BinaryProtocol)
+    assert list(conn.replies) == [
+        HELLO, pack_response(200, b"success", b"")]
+    assert server.datas[b"a"].data == b"1"
+    sock.close()
+    peer.close()
+
+
+def test_resp_parse_pipelined_and_partial():
+    from custom_redis.server.resp import RespProtocol
+    protocol = RespProtocol()
+    data = b"*3\r\n$3\r\nSET\r\n$1\r\na\r\n$4\r\nb\r\nc\r\nPING\r\n*1\r\n$4\r\nPI"
+    assert protocol.feed(data) == [[b"SET", b"a", b"b\r\nc"], [b"PING"]]
+    assert protocol.feed(b"NG\r\n") == [[b"PING"]]
+    assert protocol.buffer == bytearray()
+
+
+def test_resp_encode():
+    from custom_redis.server.resp import encode, Status, Error
+    assert encode(None) == b"$-1\r\n"
+    assert encode(Status(b"OK")) == b"+OK\r\n"
+    assert encode(Error(b"ERR x")) == b"-ERR x\r\n"
+    assert encode([1, b"a", "b", []]) == b"*4\r\n:1\r\n$1\r\na\r\n$1\r\nb\r\n*0\r\n"
+
+
+def test_legacy_pipelined_and_split_requests():
+    protocol = LegacyProtocol()
+    assert protocol.feed(b"set#-*-#a<->1#-*-#1rpush#-*-#q<->x#-*-#1rpu") == [
+        ("set", b"a", b"1"), ("rpush", b"q", b"x")]
+    assert protocol.feed(b"sh#-*-#q") == []
+    assert protocol.feed(b"<->y#-*-#0") == [("rpush", b"q", b"y")]
+    assert protocol.keep == b"0"
+    assert protocol.buffer == bytearray()
+
+
+def test_legacy_keep_flag_split():
+    protocol = LegacyProtocol()
+    # 在第二个分隔符处拆开时等待keep-alive标志
+    assert protocol.feed(b"get#-*-#a<->#-*-#") == []
+    assert protocol.feed(b"1") == [("get", b"a", b"")]
+    assert protocol.keep == b"1"
+    assert protocol.feed(b"get#-*-#b<->#-*-#") == []
+    # 对端关闭写端时视为keep-alive为空的请求
+    assert protocol.feed_eof() == [("get", b"b", b"")]
+    assert protocol.keep == b"" and protocol.buffer == bytearray()
+
+
+def test_legacy_rpush_raw_value(server):
+    # 旧版本客户端直接发送单个原始值
+    protocol = LegacyProtocol()
+    for request in protocol.feed(
+            b"rpush#-*-#q<->x#-*-#1lpush#-*-#q<->\x80raw#-*-#1"):
+        assert protocol.execute(server, request).startswith(b"200#-*-#")
+    assert list(server.datas[b"q"].data) == [b"\x80raw", b"x"]
+
+
+def test_legacy_sadd_raw_value(server):
+    protocol = LegacyProtocol()
+    for request in protocol.feed(b"sadd#-*-#s<->m#-*-#1sadd#-*-#s<->n#-*-#1"):
+        assert protocol.execute(server, request) == \
+            b"200#-*-#success#-*-#1\r\n\r\n"
+    assert set(server.datas[b"s"].data) == {b"m", b"n"}
+
+
+def test_multi_value_commands_explicit(server):
+    # 单值指令不会拆分pickle后的列表，多值请求使用MRPUSH、MSADD
+    value = pickle.dumps([b"a", b"b"])
+    assert server.dispatch("sadd", b"s", value)[2] == b"1"
+    assert server.dispatch("msadd", b"s", value)[2] == b"2"
+    assert set(server.datas[b"s"].data) == {value, b"a", b"b"}
+    assert server.dispatch("rpush", b"l", value)[2] == b"1"
+    assert server.dispatch("mrpush", b"l", value)[2] == b"3"
+    assert server.dispatch("mlpush", b"l", pickle.dumps([b"y", b"x"]))[2] \
+        == b"5"
+    assert list(server.datas[b"l"].data) == [b"x", b"y", value, b"a", b"b"]
@@ -0,0 +1,124 @@
+import pickle
+
+from custom_redis.server.keyspace import Keyspace
+from custom_redis.server.resp import RespProtocol
+
+
+def scan_all(scan, count=10):
+    cursor, found = None, []
+    while cursor != 0:
+        cursor, items = scan(cursor or 0, count)
+        found.extend(items)
+    return found
+
+
+def test_keyspace_index_reuses_holes():
+    keyspace = Keyspace()
+    for i in range(100):
+        keyspace[b"k%d" % i] = i
+    # 第一次SCAN时才建立索引
+    assert keyspace.index is None
+    assert keyspace.scan(0, 10)[0] == 10
+    for i in range(0, 100, 2):
+        del keyspace[b"k%d" % i]
+    keyspace.pop(b"k99")
+    for i in range(10):
+        keyspace[b"new%d" % i] = i
+    # 末尾的空洞(k98, k99)被截掉，新key填入之前的空洞
+    assert len(keyspace.index.slots) == 98
+    assert sorted(scan_all(keyspace.scan)) == sorted(keyspace)
+    keyspace.clear()
+    assert keyspace.index is None
+    assert scan_all(keyspace.scan) == []
+
+
+def test_keys_present_during_scan_returned_once():
+    keyspace = Keyspace()
+    for i in range(1000):
+        keyspace[b"k%d" % i] = i
+    stable = set(b"k%d" % i for i in range(500))
+    cursor, found, i = None, [], 0
+    while cursor != 0:
+        cursor, keys = keyspace.scan(cursor or 0, 50)
+        found.extend(keys)
+        # 遍历期间删除后一半并新增key
+        keyspace.pop(b"k%d" % (999 - i), None)
+        keyspace[b"n%d" % i] = i
+        i += 1
+    assert stable <= set(found)
+    assert len(found) == len(set(found))
+
+
+def test_scan_commands(server):
+    for i in range(300):
+        server.dispatch("set", b"user:%d" % i, b"v")
+    server.dispatch("rpush", b"list", [b"a"])
+    keys = scan_all(lambda cursor, count: pickle.loads(server.dispatch(
+        "scan", b"%d" % cursor, pickle.dumps([b"user:1*", count, None]))[2]))
+    assert sorted(keys) == sorted(b"user:%d" % i for i in range(300)
+                                  if str(i).startswith("1"))
+    keys = scan_all(lambda cursor, count: pickle.loads(server.dispatch(
+        "scan", b"%d" % cursor, pickle.dumps([None, count, "list"]))[2]))
+    assert keys == [b"list"]
+
+    server.dispatch("sadd", b"s", [b"m%d" % i for i in range(500)])
+    members = scan_all(lambda cursor, count: pickle.loads(server.dispatch(
+        "sscan", b"s", pickle.dumps([cursor, None, count]))[2]))
+    assert sorted(members) == sorted(b"m%d" % i for i in range(500))
+
+    server.dispatch("zadd", b"z", [1, b"a", 2.5, b"b"])
+    assert pickle.loads(server.dispatch(
+        "zscan", b"z", pickle.dumps([0, None, None]))[2]) == \
+        (0, [(b"a", 1), (b"b", 2.5)])
+
+
+def test_member_scan_survives_writes(server):
+    server.dispatch("sadd", b"s", [b"m%d" % i for i in range(1000)])
+    cursor, found, i = None, [], 0
+    while cursor != 0:
+        cursor, members = pickle.loads(server.dispatch(
+            "sscan", b"s", pickle.dumps([cursor or 0, None, 100]))[2])
+        found.extend(members)
+        server.dispatch("srem", b"s", [b"m%d" % (999 - i)])
+        server.dispatch("sadd", b"s", [b"n%d" % i])
+        i += 1
+    assert set(b"m%d" % i for i in range(900)) <= set(found)
+    assert len(found) == len(set(found))
+
+
+def test_member_index_synced_only_after_adds(server):
+    server.dispatch("sadd", b"s", [b"m%d" % i for i in range(1000)])
+    server.dispatch("sscan", b"s", pickle.dumps([0, None, 10]))
+    index = server.datas[b"s"].scan_index
+    assert index is not None and not index.stale
+    # 删除成员不需要同步，已删除的成员由scan过滤
+    server.dispatch("srem", b"s", [b"m%d" % i for i in range(700)])
+    assert not index.stale
+    members = scan_all(lambda cursor, count: pickle.loads(server.dispatch(
+        "sscan", b"s", pickle.dumps([cursor, None, count]))[2]))
+    assert sorted(members) == sorted(b"m%d" % i for i in range(700, 1000))
+    server.dispatch("sadd", b"s", [b"n"])
+    assert index.stale
+    # 已删除的成员超过一半时同步会清理索引
+    server.dispatch("sscan", b"s", pickle.dumps([0, None, 10]))
+    assert len(index) == 301
+
+
+def test_resp_scan(server):
+    resp = RespProtocol()
+
+    def execute(*argv):
+        return resp.execute(server, [arg.encode() for arg in argv])
+
+    execute("HSET", "h", "f1", "1", "f2", "2")
+    execute("ZADD", "z", "1.5", "a")
+    assert execute("SCAN", "0", "MATCH", "h*", "COUNT", "100") == \
+        b"*2\r\n$1\r\n0\r\n*1\r\n$1\r\nh\r\n"
+    assert execute("SCAN", "0", "TYPE", "zset") == \
+        b"*2\r\n$1\r\n0\r\n*1\r\n$1\r\nz\r\n"
+    assert execute("HSCAN", "h", "0", "MATCH", "f1") == \
+        b"*2\r\n$1\r\n0\r\n*2\r\n$2\r\nf1\r\n$1\r\n1\r\n"
+    assert execute("ZSCAN", "z", "0") == \
+        b"*2\r\n$1\r\n0\r\n*2\r\n$1\r\na\r\n$3\r\n1.5\r\n"
+    assert execute("SSCAN", "missing", "0") == b"*2\r\n$1\r\n0\r\n*0\r\n"
+    assert execute("SCAN", "0", "COUNT").startswith(b"-ERR syntax error")
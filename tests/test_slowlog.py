@@ -0,0 +1,78 @@
+import sys
+import pickle
+
+import pytest
+
+from custom_redis.server import RedisServer
+from custom_redis.server.resp import RespProtocol
+from custom_redis.server.slowlog import SlowLog, arg_size
+
+
+@pytest.fixture
+def slow_server(monkeypatch):
+    # 阈值为0时记录所有指令
+    monkeypatch.setattr(sys, "argv", [
+        "redis_server", "-ll", "ERROR", "--slowlog-log-slower-than", "0",
+        "--slowlog-max-len", "3"])
+    server = RedisServer()
+    yield server
+    server.loop.close()
+
+
+def test_slowlog_ring_buffer():
+    slowlog = SlowLog(0, max_len=2)
+    for i in range(3):
+        slowlog.record("get", b"k%d" % i, b"", i)
+    assert len(slowlog) == 2
+    assert [entry[0] for entry in slowlog.get()] == [2, 1]
+    assert slowlog.get(1)[0][4] == b"k2"
+    slowlog.reset()
+    slowlog.record("get", b"k", b"", 1)
+    assert slowlog.get()[0][0] == 3
+    assert arg_size({"a": b"12", "b": [b"1", 2]}) == 6
+    assert not SlowLog(-1).enabled
+
+
+def test_slowlog_commands(slow_server):
+    server = slow_server
+    server.dispatch("hmset", b"h", pickle.dumps({"f": b"v"}))
+    server.dispatch("keys", b"*", b"")
+    entries = pickle.loads(server.dispatch("slowlog", b"get", b"")[2])
+    # 通用指令和数据类型的指令都会记录，最新的在前
+    assert [entry[3] for entry in entries] == ["keys", "hmset"]
+    id_, timestamp, usec, cmd, key, size, client = entries[-1]
+    assert (cmd, key, client) == ("hmset", b"h", "") and size > 0
+    assert usec >= 0 and timestamp > 0
+    assert server.dispatch("slowlog", b"len", b"")[2] == b"3"
+    server.dispatch("slowlog", b"reset", b"")
+    assert len(server.slowlog) == 1
+
+
+def test_slowlog_threshold(server):
+    server.dispatch("set", b"k", b"v")
+    assert len(server.slowlog) == 0
+    server.slowlog.slower_than = 0
+    server.dispatch("get", b"k", b"")
+    assert server.slowlog.get()[0][3:5] == ("get", b"k")
+
+
+def test_resp_slowlog(slow_server):
+    resp = RespProtocol()
+    resp.execute(slow_server, [b"DEL", b"a", b"b"])
+    reply = resp.execute(slow_server, [b"SLOWLOG", b"GET", b"1"])
+    assert reply.startswith(b"*1\r\n*6\r\n")
+    assert b"$3\r\ndel\r\n$1\r\na\r\n" in reply
+    assert resp.execute(slow_server, [b"SLOWLOG", b"RESET"]) == b"+OK\r\n"
+    assert resp.execute(slow_server, [b"SLOWLOG", b"LEN"]) == b":1\r\n"
+
+
+def test_slowlog_times_every_call_histogram_sampled(slow_server):
+    server = slow_server
+    assert server.latency_sample == 16
+    for i in range(20):
+        server.dispatch("get", b"k%d" % i, b"")
+    # SLOWLOG检查每次调用，直方图仍然按--latency-sample抽样
+    assert [entry[4] for entry in server.slowlog.get()] == \
+        [b"k19", b"k18", b"k17"]
+    stats = server.commands["get"].stats
+    assert stats.calls == 20 and stats.total == sum(stats.counts) == 2
@@ -0,0 +1,79 @@
+import sys
+import random
+
+import pytest
+
+from custom_redis.client.utils import info_recv
+from custom_redis.server import RedisServer
+from custom_redis.server.resp import RespProtocol
+from custom_redis.server.stats import LatencyHistogram, bucket_index, \
+    bucket_bound, BUCKETS
+
+
+def test_histogram_buckets():
+    previous = -1
+    for usec in list(range(100)) + [1000, 12345, 10 ** 6, 10 ** 9]:
+        index = bucket_index(usec)
+        assert index >= previous
+        previous = index
+        # 桶的上界不小于值，相对误差不超过1/8
+        assert usec <= bucket_bound(index) <= usec + usec / 8.0 + 1
+    assert bucket_index(10 ** 15) == BUCKETS - 1
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    values = list(range(1, 10001))
+    random.shuffle(values)
+    for usec in values:
+        histogram.record(usec)
+    assert 5000 <= histogram.percentile(50) <= 5000 * 1.125
+    assert 9900 <= histogram.percentile(99) <= 9900 * 1.125
+    assert histogram.percentile(99.9) >= 9990
+    assert LatencyHistogram().percentile(50) == 0
+
+
+def test_info_and_resetstat(server):
+    server.dispatch("set", b"a", b"1")
+    server.dispatch("get", b"a", b"")
+    server.dispatch("get", b"missing", b"")
+    server.dispatch("hget", b"a", b"f")
+    server.dispatch("expire", b"a", b"100")
+    info = info_recv(server.dispatch("info", b"", b"")[2])
+    assert info["total_commands_processed"] == 6
+    assert info["keyspace_hits"] == 2 and info["keyspace_misses"] == 1
+    assert info["db0"] == {"keys": 1, "expires": 1}
+    assert "cmdstat_get" not in info
+
+    info = info_recv(server.dispatch(
+        "info", b"", [b"commandstats", b"latencystats"])[2])
+    assert info["cmdstat_get"]["calls"] == 2
+    # 类型不符合的指令计为失败
+    assert info["cmdstat_hget"]["failed_calls"] == 1
+    assert set(info["latency_percentiles_usec_set"]) == {"p50", "p99", "p99.9"}
+    assert "uptime_in_seconds" not in info
+
+    server.dispatch("config", b"resetstat", b"")
+    info = info_recv(server.dispatch("info", b"", [b"all"])[2])
+    assert info["total_commands_processed"] == 1
+    assert "cmdstat_get" not in info and "uptime_in_seconds" in info
+    assert server.dispatch("config", b"get", b"")[0] == b"503"
+
+
+def test_resp_info(server):
+    resp = RespProtocol()
+    reply = resp.execute(server, [b"INFO", b"stats"])
+    assert reply.startswith(b"$") and b"# Stats\r\n" in reply
+    assert resp.execute(server, [b"CONFIG", b"RESETSTAT"]) == b"+OK\r\n"
+    # key不存在时直接回复的指令也计入统计
+    assert resp.execute(server, [b"GET", b"missing"]) == b"$-1\r\n"
+    assert server.stats.keyspace_misses == 1
+    assert server.commands["get"].stats.calls == 1
+
+
+def test_latency_sample_must_be_positive(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", [
+        "redis_server", "-ll", "ERROR", "--latency-sample", "0"])
+    with pytest.raises(SystemExit):
+        RedisServer()
+    assert "--latency-sample" in capsys.readouterr().err
@@ -0,0 +1,57 @@
+import sys
+import logging
+
+from custom_redis.server import RedisServer
+from custom_redis.server.resp import RespProtocol
+from custom_redis.server.tracing import Tracer, describe
+
+
+class FakeConnection(object):
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.replies = []
+
+    def queue(self, reply):
+        self.replies.append(reply)
+
+    def __str__(self):
+        return "127.0.0.1:1234"
+
+
+def test_describe():
+    assert describe(("hset", b"h", {"f": b"vv"})) == ("hset", b"h", 3)
+    assert describe([b"SET", b"k", b"value"]) == ("set", b"k", 5)
+    assert describe([b"PING"]) == ("ping", b"", 0)
+
+
+def test_tracer_samples_requests(server, caplog):
+    tracer = Tracer(logging.getLogger("test_tracing"), 3)
+    conn = FakeConnection(RespProtocol())
+    requests = [[b"SET", b"k%d" % i, b"v"] for i in range(7)]
+    with caplog.at_level(logging.INFO, "test_tracing"):
+        tracer.execute(server, conn, requests)
+    assert conn.replies == [b"+OK\r\n"] * 7
+    traces = [record.getMessage() for record in caplog.records]
+    assert len(traces) == 2
+    assert traces[0].startswith("trace 127.0.0.1:1234 set b'k2' args=1B")
+
+
+def test_default_log_level(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["redis_server"])
+    server = RedisServer()
+    assert server.logger.level == logging.INFO
+    assert server.tracer.sample == 0
+    server.loop.close()
+    monkeypatch.setattr(sys, "argv", ["redis_server", "-ll", "DEBUG"])
+    server = RedisServer()
+    assert server.tracer.sample == 1
+    server.loop.close()
+    server.logger.setLevel(logging.ERROR)
+
+
+def test_missing_field_not_logged_as_error(server, caplog):
+    server.dispatch("hset", b"h", {"a": b"1"})
+    with caplog.at_level(logging.INFO):
+        assert server.dispatch("hget", b"h", b"f")[0] == b"502"
+    assert not caplog.records
@@ -0,0 +1,129 @@
+import pickle
+import random
+
+import pytest
+
+from custom_redis.server.errors import Empty
+from custom_redis.server.zset import SortedSet
+
+
+def check(zset, expected):
+    """与按(分数, 成员)排序的列表对比，并检查每个节点的跨度"""
+    items = sorted(expected.items(), key=lambda item: (item[1], item[0]))
+    assert zset.items() == items
+    assert zset.zcard == len(items)
+    zsl = zset.zsl
+    for i in range(zsl.level):
+        rank, x = 0, zsl.header
+        while x.forward[i] is not None:
+            rank += x.span[i]
+            x = x.forward[i]
+            assert items[rank - 1][0] == x.key[1]
+        assert rank + x.span[i] == len(items)
+    assert zsl.tail is (zsl.by_rank(len(items)) if items else None)
+
+
+def test_random_operations():
+    rand = random.Random(7)
+    zset = SortedSet()
+    expected = {}
+    for _ in range(3000):
+        member = b"m%d" % rand.randrange(300)
+        if rand.random() < 0.7:
+            # 大量成员分数相同
+            score = rand.randrange(10)
+            assert zset.zadd(member, score) == int(
+                expected.get(member) != score)
+            expected[member] = score
+        else:
+            assert zset.zrem(member) == int(
+                expected.pop(member, None) is not None)
+    check(zset, expected)
+    items = zset.items()
+    for rank, (member, score) in enumerate(items):
+        assert zset.zrank(member) == rank
+        assert zset.zrevrank(member) == len(items) - 1 - rank
+        assert zset.zscore(member) == score
+    assert zset.zrange(5, 9) == [m for m, _ in items[5: 10]]
+    assert zset.zrange(-3, -1, True) == items[-3:]
+    assert zset.zrevrange(0, 2) == [m for m, _ in items[::-1][:3]]
+    assert zset.zrangebyscore(3, 5) == [m for m, s in items if 3 <= s <= 5]
+    assert zset.zrevrangebyscore(5, 3) == \
+        [m for m, s in items if 3 <= s <= 5][::-1]
+    assert zset.zcount(3, 5) == len([s for _, s in items if 3 <= s <= 5])
+    assert zset.zcount(20, 30) == 0
+    assert zset.zrank(b"none") is None
+
+    restored = pickle.loads(pickle.dumps(zset))
+    check(restored, expected)
+    check(SortedSet.from_items(reversed(items)), expected)
+
+
+def test_zpop_ties_by_member():
+    zset = SortedSet()
+    for member in (b"c", b"a", b"b"):
+        zset.zadd(member, 1)
+    zset.zadd(b"z", 0)
+    assert [zset.zpop() for _ in range(3)] == [b"z", b"a", b"b"]
+    assert zset.zpop(True) == (b"c", 1)
+    with pytest.raises(Empty):
+        zset.zpop()
+    check(zset, {})
+
+
+def test_score_ranges():
+    zset = SortedSet()
+    for i in range(10):
+        zset.zadd(b"m%d" % i, i / 2)
+    assert zset.zrangebyscore(1, 2) == [b"m2", b"m3", b"m4"]
+    assert zset.zrangebyscore(1, 2, min_exclusive=True,
+                              max_exclusive=True) == [b"m3"]
+    assert zset.zrangebyscore(0, float("inf"), True, 3, 2) == \
+        [(b"m3", 1.5), (b"m4", 2.0)]
+    assert zset.zrangebyscore(0, 1, offset=5) == []
+    # 负数的offset与redis一样返回空列表
+    inf = float("inf")
+    assert zset.zrangebyscore(-inf, inf, offset=-1) == []
+    assert zset.zrangebyscore(2, 3, offset=-1) == []
+    assert zset.zrevrangebyscore(2, 1, offset=-1) == []
+    assert zset.zrevrangebyscore(4, 1, offset=1, count=2) == [b"m7", b"m6"]
+    assert zset.zcount(1, 2, min_exclusive=True) == 2
+    assert zset.zincrby(b"m0", 0.25) == 0.25
+    assert zset.zincrby(b"new", 3) == 3
+    assert zset.zpopmin(2) == [(b"m0", 0.25), (b"m1", 0.5)]
+    assert zset.zpopmax(2) == [(b"m9", 4.5), (b"m8", 4.0)]
+    with pytest.raises(ValueError):
+        zset.zadd(b"nan", float("nan"))
+
+
+def test_zset_commands(server):
+    from custom_redis.server.resp import RespProtocol
+    resp = RespProtocol()
+
+    def call(*argv):
+        return resp.execute(server, [arg.encode() for arg in argv])
+
+    assert call("zadd", "q", "1.5", "a") == b":1\r\n"
+    call("zadd", "q", "1", "b")
+    call("zadd", "q", "-inf", "c")
+    call("zadd", "q", "2", "d")
+    assert call("zscore", "q", "a") == b"$3\r\n1.5\r\n"
+    assert call("zscore", "q", "none") == b"$-1\r\n"
+    assert call("zrank", "q", "a") == b":2\r\n"
+    assert call("zrevrank", "q", "a") == b":1\r\n"
+    assert call("zcount", "q", "(1", "+inf") == b":2\r\n"
+    assert call("zrange", "q", "0", "-1") == \
+        b"*4\r\n$1\r\nc\r\n$1\r\nb\r\n$1\r\na\r\n$1\r\nd\r\n"
+    assert call("zrevrange", "q", "0", "0", "withscores") == \
+        b"*2\r\n$1\r\nd\r\n$1\r\n2\r\n"
+    assert call("zrangebyscore", "q", "-inf", "2", "LIMIT", "1", "2") == \
+        b"*2\r\n$1\r\nb\r\n$1\r\na\r\n"
+    assert call("zrevrangebyscore", "q", "+inf", "(1", "WITHSCORES") == \
+        b"*4\r\n$1\r\nd\r\n$1\r\n2\r\n$1\r\na\r\n$3\r\n1.5\r\n"
+    assert call("zrangebyscore", "q", "0", "1", "LIMIT").startswith(b"-ERR")
+    assert call("zincrby", "q", "0.5", "b") == b"$3\r\n1.5\r\n"
+    assert call("zpopmin", "q", "2") == \
+        b"*4\r\n$1\r\nc\r\n$4\r\n-inf\r\n$1\r\na\r\n$3\r\n1.5\r\n"
+    assert call("zpopmax", "q") == b"*2\r\n$1\r\nd\r\n$1\r\n2\r\n"
+    assert call("zrem", "q", "b", "x") == b":1\r\n"
+    assert b"q" not in server.datas